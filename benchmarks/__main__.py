@@ -0,0 +1,103 @@
+"""
+Benchmark suite for the ChocAn data managers.
+
+    python -m benchmarks generate --scale small
+    python -m benchmarks run --scale small --output results.json
+    python -m benchmarks compare baseline.json results.json
+
+`run` generates the dataset first if it does not exist yet. `compare` exits
+with status 1 if any benchmark got slower than the threshold allows.
+"""
+import argparse
+import os
+import sys
+from benchmarks.data_generator import SCALES
+from benchmarks.data_generator import DataGenerator
+from benchmarks.benchmark_suite import DEFAULT_THRESHOLD
+from benchmarks.benchmark_suite import BenchmarkSuite
+from benchmarks.benchmark_suite import compare_results
+
+BENCHMARK_GROUPS = ["accounting", "reports", "validation", "bulk_insert", "group_commit", "startup"]
+
+
+def default_db_path(scale, seed):
+    return os.path.join("benchmark_data", f"chocan_{scale}_{seed}.db")
+
+
+def add_dataset_arguments(parser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="tiny")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--weeks", type=int, default=8,
+                        help="weeks of service records to generate")
+    parser.add_argument("--db", default=None,
+                        help="dataset path (default: benchmark_data/chocan_<scale>_<seed>.db)")
+
+
+def generator_for(args):
+    db_path = args.db if args.db is not None else default_db_path(args.scale, args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    return DataGenerator(db_path, scale=args.scale, seed=args.seed, weeks=args.weeks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="generate a synthetic dataset")
+    add_dataset_arguments(generate)
+    generate.add_argument("--force", action="store_true",
+                          help="regenerate even if an identical dataset exists")
+
+    run = commands.add_parser("run", help="run the benchmarks and write the results")
+    add_dataset_arguments(run)
+    run.add_argument("--output", default="benchmark_results.json")
+    run.add_argument("--only", nargs="+", choices=BENCHMARK_GROUPS, default=None)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--samples", type=int, default=1000,
+                     help="service entries replayed by the validation benchmark")
+    run.add_argument("--insert-rows", type=int, default=10000,
+                     help="service records inserted by the bulk insert benchmark "
+                          "(a tenth of them by the group commit benchmark)")
+    run.add_argument("--workers", type=int, default=None,
+                     help="worker processes for the accounting run")
+    run.add_argument("--profile", default=None, help="database engine profile")
+
+    compare = commands.add_parser("compare", help="compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                         help="fractional slowdown reported as a regression")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generator_for(args).generate(force=args.force)
+        return 0
+
+    if args.command == "run":
+        generator = generator_for(args)
+        dataset = generator.generate()
+        suite = BenchmarkSuite(
+            generator.db_path,
+            repeat=args.repeat,
+            samples=args.samples,
+            insert_rows=args.insert_rows,
+            workers=args.workers,
+            profile=args.profile,
+            seed=args.seed,
+        )
+        print(f"Running benchmarks on the {args.scale} dataset ({dataset['service_records']} service records):")
+        suite.run(args.only)
+        suite.write_results(args.output, dataset)
+        return 0
+
+    regressions = compare_results(args.baseline, args.current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+import sqlalchemy
+from sqlalchemy import func
+from chocan_software.models import Member
+from chocan_software.models import Provider
+from chocan_software.models import ProviderService
+from chocan_software.models import Service
+from chocan_software.models import ServiceRecord
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.person_manager import MemberManager
+from chocan_software.data_managers.person_manager import ProviderManager
+from chocan_software.data_managers.report_manager import ReportManager
+from chocan_software.data_managers.rollup_manager import apply_rollups_where
+from chocan_software.data_managers.rollup_manager import iso_week
+from chocan_software.data_managers.service_manager import ServiceManager
+from chocan_software.data_managers.service_record_manager import ServiceRecordManager
+from chocan_software.data_managers.service_record_manager import parse_service_date
+from chocan_software.data_managers.service_record_queue import ServiceRecordWriteQueue
+
+# A benchmark counts as changed when its median time moves by more than this
+# fraction between two result files.
+DEFAULT_THRESHOLD = 0.10
+
+# Concurrent callers in the group commit benchmark, e.g. terminal sessions
+GROUP_COMMIT_CALLERS = 32
+
+# The repository root, where main.py lives
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BenchmarkSuite:
+    """
+    Times the accounting run, each individual report, provider terminal
+    validation round trips, bulk service record inserts and cold starts
+    against an existing (usually generated) database.
+
+    Every benchmark is run `repeat` times. Results are kept per benchmark as
+    the individual run times plus their best and median, and the number of
+    operations each run performed, so throughput can be compared as well.
+    """
+    def __init__(self, db_path, repeat=3, samples=1000, insert_rows=10000,
+                 workers=None, profile=None, seed=0):
+        self.db_path = db_path
+        self.repeat = repeat
+        self.samples = samples
+        self.insert_rows = insert_rows
+        self.workers = workers
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.db_manager = DatabaseManager(f"sqlite:///{db_path}", profile=profile)
+        self.results = {}
+
+    def time(self, name, run, ops=1, setup=None):
+        """
+        Times run() `repeat` times, calling setup() untimed before each run,
+        and records the result under name.
+        """
+        runs = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                run()
+                runs.append(time.perf_counter() - started)
+        median = statistics.median(runs)
+        self.results[name] = {
+            "runs": runs,
+            "best": min(runs),
+            "median": median,
+            "ops": ops,
+            "ops_per_second": ops / median if median else None,
+        }
+        print(f"  {name:<32} median {median * 1000:10.2f} ms   best {min(runs) * 1000:10.2f} ms")
+
+    def run(self, benchmarks=None):
+        """
+        Runs the named benchmark groups (all of them by default) and returns
+        the results.
+        """
+        groups = {
+            "accounting": self.bench_accounting,
+            "reports": self.bench_reports,
+            "validation": self.bench_validation,
+            "bulk_insert": self.bench_bulk_insert,
+            "group_commit": self.bench_group_commit,
+            "startup": self.bench_startup,
+        }
+        for name in benchmarks or groups:
+            groups[name]()
+        return self.results
+
+    def bench_accounting(self):
+        with tempfile.TemporaryDirectory() as reports_dir:
+            report_manager = ReportManager(self.db_manager, reports_dir)
+            self.time(
+                "accounting.main_procedure",
+                lambda: report_manager.main_accounting_procedure(workers=self.workers)
+            )
+
+    def bench_reports(self):
+        one_week_ago = datetime.now() - timedelta(days=7)
+        with self.db_manager.get_session() as session:
+            # The busiest provider and member of the week: the worst case for
+            # a single report.
+            provider_id = session.query(ServiceRecord.provider_id).filter(
+                ServiceRecord.service_date >= one_week_ago
+            ).group_by(ServiceRecord.provider_id).order_by(
+                func.count().desc()
+            ).limit(1).scalar()
+            member_id = session.query(ServiceRecord.member_id).filter(
+                ServiceRecord.service_date >= one_week_ago
+            ).group_by(ServiceRecord.member_id).order_by(
+                func.count().desc()
+            ).limit(1).scalar()
+
+        with tempfile.TemporaryDirectory() as reports_dir:
+            report_manager = ReportManager(self.db_manager, reports_dir)
+            if provider_id is not None:
+                self.time(
+                    "report.provider",
+                    lambda: report_manager.generate_provider_report(provider_id)
+                )
+            if member_id is not None:
+                self.time(
+                    "report.member",
+                    lambda: report_manager.generate_member_report(member_id)
+                )
+            self.time("report.summary", report_manager.generate_summary_report)
+            self.time("report.eft_data", report_manager.generate_eft_data)
+            week = iso_week(one_week_ago)
+            self.time("report.summary_weekly_rollup",
+                      lambda: report_manager.generate_summary_report(week))
+            self.time("report.eft_data_weekly_rollup",
+                      lambda: report_manager.generate_eft_data(week))
+            self.time("report.provider_directory", report_manager.generate_provider_directory)
+
+    def bench_validation(self):
+        """
+        Replays the lookups a provider terminal makes for one service entry
+        (provider login, member swipe, member status, service code) for
+        `samples` random entries. The cold run starts with empty caches; the
+        warm run repeats the same entries.
+        """
+        with self.db_manager.get_session() as session:
+            provider_count = session.query(func.max(Provider.id)).scalar() or 0
+            member_count = session.query(func.max(Member.id)).scalar() or 0
+            service_count = session.query(func.max(Service.id)).scalar() or 0
+        if not provider_count or not member_count or not service_count:
+            return
+
+        provider_manager = ProviderManager(self.db_manager)
+        member_manager = MemberManager(self.db_manager)
+        service_manager = ServiceManager(self.db_manager)
+        entries = [
+            (
+                f"{self.random.randint(1, provider_count):09}",
+                f"{self.random.randint(1, member_count):09}",
+                f"{self.random.randint(1, service_count):06}",
+            )
+            for _ in range(self.samples)
+        ]
+
+        def validate():
+            for provider_number, member_number, service_code in entries:
+                provider_manager.is_valid_provider(provider_number)
+                member_manager.is_valid_member(member_number)
+                member_manager.get_member(member_number)
+                service_manager.get_service(service_code)
+                provider_manager.is_authorized_service(provider_number, service_code)
+
+        def clear_caches():
+            provider_manager.get_validation_cache(Provider).clear()
+            member_manager.get_validation_cache(Member).clear()
+            service_manager.catalog.bump_version()
+            provider_manager.authorizations.bump_version()
+
+        self.time("validation.cold", validate, ops=self.samples, setup=clear_caches)
+        self.time("validation.warm", validate, ops=self.samples)
+
+    def bench_bulk_insert(self):
+        """
+        Times ServiceRecordManager.insert_service_record_batch and a CSV
+        import_service_records of insert_rows records each. The records are
+        dated before any generated data so they cannot collide with it, and
+        are deleted again (and taken out of the weekly rollups) after each
+        run.
+        """
+        record_manager = ServiceRecordManager(self.db_manager)
+        with self.db_manager.get_session() as session:
+            member_count = session.query(func.max(Member.id)).scalar() or 0
+            first_date = session.query(func.min(ServiceRecord.service_date)).scalar()
+            services = {
+                service_id: (name, fee_cents)
+                for service_id, name, fee_cents in session.query(
+                    Service.id, Service.name, Service.fee_cents
+                )
+            }
+        authorized = self.authorized_services()
+        if not member_count or not authorized:
+            return
+        base_date = (first_date or datetime.now()) - timedelta(days=365)
+
+        rows = []
+        for index in range(self.insert_rows):
+            provider_id, service_id = self.random.choice(authorized)
+            rows.append({
+                "provider_number": f"{provider_id:09}",
+                "member_number": f"{self.random.randint(1, member_count):09}",
+                "service_code": f"{service_id:06}",
+                # One record per day and provider/member/service at most
+                "date_of_service": (base_date - timedelta(days=index // 50)).strftime("%m-%d-%Y"),
+                "comments": "benchmark",
+            })
+        batch = []
+        for line_number, row in enumerate(rows, start=2):
+            _, stored_date = parse_service_date(row["date_of_service"])
+            service_id = int(row["service_code"])
+            record = (
+                int(row["provider_number"]), int(row["member_number"]),
+                service_id, stored_date, *services[service_id], row["comments"]
+            )
+            batch.append((line_number, row, record))
+
+        remove_inserted = self.record_remover()
+
+        with tempfile.TemporaryDirectory() as import_dir:
+            import_path = os.path.join(import_dir, "service_records.csv")
+            with open(import_path, 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+
+            try:
+                self.time(
+                    "bulk_insert.batch",
+                    lambda: record_manager.insert_service_record_batch(batch),
+                    ops=len(batch), setup=remove_inserted
+                )
+                self.time(
+                    "bulk_insert.csv_import",
+                    lambda: record_manager.import_service_records(import_path),
+                    ops=len(rows), setup=remove_inserted
+                )
+            finally:
+                remove_inserted()
+
+    def authorized_services(self):
+        """
+        Every (provider_id, service_id) pair the providers may bill, so
+        generated entries pass the service authorization check.
+        """
+        with self.db_manager.get_session() as session:
+            return session.query(
+                ProviderService.provider_id, ProviderService.service_id
+            ).order_by(ProviderService.provider_id, ProviderService.service_id).all()
+
+    def bench_group_commit(self):
+        """
+        Times GROUP_COMMIT_CALLERS threads adding insert_rows / 10 service
+        records one at a time, first each with its own transaction through
+        ServiceRecordManager.add_service_record, then through a
+        ServiceRecordWriteQueue that commits them in groups.
+        """
+        with self.db_manager.get_session() as session:
+            member_count = session.query(func.max(Member.id)).scalar() or 0
+            first_date = session.query(func.min(ServiceRecord.service_date)).scalar()
+        authorized = self.authorized_services()
+        if not member_count or not authorized:
+            return
+        base_date = (first_date or datetime.now()) - timedelta(days=365)
+
+        records = []
+        for index in range(max(self.insert_rows // 10, 1)):
+            provider_id, service_id = self.random.choice(authorized)
+            records.append((
+                f"{provider_id:09}",
+                f"{self.random.randint(1, member_count):09}",
+                f"{service_id:06}",
+                (base_date - timedelta(days=index // 50)).strftime("%m-%d-%Y"),
+                "benchmark",
+            ))
+        record_manager = ServiceRecordManager(self.db_manager)
+        remove_inserted = self.record_remover()
+
+        def add_concurrently(add_service_record):
+            with ThreadPoolExecutor(max_workers=GROUP_COMMIT_CALLERS) as executor:
+                list(executor.map(lambda record: add_service_record(*record), records))
+
+        try:
+            self.time(
+                "group_commit.per_record_commit",
+                lambda: add_concurrently(record_manager.add_service_record),
+                ops=len(records), setup=remove_inserted
+            )
+            with ServiceRecordWriteQueue(record_manager) as write_queue:
+                self.time(
+                    "group_commit.write_queue",
+                    lambda: add_concurrently(write_queue.add_service_record),
+                    ops=len(records), setup=remove_inserted
+                )
+        finally:
+            remove_inserted()
+
+    def bench_startup(self):
+        """
+        Times cold starts, each in a fresh interpreter: drawing the acceptance
+        test menu of main.py, opening the provider and manager terminals on
+        the benchmark database (which is already at the current schema
+        version) and a CLI command. Comparing result files with `compare`
+        catches startup regressions.
+        """
+        db_url = f"sqlite:///{os.path.abspath(self.db_path)}"
+        environment = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [REPOSITORY_ROOT, os.environ.get("PYTHONPATH")])
+            ),
+        }
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            def start(*args, stdin=None):
+                subprocess.run(
+                    [sys.executable, *args], input=stdin, capture_output=True,
+                    text=True, check=True, cwd=work_dir, env=environment
+                )
+
+            self.time(
+                "startup.menu",
+                lambda: start(os.path.join(REPOSITORY_ROOT, "main.py"), stdin="3\n")
+            )
+            self.time(
+                "startup.provider_terminal",
+                lambda: start("-c", (
+                    "from chocan_software.user_terminals.provider_terminal import ProviderTerminal\n"
+                    f"ProviderTerminal({db_url!r})"
+                ))
+            )
+            self.time(
+                "startup.manager_terminal",
+                lambda: start("-c", (
+                    "from chocan_software.user_terminals.manager_terminal import ManagerTerminal\n"
+                    f"ManagerTerminal({db_url!r})"
+                ))
+            )
+            self.time(
+                "startup.cli",
+                lambda: start("-m", "chocan_software", "--db-url", db_url, "migrate")
+            )
+
+    def record_remover(self):
+        """
+        Returns a function that deletes every service record added after
+        now, taking them out of the weekly rollups first.
+        """
+        with self.db_manager.get_session() as session:
+            last_id = session.query(func.coalesce(func.max(ServiceRecord.id), 0)).scalar()
+
+        def remove_inserted():
+            with self.db_manager.get_session(commit=True) as session:
+                apply_rollups_where(
+                    session.connection(), "service_records.id > ?", (last_id,), remove=True
+                )
+                session.query(ServiceRecord).filter(
+                    ServiceRecord.id > last_id
+                ).delete(synchronize_session=False)
+
+        return remove_inserted
+
+    def environment(self):
+        """
+        What the results were measured on: the commit, interpreter, library
+        versions and suite settings.
+        """
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "profile": self.db_manager.profile_name,
+            "workers": self.workers,
+            "repeat": self.repeat,
+            "samples": self.samples,
+            "insert_rows": self.insert_rows,
+        }
+
+    def write_results(self, results_path, dataset=None):
+        """
+        Writes the environment, dataset and results as JSON to results_path.
+        """
+        with open(results_path, 'w') as file:
+            json.dump({
+                "environment": self.environment(),
+                "dataset": dataset,
+                "results": self.results,
+            }, file, indent=2)
+        print(f"Benchmark results written to: {results_path}")
+
+
+def compare_results(baseline_path, current_path, threshold=DEFAULT_THRESHOLD):
+    """
+    Prints the change in median time for every benchmark in both result
+    files. Returns the names of the benchmarks that got slower by more than
+    threshold (a fraction of the baseline median).
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    with open(current_path) as file:
+        current = json.load(file)
+
+    if baseline.get("dataset") != current.get("dataset"):
+        print("Warning: the results were measured on different datasets.")
+
+    regressions = []
+    print(f"{'BENCHMARK':<32} {'BASELINE ms':>12} {'CURRENT ms':>12} {'CHANGE':>8}")
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        before = baseline["results"].get(name)
+        after = current["results"].get(name)
+        if before is None or after is None:
+            print(f"{name:<32} {'only in ' + ('current' if before is None else 'baseline'):>34}")
+            continue
+        change = (after["median"] - before["median"]) / before["median"] if before["median"] else 0.0
+        marker = ""
+        if change > threshold:
+            marker = "  slower"
+            regressions.append(name)
+        elif change < -threshold:
+            marker = "  faster"
+        print(
+            f"{name:<32} {before['median'] * 1000:>12.2f} "
+            f"{after['median'] * 1000:>12.2f} {change:>+8.1%}{marker}"
+        )
+    return regressions
@@ -0,0 +1,206 @@
+import json
+import os
+import random
+from datetime import datetime
+from datetime import timedelta
+from sqlalchemy import insert
+from chocan_software.models import Member
+from chocan_software.models import Provider
+from chocan_software.models import ProviderService
+from chocan_software.models import Service
+from chocan_software.models import ServiceRecord
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.migrations import SCHEMA_VERSION
+from chocan_software.data_managers.rollup_manager import add_rollups_since
+from chocan_software.constants import MEMBER_STATUS_ACTIVE
+from chocan_software.constants import MEMBER_STATUS_SUSPENDED
+
+# Row counts for each dataset scale. "full" is the production-sized target;
+# the smaller scales keep the same shape for quick local runs.
+SCALES = {
+    "tiny": {"members": 1000, "providers": 50, "services": 50, "service_records": 20000},
+    "small": {"members": 10000, "providers": 500, "services": 100, "service_records": 500000},
+    "medium": {"members": 50000, "providers": 2000, "services": 250, "service_records": 2000000},
+    "full": {"members": 100000, "providers": 5000, "services": 500, "service_records": 10000000},
+}
+
+CITIES = ["Portland", "Salem", "Eugene", "Gresham", "Hillsboro", "Beaverton", "Bend", "Medford"]
+STREETS = ["Main St", "Oak St", "Pine Ave", "Cedar Rd", "Elm St", "Maple Dr", "Lake Rd"]
+SUSPENDED_RATE = 0.05
+# Services each provider is authorized to bill
+SERVICES_PER_PROVIDER = 10
+
+
+class DataGenerator:
+    """
+    Builds a synthetic ChocAn database for benchmarking. The same scale and
+    seed always produce the same rows, so results from different commits are
+    measured against identical data.
+
+    Rows are loaded through the models with batched ORM inserts. Service
+    records are spread evenly over the last `weeks` weeks, so every weekly
+    report has roughly 1/weeks of them to work through.
+
+    The parameters used are written next to the database as <db_path>.json so
+    that a later run can reuse the database and record what it was run on.
+    Service dates are relative to the day the data was generated, so a
+    dataset is only reused on the day it was generated.
+    """
+    def __init__(self, db_path, scale="tiny", seed=0, weeks=8, batch_size=50000):
+        self.db_path = db_path
+        self.scale = scale
+        self.counts = SCALES[scale]
+        self.seed = seed
+        self.weeks = weeks
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @property
+    def metadata_path(self):
+        return f"{self.db_path}.json"
+
+    def metadata(self):
+        return {
+            "scale": self.scale,
+            "seed": self.seed,
+            "weeks": self.weeks,
+            "generated_on": self.today.strftime("%Y-%m-%d"),
+            "schema_version": SCHEMA_VERSION,
+            **self.counts,
+        }
+
+    def is_current(self):
+        """
+        Whether db_path already holds a dataset generated with these
+        parameters.
+        """
+        if not os.path.exists(self.db_path) or not os.path.exists(self.metadata_path):
+            return False
+        with open(self.metadata_path) as file:
+            return json.load(file) == self.metadata()
+
+    def generate(self, force=False):
+        """
+        Creates the database unless an identical one already exists (or force
+        is set). Returns the dataset metadata.
+        """
+        if not force and self.is_current():
+            print(f"Reusing {self.scale} dataset: {self.db_path}")
+            return self.metadata()
+
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm", self.metadata_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        db_manager = DatabaseManager(f"sqlite:///{self.db_path}", profile="bulk_load")
+        started = datetime.now()
+        self.load(db_manager, Member, self.members())
+        self.load(db_manager, Provider, self.providers())
+        self.load(db_manager, Service, self.services())
+        self.load(db_manager, ProviderService, self.provider_services())
+        self.load(db_manager, ServiceRecord, self.service_records(), ignore_conflicts=True)
+        with db_manager.engine.begin() as connection:
+            # The batched inserts bypass ServiceRecordManager, so the weekly
+            # rollups are built once all records are in.
+            add_rollups_since(connection)
+            connection.exec_driver_sql("ANALYZE")
+        db_manager.close()
+
+        with open(self.metadata_path, 'w') as file:
+            json.dump(self.metadata(), file, indent=2)
+        print(f"Generated {self.scale} dataset in {datetime.now() - started}: {self.db_path}")
+        return self.metadata()
+
+    def load(self, db_manager, model, rows, ignore_conflicts=False):
+        """
+        Inserts rows (dicts of column values) into model's table, batch_size
+        rows per statement and transaction.
+        """
+        statement = insert(model)
+        if ignore_conflicts:
+            # Random records can repeat the unique (provider, member, service,
+            # date) key; the repeats are dropped.
+            statement = statement.prefix_with("OR IGNORE")
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with db_manager.get_session(commit=True) as session:
+                    session.execute(statement, batch)
+                batch = []
+        if batch:
+            with db_manager.get_session(commit=True) as session:
+                session.execute(statement, batch)
+
+    def person(self, kind, number):
+        return {
+            "name": f"{kind} {number:06}",
+            "street_address": f"{self.random.randint(1, 9999)} {self.random.choice(STREETS)}",
+            "city": self.random.choice(CITIES),
+            "state": "OR",
+            "zip_code": f"{self.random.randint(97001, 97920):05}",
+        }
+
+    def members(self):
+        for number in range(1, self.counts["members"] + 1):
+            member = self.person("Member", number)
+            member["status"] = (
+                MEMBER_STATUS_SUSPENDED if self.random.random() < SUSPENDED_RATE
+                else MEMBER_STATUS_ACTIVE
+            )
+            yield member
+
+    def providers(self):
+        for number in range(1, self.counts["providers"] + 1):
+            yield self.person("Provider", number)
+
+    def services(self):
+        # Kept so service_records() can snapshot each service's name and fee
+        self.generated_services = []
+        for number in range(1, self.counts["services"] + 1):
+            service = {
+                "name": f"Service {number:06}",
+                "fee_cents": round(self.random.uniform(5, 500) * 100),
+            }
+            self.generated_services.append(service)
+            yield service
+
+    def provider_services(self):
+        # Kept so service_records() only bills services a provider may bill
+        self.authorized_services = []
+        service_ids = range(1, len(self.generated_services) + 1)
+        for _ in range(self.counts["providers"]):
+            authorized = sorted(self.random.sample(
+                service_ids, min(SERVICES_PER_PROVIDER, len(service_ids))
+            ))
+            self.authorized_services.append(authorized)
+        for provider_id, authorized in enumerate(self.authorized_services, start=1):
+            for service_id in authorized:
+                yield {"provider_id": provider_id, "service_id": service_id}
+
+    def service_records(self):
+        now = datetime.now()
+        today = self.today
+        days = self.weeks * 7
+        members = self.counts["members"]
+        providers = self.counts["providers"]
+        services = self.generated_services
+        authorized_services = self.authorized_services
+        randint = self.random.randint
+        choice = self.random.choice
+        for _ in range(self.counts["service_records"]):
+            service_date = today - timedelta(days=randint(0, days - 1))
+            provider_id = randint(1, providers)
+            member_id = randint(1, members)
+            service_id = choice(authorized_services[provider_id - 1])
+            yield {
+                "provider_id": provider_id,
+                "member_id": member_id,
+                "service_id": service_id,
+                "service_date": service_date,
+                "service_name": services[service_id - 1]["name"],
+                "service_fee_cents": services[service_id - 1]["fee_cents"],
+                "timestamp": min(service_date + timedelta(seconds=randint(0, 8 * 3600)), now),
+                "comments": None,
+            }
@@ -0,0 +1,4 @@
+import sys
+from chocan_software.cli import main
+
+sys.exit(main())
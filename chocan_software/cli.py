@@ -0,0 +1,385 @@
+# This module defines the non-interactive command-line interface.
+"""
+Runs the report, import, directory, roster search, sync and deletion,
+archival and maintenance operations without the terminal menus, so they can
+be scripted and scheduled, e.g. the weekly accounting run from cron:
+
+    python -m chocan_software --db-url sqlite:////srv/chocan.db \\
+        --output-dir /srv/reports accounting --workers 4
+
+Only the managers the chosen command needs are built. Every command exits
+with one of the status codes below, and --timing prints how long the command
+took to stderr.
+
+Exit codes:
+    EXIT_SUCCESS (int): The command completed.
+    EXIT_FAILURE (int): The command ran but did not fully succeed (unknown
+        member or provider number, rejected import or roster rows, a search
+        without matches, drifted rollups with --check, queries that scan
+        service_records, a summary, EFT or accounting period reaching into
+        the service record archive, ...).
+    EXIT_USAGE (int): Invalid arguments (argparse's own status code).
+    EXIT_DATABASE_ERROR (int): The database could not be opened or a
+        statement failed.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.migrations import get_schema_version
+from chocan_software.data_managers.person_manager import MemberManager
+from chocan_software.data_managers.person_manager import ProviderManager
+from chocan_software.data_managers.query_plan_checker import QueryPlanChecker
+from chocan_software.data_managers.report_manager import ReportManager
+from chocan_software.data_managers.rollup_manager import RollupManager
+from chocan_software.data_managers.rollup_manager import week_bounds
+from chocan_software.data_managers.service_record_journal import ServiceRecordJournal
+from chocan_software.data_managers.service_record_manager import ServiceRecordManager
+from chocan_software.constants import (
+    ACCOUNT_NUM_LEN,
+    DATABASE_PROFILES
+)
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_DATABASE_ERROR = 3
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%m-%d-%Y")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, expected MM-DD-YYYY")
+
+
+def parse_week(value):
+    try:
+        datetime.strptime(f"{value}-1", "%G-W%V-%u")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid week {value!r}, expected YYYY-Www")
+    return value
+
+
+def parse_account_number(value):
+    if not value.isdigit() or len(value) != ACCOUNT_NUM_LEN:
+        raise argparse.ArgumentTypeError(f"account numbers are {ACCOUNT_NUM_LEN} digits")
+    return value
+
+
+def report_period(args):
+    """
+    The (start_date, end_date) given by --week or --start/--end, with None for
+    the bounds that were not given. An end date covers the whole day.
+    """
+    if args.week is not None:
+        return week_bounds(args.week)
+    end_date = args.end
+    if end_date is not None:
+        end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return args.start, end_date
+
+
+def get_db_manager(args):
+    return DatabaseManager(args.db_url, profile=args.profile)
+
+
+def get_report_manager(args):
+    return ReportManager(get_db_manager(args), args.output_dir, args.archive_dir)
+
+
+def get_service_record_manager(args):
+    return ServiceRecordManager(get_db_manager(args), args.archive_dir)
+
+
+def run_accounting(args):
+    start_date, end_date = report_period(args)
+    completed = get_report_manager(args).main_accounting_procedure(
+        workers=args.workers, start_date=start_date, end_date=end_date
+    )
+    return EXIT_SUCCESS if completed else EXIT_FAILURE
+
+
+def run_summary(args):
+    start_date, end_date = report_period(args)
+    generated = get_report_manager(args).generate_summary_report(
+        week=args.week, start_date=start_date, end_date=end_date
+    )
+    return EXIT_SUCCESS if generated else EXIT_FAILURE
+
+
+def run_eft(args):
+    start_date, end_date = report_period(args)
+    generated = get_report_manager(args).generate_eft_data(
+        week=args.week, start_date=start_date, end_date=end_date
+    )
+    return EXIT_SUCCESS if generated else EXIT_FAILURE
+
+
+def run_member_report(args):
+    report_manager = get_report_manager(args)
+    if MemberManager(report_manager.db_manager).get_member(args.member_number) is None:
+        print(f"Member {args.member_number} not found.", file=sys.stderr)
+        return EXIT_FAILURE
+    start_date, end_date = report_period(args)
+    report_manager.generate_member_report(args.member_number, start_date, end_date)
+    return EXIT_SUCCESS
+
+
+def run_provider_report(args):
+    report_manager = get_report_manager(args)
+    if ProviderManager(report_manager.db_manager).get_provider(args.provider_number) is None:
+        print(f"Provider {args.provider_number} not found.", file=sys.stderr)
+        return EXIT_FAILURE
+    start_date, end_date = report_period(args)
+    report_manager.generate_provider_report(args.provider_number, start_date, end_date)
+    return EXIT_SUCCESS
+
+
+def run_directory(args):
+    get_report_manager(args).generate_provider_directory()
+    return EXIT_SUCCESS
+
+
+def run_import(args):
+    _, rejected = get_service_record_manager(args).import_service_records(
+        args.file, args.rejects, args.batch_size
+    )
+    return EXIT_FAILURE if rejected else EXIT_SUCCESS
+
+
+def run_sync_roster(args):
+    db_manager = get_db_manager(args)
+    if args.roster == "members":
+        changes = MemberManager(db_manager).sync_member_roster(
+            args.file, args.rejects, args.suspend_missing, args.batch_size
+        )
+    else:
+        changes = ProviderManager(db_manager).sync_provider_roster(
+            args.file, args.rejects, args.batch_size
+        )
+    return EXIT_FAILURE if changes['rejected'] else EXIT_SUCCESS
+
+
+def run_delete(args):
+    db_manager = get_db_manager(args)
+    if args.roster == "members":
+        found = MemberManager(db_manager).delete_member(
+            args.number, args.tombstone, args.batch_size
+        )
+    else:
+        found = ProviderManager(db_manager).delete_provider(
+            args.number, args.tombstone, args.batch_size
+        )
+    return EXIT_SUCCESS if found else EXIT_FAILURE
+
+
+def run_sync_journal(args):
+    with ServiceRecordJournal(get_service_record_manager(args), args.journal) as journal:
+        synced, rejected = journal.sync()
+    print(f"Synced {synced} journal entries ({rejected} rejected).")
+    return EXIT_FAILURE if rejected else EXIT_SUCCESS
+
+
+def run_archive(args):
+    get_service_record_manager(args).archive_service_records(
+        args.older_than, args.batch_size
+    )
+    return EXIT_SUCCESS
+
+
+def run_rebuild_rollups(args):
+    drift = RollupManager(get_db_manager(args)).rebuild_and_report()
+    return EXIT_FAILURE if drift and args.check else EXIT_SUCCESS
+
+
+def run_rebuild_search(args):
+    db_manager = get_db_manager(args)
+    MemberManager(db_manager).rebuild_member_search()
+    ProviderManager(db_manager).rebuild_provider_search()
+    return EXIT_SUCCESS
+
+
+def run_search(args):
+    db_manager = get_db_manager(args)
+    if args.roster == "members":
+        matches = MemberManager(db_manager).view_member_search(args.query, args.page, args.fuzzy)
+    else:
+        matches = ProviderManager(db_manager).view_provider_search(args.query, args.page, args.fuzzy)
+    return EXIT_SUCCESS if matches else EXIT_FAILURE
+
+
+def run_check_plans(args):
+    return EXIT_SUCCESS if QueryPlanChecker().report() else EXIT_FAILURE
+
+
+def run_migrate(args):
+    # Opening the database applies any pending migrations
+    db_manager = get_db_manager(args)
+    with db_manager.engine.connect() as connection:
+        version = get_schema_version(connection)
+    print(f"Database schema is at version {version}.")
+    return EXIT_SUCCESS
+
+
+def add_period_options(parser):
+    parser.add_argument("--week", type=parse_week, default=None,
+                        help="ISO week to report (YYYY-Www), instead of --start/--end")
+    parser.add_argument("--start", type=parse_date, default=None,
+                        help="first date of service to include (MM-DD-YYYY); "
+                             "defaults to one week before the end")
+    parser.add_argument("--end", type=parse_date, default=None,
+                        help="last date of service to include (MM-DD-YYYY); defaults to now")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m chocan_software",
+        description="ChocAn data processing commands"
+    )
+    parser.add_argument("--db-url", default=None,
+                        help="database URL (defaults to DATABASE_URL)")
+    parser.add_argument("--profile", choices=sorted(DATABASE_PROFILES), default=None,
+                        help="database engine profile")
+    parser.add_argument("--output-dir", default=None,
+                        help="directory reports are written to")
+    parser.add_argument("--archive-dir", default=None,
+                        help="directory of the service record archive files "
+                             "(defaults to one next to the database file)")
+    parser.add_argument("--timing", action="store_true",
+                        help="print the command's run time to stderr")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    accounting = commands.add_parser(
+        "accounting", help="run the main accounting procedure"
+    )
+    add_period_options(accounting)
+    accounting.add_argument("--workers", type=int, default=None,
+                            help="worker processes used to render reports")
+    accounting.set_defaults(run=run_accounting)
+
+    summary = commands.add_parser("summary", help="generate the summary report")
+    add_period_options(summary)
+    summary.set_defaults(run=run_summary)
+
+    eft = commands.add_parser("eft", help="generate the EFT data")
+    add_period_options(eft)
+    eft.set_defaults(run=run_eft)
+
+    member_report = commands.add_parser("member-report", help="generate a member report")
+    member_report.add_argument("member_number", type=parse_account_number)
+    add_period_options(member_report)
+    member_report.set_defaults(run=run_member_report)
+
+    provider_report = commands.add_parser("provider-report", help="generate a provider report")
+    provider_report.add_argument("provider_number", type=parse_account_number)
+    add_period_options(provider_report)
+    provider_report.set_defaults(run=run_provider_report)
+
+    directory = commands.add_parser("directory", help="generate the provider directory")
+    directory.set_defaults(run=run_directory)
+
+    import_records = commands.add_parser(
+        "import", help="bulk import service records from a CSV or JSONL file"
+    )
+    import_records.add_argument("file")
+    import_records.add_argument("--rejects", default=None,
+                                help="where rejected rows are written")
+    import_records.add_argument("--batch-size", type=int, default=None)
+    import_records.set_defaults(run=run_import)
+
+    sync_roster = commands.add_parser(
+        "sync-roster", help="apply a full member or provider roster from a CSV or JSONL file"
+    )
+    sync_roster.add_argument("roster", choices=["members", "providers"])
+    sync_roster.add_argument("file")
+    sync_roster.add_argument("--rejects", default=None,
+                             help="where rejected rows are written")
+    sync_roster.add_argument("--suspend-missing", action="store_true",
+                             help="suspend active members that are not in the roster")
+    sync_roster.add_argument("--batch-size", type=int, default=None)
+    sync_roster.set_defaults(run=run_sync_roster)
+
+    delete = commands.add_parser(
+        "delete", help="delete or deactivate a member or provider"
+    )
+    delete.add_argument("roster", choices=["members", "providers"])
+    delete.add_argument("number", type=parse_account_number)
+    delete.add_argument("--tombstone", action="store_true",
+                        help="only mark the account deleted, keeping its service records")
+    delete.add_argument("--batch-size", type=int, default=None,
+                        help="service records deleted per transaction")
+    delete.set_defaults(run=run_delete)
+
+    sync_journal = commands.add_parser(
+        "sync-journal", help="sync a provider terminal journal into the database"
+    )
+    sync_journal.add_argument("journal", nargs="?", default=None)
+    sync_journal.set_defaults(run=run_sync_journal)
+
+    archive = commands.add_parser(
+        "archive", help="move old service records into the per-year archive files"
+    )
+    archive.add_argument("--older-than", type=int, default=None, metavar="DAYS",
+                         help="archive records dated more than DAYS days ago")
+    archive.add_argument("--batch-size", type=int, default=None)
+    archive.set_defaults(run=run_archive)
+
+    rebuild_rollups = commands.add_parser(
+        "rebuild-rollups", help="rebuild the weekly rollups and report drift"
+    )
+    rebuild_rollups.add_argument("--check", action="store_true",
+                                 help="exit with a failure status if any rollup had drifted")
+    rebuild_rollups.set_defaults(run=run_rebuild_rollups)
+
+    search = commands.add_parser(
+        "search", help="search members or providers by name, street address or city"
+    )
+    search.add_argument("roster", choices=["members", "providers"])
+    search.add_argument("query")
+    search.add_argument("--page", type=int, default=1)
+    search.add_argument("--fuzzy", action="store_true",
+                        help="also find near misses, e.g. misspelled names")
+    search.set_defaults(run=run_search)
+
+    rebuild_search = commands.add_parser(
+        "rebuild-search", help="rebuild the member and provider search indexes"
+    )
+    rebuild_search.set_defaults(run=run_rebuild_search)
+
+    check_plans = commands.add_parser(
+        "check-plans", help="check that report queries do not scan service_records"
+    )
+    check_plans.set_defaults(run=run_check_plans)
+
+    migrate = commands.add_parser("migrate", help="upgrade the database schema")
+    migrate.set_defaults(run=run_migrate)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'week', None) is not None and (args.start or args.end):
+        parser.error("--week cannot be combined with --start or --end")
+    if getattr(args, 'start', None) and getattr(args, 'end', None) and args.start > args.end:
+        parser.error("--start must not be after --end")
+    start = time.perf_counter()
+    try:
+        status = args.run(args)
+    except SQLAlchemyError as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        status = EXIT_DATABASE_ERROR
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        status = EXIT_FAILURE
+    if args.timing:
+        print(f"{args.command} finished in {time.perf_counter() - start:.3f}s "
+              f"with status {status}", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
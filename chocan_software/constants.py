@@ -2,6 +2,21 @@
 """
 Database constants:
     DATABASE_URL (str): The default URL for the database connection.
+    DATABASE_PROFILES (dict): Named SQLite engine profiles. Each profile sets
+        the per-connection PRAGMAs and the connection pool size used for
+        file-backed databases.
+    DATABASE_PROFILE (str): The engine profile used by default. Can be set
+        with the CHOCAN_DB_PROFILE environment variable.
+    SQL_INSTRUMENTATION (bool): Record per-statement SQL timings for every
+        database. Off unless the CHOCAN_SQL_INSTRUMENTATION environment
+        variable is set to something other than 0.
+    SQL_INSTRUMENTATION_OUTPUT (str): Where the SQL summary is written when
+        the process exits (.json for JSON, else a text table). Set with
+        CHOCAN_SQL_INSTRUMENTATION_OUTPUT; printed to stderr if unset.
+    SQL_N_PLUS_ONE_THRESHOLD (int): Times the same query may run from one
+        method within one session before it is reported as a suspected N+1.
+    KEYSET_PAGE_SIZE (int): Rows fetched per query by the iter_* methods
+        that page through service records and rosters.
 
 Member/Provider constants:
     ACCOUNT_NUM_LEN (int): Length of an account number (id padded w/ zeroes).
@@ -13,6 +28,14 @@ Member/Provider constants:
     CITY_MAX_LEN (int): Maximum length of a person's city.
     STATE_LEN (int): Length of a person's state abbreviation.
     ZIP_CODE_LEN (int): Length of a person's ZIP code.
+    VALIDATION_CACHE_SIZE (int): Maximum accounts held in each validation cache.
+    VALIDATION_CACHE_TTL (float): Seconds a cached account lookup stays valid.
+    SEARCH_PAGE_SIZE (int): Matches returned per page by the member and
+        provider searches.
+    ROSTER_SYNC_BATCH_SIZE (int): Roster rows diffed and applied together
+        during a roster sync.
+    DELETE_BATCH_SIZE (int): Service records removed per transaction when a
+        member or provider is deleted.
 
 Member constants
     MEMBER_STATUS_ACTIVE (bool): Status of an active member.
@@ -22,15 +45,103 @@ Service constants:
     SERVICE_CODE_LEN (int): Length of a service code (id padded w/ zeroes).
     SERVICE_NAME_MIN_LEN (int): Minimum length of a service name.
     SERVICE_NAME_MAX_LEN (int): Maximum length of a service name.
-    SERVICE_FEE_MAX (float): Maximum fee for a service.
+    SERVICE_FEE_MAX_CENTS (int): Maximum fee for a service, in cents. Fees
+        and fee totals are stored and added up as integer cents.
+    SERVICE_CATALOG_TTL (float): Seconds a service catalog snapshot is used
+        before it is reloaded to pick up changes made by other processes.
+    SERVICE_AUTHORIZATIONS_TTL (float): Seconds a snapshot of the providers'
+        service authorizations is used before it is rebuilt.
 
 Service Record constants:
     SERVICERECORD_COMMENT_MAX_LEN (int): Maximum length of service record comments.
+    BULK_IMPORT_BATCH_SIZE (int): Service records inserted per transaction
+        during a bulk import.
+    GROUP_COMMIT_INTERVAL (float): Seconds the service record write queue
+        waits after a submission for more to commit in the same transaction.
+    GROUP_COMMIT_MAX_RECORDS (int): Service records the write queue commits
+        in one transaction at most.
+    SERVICE_RECORD_JOURNAL_PATH (str): The default path of the provider
+        terminal's local journal of service entries awaiting sync.
+    JOURNAL_SYNC_INTERVAL (float): Seconds between passes of the journal's
+        sync thread when no new entries wake it.
+    JOURNAL_SYNC_BATCH_SIZE (int): Journal entries synced per transaction.
+    SERVICE_RECORD_ARCHIVE_DIR (str): The default directory of the per-year
+        service record archive files, next to the database file.
+    SERVICE_RECORD_ARCHIVE_HORIZON_DAYS (int): Age in days past which
+        service records are moved to the archive.
+    SERVICE_RECORD_ARCHIVE_BATCH_SIZE (int): Service records moved to the
+        archive per transaction.
+
+Terminal server constants:
+    TERMINAL_SERVER_HOST (str): Address the provider terminal server binds to.
+    TERMINAL_SERVER_PORT (int): Port the provider terminal server listens on.
+    TERMINAL_SERVER_DB_WORKERS (int): Threads (and so at most database
+        connections) used for database work by the terminal server.
+    TERMINAL_SERVER_BACKLOG (int): Connections the terminal server's listening
+        socket queues before they are accepted, enough for a burst of
+        terminals connecting at once.
+
+Report constants:
+    ACCOUNTING_STREAM_BATCH_SIZE (int): Rows fetched per batch while streaming
+        service records through the accounting engine.
+    ACCOUNTING_WORKERS (int): Worker processes used to render reports during
+        the main accounting procedure (1 runs it serially).
     
 """
+import os
 
 # Database constants
 DATABASE_URL = "sqlite:///chocan.db"
+DATABASE_PROFILES = {
+    # WAL lets readers (reports) run alongside a writer (terminals). With WAL,
+    # synchronous=NORMAL only risks the last commits on power loss, never
+    # corruption.
+    "default": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -64000,  # negative values are KiB, i.e. 64 MB
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+        },
+        "pool_size": 5,
+        "max_overflow": 10,
+    },
+    # Syncs every commit to disk.
+    "durable": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "busy_timeout": 5000,
+            "cache_size": -64000,
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+        },
+        "pool_size": 5,
+        "max_overflow": 10,
+    },
+    # For bulk imports and benchmarks: no fsyncs and a large page cache. A
+    # crash mid-load can lose the load, so only use it for data that can be
+    # reloaded.
+    "bulk_load": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "busy_timeout": 30000,
+            "cache_size": -512000,
+            "mmap_size": 1073741824,
+            "temp_store": "MEMORY",
+        },
+        "pool_size": 2,
+        "max_overflow": 2,
+    },
+}
+DATABASE_PROFILE = os.environ.get("CHOCAN_DB_PROFILE", "default")
+SQL_INSTRUMENTATION = os.environ.get("CHOCAN_SQL_INSTRUMENTATION", "0") not in ("", "0")
+SQL_INSTRUMENTATION_OUTPUT = os.environ.get("CHOCAN_SQL_INSTRUMENTATION_OUTPUT")
+SQL_N_PLUS_ONE_THRESHOLD = 10
+KEYSET_PAGE_SIZE = 1000
 
 # Member/Provider constants
 ACCOUNT_NUM_LEN = 9
@@ -42,6 +153,11 @@ CITY_MIN_LEN = 1
 CITY_MAX_LEN = 14
 STATE_LEN = 2
 ZIP_CODE_LEN = 5
+VALIDATION_CACHE_SIZE = 10000
+VALIDATION_CACHE_TTL = 300
+SEARCH_PAGE_SIZE = 20
+ROSTER_SYNC_BATCH_SIZE = 1000
+DELETE_BATCH_SIZE = 1000
 
 # Member constants
 MEMBER_STATUS_ACTIVE = True
@@ -51,7 +167,28 @@ MEMBER_STATUS_SUSPENDED = False
 SERVICE_CODE_LEN = 6
 SERVICE_NAME_MIN_LEN = 1
 SERVICE_NAME_MAX_LEN = 20
-SERVICE_FEE_MAX = 999.99
+SERVICE_FEE_MAX_CENTS = 99999
+SERVICE_CATALOG_TTL = 60
+SERVICE_AUTHORIZATIONS_TTL = 60
 
 # ServiceRecord constants
 SERVICERECORD_COMMENT_MAX_LEN = 100
+BULK_IMPORT_BATCH_SIZE = 50000
+GROUP_COMMIT_INTERVAL = 0.005
+GROUP_COMMIT_MAX_RECORDS = 500
+SERVICE_RECORD_JOURNAL_PATH = "service_record_journal.jsonl"
+JOURNAL_SYNC_INTERVAL = 1.0
+JOURNAL_SYNC_BATCH_SIZE = 500
+SERVICE_RECORD_ARCHIVE_DIR = "service_record_archive"
+SERVICE_RECORD_ARCHIVE_HORIZON_DAYS = 730
+SERVICE_RECORD_ARCHIVE_BATCH_SIZE = 10000
+
+# Terminal server constants
+TERMINAL_SERVER_HOST = "127.0.0.1"
+TERMINAL_SERVER_PORT = 8765
+TERMINAL_SERVER_DB_WORKERS = 8
+TERMINAL_SERVER_BACKLOG = 1024
+
+# Report constants
+ACCOUNTING_STREAM_BATCH_SIZE = 1000
+ACCOUNTING_WORKERS = 1
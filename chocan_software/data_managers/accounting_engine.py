@@ -0,0 +1,483 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import select
+from chocan_software.models import Member
+from chocan_software.models import Provider
+from chocan_software.models import ServiceRecord
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.string_utils import format_cents
+from chocan_software.constants import (
+    ACCOUNTING_STREAM_BATCH_SIZE,
+    ACCOUNTING_WORKERS
+)
+
+
+class ProviderReportWriter:
+    """
+    Writes weekly provider reports one provider at a time. Records are written
+    to the open report as they arrive, so only one provider is held in memory.
+    """
+    def __init__(self, reports_dir, start_date, end_date):
+        self.reports_dir = reports_dir
+        self.start_date = start_date
+        self.end_date = end_date
+        self.file = None
+        self.filename = None
+        self.record_count = 0
+        self.total_weekly_fee_cents = 0
+
+    def begin(self, number, name, street_address, city, state, zip_code):
+        self.filename = os.path.join(
+            self.reports_dir,
+            f"{name.replace(' ', '_')}_"
+            f"{self.end_date.strftime('%Y%m%d')}_"
+            "ProviderReport.txt"
+        )
+        self.file = open(self.filename, 'w')
+        self.record_count = 0
+        self.total_weekly_fee_cents = 0
+        self.file.write(
+            "╔═════════════════════════════════════════════════════╗\n"
+            "║                Chocoholics Anonymous                ║\n"
+            "╚═════════════════════════════════════════════════════╝\n"
+            "Provider Weekly Report\n\n"
+            "Provider Information:\n"
+            f"  Name:     {name}\n"
+            f"  Number:   {number:09}\n"
+            f"  Street:   {street_address}\n"
+            f"  City:     {city}\n"
+            f"  State:    {state}\n"
+            f"  ZIP Code: {zip_code}\n\n"
+        )
+        self.file.write(f"Services provided from "
+                        f"{self.start_date.strftime('%m-%d-%Y')} to "
+                        f"{self.end_date.strftime('%m-%d-%Y')}:\n"
+        )
+
+    def write(self, service_date, timestamp, member_name, member_number,
+              service_code, service_fee_cents):
+        self.record_count += 1
+        self.total_weekly_fee_cents += service_fee_cents
+        self.file.write(
+            f"  Date of Service: {service_date.strftime('%m-%d-%Y')}\n"
+            f"  Database Timestamp: {timestamp.strftime('%m-%d-%Y %H:%M:%S')}\n"
+            f"  Member Name: {member_name}\n"
+            f"  Member Number: {member_number:09}\n"
+            f"  Service Code: {service_code:06}\n"
+            f"  Service Fee: $ {format_cents(service_fee_cents)}\n\n"
+        )
+
+    def end(self):
+        self.file.write(f"Total Consultations: {self.record_count}\n")
+        self.file.write(f"Total Fee: $ {format_cents(self.total_weekly_fee_cents)}\n")
+        self.file.close()
+        self.file = None
+        return self.filename
+
+
+class MemberReportWriter:
+    """
+    Writes weekly member reports one member at a time.
+    """
+    def __init__(self, reports_dir, end_date):
+        self.reports_dir = reports_dir
+        self.end_date = end_date
+        self.file = None
+        self.filename = None
+
+    def begin(self, number, name, street_address, city, state, zip_code):
+        self.filename = os.path.join(
+            self.reports_dir,
+            f"{name.replace(' ', '_')}_"
+            f"{self.end_date.strftime('%Y%m%d')}_"
+            "MemberReport.txt"
+        )
+        self.file = open(self.filename, 'w')
+        self.file.write(
+            "╔═════════════════════════════════════════════════════╗\n"
+            "║                Chocoholics Anonymous                ║\n"
+            "╚═════════════════════════════════════════════════════╝\n"
+            "Member Weekly Report\n\n"
+            "Member Information:\n"
+            f"  Name:     {name}\n"
+            f"  Number:   {number:09}\n"
+            f"  Street:   {street_address}\n"
+            f"  City:     {city}\n"
+            f"  State:    {state}\n"
+            f"  ZIP Code: {zip_code}\n\n"
+        )
+        self.file.write("Services:\n")
+
+    def write(self, service_date, provider_name, service_name):
+        self.file.write(
+            f"Date of service: {service_date.strftime('%m-%d-%Y')}\n"
+            f"Provider name: {provider_name}\n"
+            f"Service name: {service_name}\n\n"
+        )
+
+    def end(self):
+        self.file.close()
+        self.file = None
+        return self.filename
+
+
+class EFTWriter:
+    """
+    Writes the EFT data file line by line as provider totals arrive.
+    """
+    def __init__(self, reports_dir, end_date):
+        self.filename = os.path.join(
+            reports_dir,
+            f"EFT_Data_{end_date.strftime('%Y%m%d')}.txt"
+        )
+        self.file = open(self.filename, 'w')
+        self.file.write("provider_name,provider_number,amount\n")
+
+    def add(self, provider_number, provider_name, fee_total_cents):
+        self.file.write(f"{provider_name},"
+                        f"{provider_number:09},"
+                        f"{format_cents(fee_total_cents)}\n"
+        )
+
+    def close(self):
+        self.file.close()
+        return self.filename
+
+
+class SummaryAccumulator:
+    """
+    Writes the accounts payable summary report. Each provider line is written
+    as it arrives and only the running grand totals are kept for the footer.
+    """
+    def __init__(self, reports_dir, start_date, end_date):
+        self.provider_total = 0
+        self.consultation_total = 0
+        self.fee_grand_total_cents = 0
+        self.filename = os.path.join(
+            reports_dir,
+            "Manager_Summary_"
+            f"{end_date.strftime('%Y%m%d')}.txt"
+        )
+        self.file = open(self.filename, 'w')
+        self.file.write(
+            "╔═════════════════════════════════════════════════════╗\n"
+            "║                Chocoholics Anonymous                ║\n"
+            "╚═════════════════════════════════════════════════════╝\n"
+            "Accounts Payable Weekly Summary Report\n"
+            f"Week of {start_date.strftime('%m-%d-%Y')}\n\n"
+            "────────────┬───────────────────────────┬───────┬────────────\n"
+            " PROVIDER # │ PROVIDER NAME             │ CONS¹ │ FEE TOTAL\n"
+            "────────────┼───────────────────────────┼───────┼────────────\n"
+        )
+
+    def add(self, provider_number, provider_name, record_count, fee_total_cents):
+        self.file.write(
+            f" {provider_number:09}  "
+            f"│ {provider_name:<25} "
+            f"│  {record_count:>3}  "
+            f"│ ${format_cents(fee_total_cents):>8}\n"
+        )
+        self.provider_total += 1
+        self.consultation_total += record_count
+        self.fee_grand_total_cents += fee_total_cents
+
+    def close(self):
+        self.file.write(
+            "────────────┴───────────────────────────┴───────┴────────────\n"
+            " ¹: Consultationss\n\n"
+            f"Total Providers...................... {self.provider_total}\n"
+            f"Total Consultations.................. {self.consultation_total}\n"
+            f"Total Fees........................... $ {format_cents(self.fee_grand_total_cents)}\n"
+        )
+        self.file.close()
+        return self.filename
+
+
+def render_shard(db_url, reports_dir, batch_size, start_date, end_date, kind, id_range):
+    """
+    Worker process entry point for parallel accounting runs. Opens a read-only
+    engine on db_url and renders the provider or member reports whose ids fall
+    in id_range into reports_dir, returning the rendered results in id order.
+    """
+    db_manager = DatabaseManager(db_url, read_only=True)
+    engine = AccountingEngine(db_manager, reports_dir, batch_size)
+    try:
+        with db_manager.get_session() as session:
+            if kind == 'providers':
+                return list(engine.render_providers(session, start_date, end_date, id_range))
+            return list(engine.render_members(session, start_date, end_date, id_range))
+    finally:
+        db_manager.close()
+
+
+class AccountingEngine:
+    """
+    Runs the weekly accounting procedure from ordered streams of the week's
+    service records instead of one query per provider and member.
+
+    The provider stream is ordered by provider and feeds the provider report
+    writer, the EFT writer and the summary accumulator. Member reports need
+    the records in member order, so they are fed by a second ordered stream.
+    Rows are fetched in batches of ACCOUNTING_STREAM_BATCH_SIZE and every
+    writer works on one provider or member at a time, so memory use does not
+    grow with the number of members or records. Service names and fees are
+    the ones stored on each service record when it was entered, so services
+    is never read; records without them (whose service was already gone when
+    the columns were backfilled) are skipped. Fees are integer cents, so the
+    totals added up while streaming are exact.
+
+    With more than one worker, providers and members are split into id range
+    shards that are rendered in a process pool. The EFT data and summary are
+    merged in the parent in provider id order, so the output is the same for
+    any number of workers.
+    """
+    def __init__(self, db_manager, reports_dir, batch_size=None):
+        self.db_manager = db_manager
+        self.reports_dir = reports_dir
+        self.batch_size = batch_size if batch_size is not None else ACCOUNTING_STREAM_BATCH_SIZE
+
+    def provider_stream(self, start_date, end_date, id_range=None):
+        """
+        Every provider joined to its service records from start_date through
+        end_date, ordered by provider and date of service. Providers without
+        records appear once with NULL record columns so they still receive an
+        EFT line.
+        Tombstoned providers are left out, though their records still appear
+        on the reports of the members they served.
+        """
+        stmt = select(
+            Provider.id,
+            Provider.name,
+            Provider.street_address,
+            Provider.city,
+            Provider.state,
+            Provider.zip_code,
+            ServiceRecord.id,
+            ServiceRecord.service_date,
+            ServiceRecord.timestamp,
+            ServiceRecord.member_id,
+            Member.name,
+            ServiceRecord.service_id,
+            ServiceRecord.service_fee_cents
+        ).select_from(Provider).outerjoin(
+            ServiceRecord, and_(
+                ServiceRecord.provider_id == Provider.id,
+                ServiceRecord.service_date >= start_date,
+                ServiceRecord.service_date <= end_date
+            )
+        ).outerjoin(
+            Member, Member.id == ServiceRecord.member_id
+        ).where(Provider.deleted_at.is_(None))
+        if id_range is not None:
+            stmt = stmt.where(Provider.id >= id_range[0], Provider.id < id_range[1])
+        return stmt.order_by(
+            Provider.id, ServiceRecord.service_date, ServiceRecord.id
+        ).execution_options(yield_per=self.batch_size)
+
+    def member_stream(self, start_date, end_date, id_range=None):
+        """
+        Members with service records from start_date through end_date joined
+        to the provider of each record, ordered by member and date of service.
+        Tombstoned members are left out.
+        """
+        stmt = select(
+            Member.id,
+            Member.name,
+            Member.street_address,
+            Member.city,
+            Member.state,
+            Member.zip_code,
+            ServiceRecord.service_date,
+            Provider.name,
+            ServiceRecord.service_name
+        ).select_from(ServiceRecord).join(
+            Member, Member.id == ServiceRecord.member_id
+        ).join(
+            Provider, Provider.id == ServiceRecord.provider_id
+        ).where(
+            ServiceRecord.service_date >= start_date,
+            ServiceRecord.service_date <= end_date,
+            ServiceRecord.service_name.isnot(None),
+            Member.deleted_at.is_(None)
+        )
+        if id_range is not None:
+            stmt = stmt.where(Member.id >= id_range[0], Member.id < id_range[1])
+        return stmt.order_by(
+            Member.id, ServiceRecord.service_date, ServiceRecord.id
+        ).execution_options(yield_per=self.batch_size)
+
+    def render_providers(self, session, start_date, end_date, id_range=None):
+        """
+        Writes a report for every provider with records in the period.
+        Yields (provider_id, provider_name, record_count, fee_total_cents,
+        report_filename) for every provider in id order; report_filename is
+        None for providers without records.
+        """
+        writer = ProviderReportWriter(self.reports_dir, start_date, end_date)
+        current_provider = None
+        current_name = None
+        for row in session.execute(self.provider_stream(start_date, end_date, id_range)):
+            (provider_id, provider_name, street_address, city, state,
+             zip_code, record_id, service_date, timestamp, member_id,
+             member_name, service_id, service_fee_cents) = row
+            if provider_id != current_provider:
+                if current_provider is not None:
+                    yield self.finish_provider(writer, current_provider, current_name)
+                current_provider = provider_id
+                current_name = provider_name
+            if record_id is None or service_fee_cents is None:
+                continue
+            if writer.file is None:
+                writer.begin(provider_id, provider_name, street_address,
+                             city, state, zip_code)
+            writer.write(service_date, timestamp, member_name, member_id,
+                         service_id, service_fee_cents)
+        if current_provider is not None:
+            yield self.finish_provider(writer, current_provider, current_name)
+
+    def render_members(self, session, start_date, end_date, id_range=None):
+        """
+        Writes a report for every member with records in the period and
+        yields the report filenames in member id order.
+        """
+        writer = MemberReportWriter(self.reports_dir, end_date)
+        current_member = None
+        for row in session.execute(self.member_stream(start_date, end_date, id_range)):
+            (member_id, member_name, street_address, city, state,
+             zip_code, service_date, provider_name, service_name) = row
+            if member_id != current_member:
+                if current_member is not None:
+                    yield writer.end()
+                current_member = member_id
+                writer.begin(member_id, member_name, street_address,
+                             city, state, zip_code)
+            writer.write(service_date, provider_name, service_name)
+        if current_member is not None:
+            yield writer.end()
+
+    @staticmethod
+    def finish_provider(writer, provider_id, provider_name):
+        """
+        Closes the current provider's report, if it had any records, and
+        returns its totals.
+        """
+        if writer.file is None:
+            return provider_id, provider_name, 0, 0, None
+        record_count = writer.record_count
+        fee_total_cents = writer.total_weekly_fee_cents
+        return provider_id, provider_name, record_count, fee_total_cents, writer.end()
+
+    def run(self, start_date, end_date, workers=None):
+        """
+        Generates every provider report, member report, the EFT data and the
+        summary report for services from start_date through end_date.
+        workers defaults to ACCOUNTING_WORKERS; in-memory databases are
+        always run serially.
+        """
+        workers = workers if workers is not None else ACCOUNTING_WORKERS
+        if workers > 1 and not self.db_manager.is_memory_database():
+            provider_results, member_reports = self.render_parallel(
+                start_date, end_date, workers
+            )
+            self.write_totals(provider_results, member_reports, start_date, end_date)
+        else:
+            with self.db_manager.get_session() as session:
+                self.write_totals(
+                    self.render_providers(session, start_date, end_date),
+                    self.render_members(session, start_date, end_date),
+                    start_date,
+                    end_date
+                )
+
+    def write_totals(self, provider_results, member_reports, start_date, end_date):
+        """
+        Consumes the rendered provider and member results in id order and
+        writes the EFT data and summary report from the provider totals.
+        """
+        eft_writer = EFTWriter(self.reports_dir, end_date)
+        summary = SummaryAccumulator(self.reports_dir, start_date, end_date)
+        for provider_id, provider_name, record_count, fee_total_cents, filename in provider_results:
+            eft_writer.add(provider_id, provider_name, fee_total_cents)
+            if filename is None:
+                continue
+            print(f"Provider report generated: {filename}")
+            summary.add(provider_id, provider_name, record_count, fee_total_cents)
+        for filename in member_reports:
+            print(f"Member report generated: {filename}")
+        print(f"EFT data generated: {eft_writer.close()}")
+        print(f"Summary report generated: {summary.close()}")
+
+    def render_parallel(self, start_date, end_date, workers):
+        """
+        Renders provider and member reports in a pool of worker processes.
+        Each shard writes into its own staging directory; the reports are then
+        moved into reports_dir in id order, so a later id wins a filename clash
+        exactly as it does in a serial run.
+        """
+        with self.db_manager.get_session() as session:
+            provider_shards = self.shard_ranges(session, Provider.id, workers)
+            member_shards = self.shard_ranges(session, Member.id, workers)
+
+        staging_dir = tempfile.mkdtemp(prefix=".accounting_", dir=self.reports_dir)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                provider_futures = []
+                member_futures = []
+                for index, id_range in enumerate(provider_shards):
+                    provider_futures.append(executor.submit(
+                        render_shard, self.db_manager.db_url,
+                        self.shard_dir(staging_dir, 'providers', index),
+                        self.batch_size, start_date, end_date, 'providers', id_range
+                    ))
+                for index, id_range in enumerate(member_shards):
+                    member_futures.append(executor.submit(
+                        render_shard, self.db_manager.db_url,
+                        self.shard_dir(staging_dir, 'members', index),
+                        self.batch_size, start_date, end_date, 'members', id_range
+                    ))
+
+                provider_results = []
+                for future in provider_futures:
+                    for provider_id, provider_name, record_count, fee_total_cents, filename in future.result():
+                        if filename is not None:
+                            filename = self.publish(filename)
+                        provider_results.append(
+                            (provider_id, provider_name, record_count, fee_total_cents, filename)
+                        )
+                member_reports = []
+                for future in member_futures:
+                    for filename in future.result():
+                        member_reports.append(self.publish(filename))
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return provider_results, member_reports
+
+    def publish(self, filename):
+        """
+        Moves a report rendered in a staging directory into reports_dir.
+        """
+        published = os.path.join(self.reports_dir, os.path.basename(filename))
+        os.replace(filename, published)
+        return published
+
+    @staticmethod
+    def shard_dir(staging_dir, kind, index):
+        path = os.path.join(staging_dir, f"{kind}_{index}")
+        os.makedirs(path)
+        return path
+
+    @staticmethod
+    def shard_ranges(session, id_column, shards):
+        """
+        Splits the ids of id_column into at most `shards` contiguous
+        [start, stop) ranges.
+        """
+        low, high = session.query(func.min(id_column), func.max(id_column)).one()
+        if low is None:
+            return []
+        step = max(1, -(-(high - low + 1) // shards))
+        return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
@@ -1,24 +1,159 @@
 from contextlib import contextmanager
+from threading import Lock
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import literal
+from sqlalchemy import tuple_
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from chocan_software.models import Base
-from chocan_software.constants import DATABASE_URL
+from sqlalchemy.pool import StaticPool
+from chocan_software.data_managers.migrations import upgrade_schema
+from chocan_software.data_managers.sql_instrumentation import SQLInstrumentation
+from chocan_software.constants import (
+    DATABASE_URL,
+    DATABASE_PROFILE,
+    DATABASE_PROFILES,
+    KEYSET_PAGE_SIZE,
+    SQL_INSTRUMENTATION
+)
 
 
 class DatabaseManager:
     """
     Handles database setup and provides sessions for database operations.
+
+    DatabaseManagers opened on the same file-backed database (with the same
+    mode and profile) share one engine, session factory and set of caches,
+    so building several managers or terminals in one process costs one
+    connection pool and one schema check. In-memory databases are private to
+    their DatabaseManager.
     """
-    def __init__(self, db_url=None):
+    # (db_url, read_only, profile) -> (engine, Session, caches)
+    shared = {}
+    shared_lock = Lock()
+
+    def __init__(self, db_url=None, read_only=False, profile=None, instrumentation=None):
         """
         Initialize the database manager with the provided database URL.
         Otherwise, defaults to the DATABASE_URL from constants file.
+        read_only (bool): Open a file-backed SQLite database in read-only mode
+                          and skip schema creation.
+        profile (str): Name of the engine profile in DATABASE_PROFILES.
+                       Defaults to DATABASE_PROFILE.
+        instrumentation (SQLInstrumentation): Records the statements run on
+                       this database. If SQL_INSTRUMENTATION is set, defaults
+                       to the process-wide instance; otherwise off.
         """
-        self.engine = create_engine(db_url if db_url is not None else DATABASE_URL)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.db_url = db_url if db_url is not None else DATABASE_URL
+        self.read_only = read_only
+        self.profile_name = profile if profile is not None else DATABASE_PROFILE
+        self.profile = DATABASE_PROFILES[self.profile_name]
+        if self.is_memory_database():
+            self.engine, self.Session, self.caches = self.open()
+        else:
+            key = (self.db_url, read_only, self.profile_name)
+            with self.shared_lock:
+                if key not in self.shared:
+                    self.shared[key] = self.open()
+                self.engine, self.Session, self.caches = self.shared[key]
+        if instrumentation is None and SQL_INSTRUMENTATION:
+            instrumentation = SQLInstrumentation.shared()
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self)
         # self.Session = sessionmaker(bind=self.engine)  # w/o autocommit and autoflush set to False
 
+    def open(self):
+        """
+        Creates the engine, session factory and cache dict for this database,
+        bringing the schema up to date unless it is opened read-only.
+        """
+        if self.read_only and not self.is_memory_database():
+            url = make_url(self.db_url)
+            url = url.set(
+                database=f"file:{url.database}",
+                query={**url.query, "mode": "ro", "uri": "true"}
+            )
+            engine = create_engine(url, **self.engine_options())
+            event.listen(engine, "connect", self.apply_pragmas)
+        else:
+            engine = create_engine(self.db_url, **self.engine_options())
+            event.listen(engine, "connect", self.apply_pragmas)
+            upgrade_schema(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return engine, Session, {}
+
+    def close(self):
+        """
+        Closes the engine's connections and stops sharing it, so the next
+        DatabaseManager for this database opens (and checks) it afresh, e.g.
+        after the file has been replaced.
+        """
+        with self.shared_lock:
+            for key, (engine, _, _) in list(self.shared.items()):
+                if engine is self.engine:
+                    del self.shared[key]
+        self.engine.dispose()
+
+    def is_memory_database(self):
+        """
+        Whether db_url points at a private in-memory SQLite database, which
+        cannot be shared with other connections or processes.
+        """
+        database = make_url(self.db_url).database
+        return database in (None, "", ":memory:")
+
+    def engine_options(self):
+        """
+        Pool settings for create_engine. An in-memory database only exists
+        inside its one connection, so every thread shares a single connection.
+        File-backed databases get a connection pool sized by the profile.
+        """
+        if self.is_memory_database():
+            return {
+                "poolclass": StaticPool,
+                "connect_args": {"check_same_thread": False},
+            }
+        return {
+            "pool_size": self.profile["pool_size"],
+            "max_overflow": self.profile["max_overflow"],
+        }
+
+    def apply_pragmas(self, dbapi_connection, connection_record):
+        """
+        Applies the profile's PRAGMAs to each new SQLite connection. The
+        journal mode is stored in the database file, so it is left alone on
+        read-only connections. busy_timeout goes first so the others wait for
+        a busy database instead of failing with "database is locked".
+        """
+        pragmas = sorted(
+            self.profile["pragmas"].items(),
+            key=lambda pragma: pragma[0] != "busy_timeout"
+        )
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            if pragma == "journal_mode":
+                # Persistent, and switching it needs an exclusive lock, so
+                # only switch when the database is not already in this mode
+                if self.read_only:
+                    continue
+                current = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+                if current.lower() == str(value).lower():
+                    continue
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+    def get_cache(self, name, factory):
+        """
+        Returns the in-process cache registered under name, creating it with
+        factory() on first use. Caches are kept per database so every manager
+        sharing this DatabaseManager sees (and invalidates) the same entries.
+        """
+        cache = self.caches.get(name)
+        if cache is None:
+            cache = self.caches.setdefault(name, factory())
+        return cache
+
     @contextmanager
     def get_session(self, commit=False):
         """
@@ -36,3 +171,30 @@ class DatabaseManager:
             raise e
         finally:
             session.close()  # Always close the session
+
+    def iter_keyset(self, statement, keys, batch_size=None):
+        """
+        Yields the rows of a select statement ordered by the key columns,
+        which must be selected and unique together, e.g. (service_date, id).
+        Rows are read batch_size at a time (defaults to KEYSET_PAGE_SIZE),
+        each page with its own short session that resumes after the last key
+        of the previous page, so no cursor or read transaction is held open
+        while the caller works through the rows and memory use stays flat.
+        """
+        batch_size = batch_size if batch_size is not None else KEYSET_PAGE_SIZE
+        last_key = None
+        while True:
+            page = statement
+            if last_key is not None:
+                if len(keys) == 1:
+                    page = page.where(keys[0] > last_key[0])
+                else:
+                    page = page.where(tuple_(*keys) > tuple_(*(
+                        literal(value, key.type) for key, value in zip(keys, last_key)
+                    )))
+            with self.get_session() as session:
+                rows = session.execute(page.order_by(*keys).limit(batch_size)).all()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_key = tuple(getattr(rows[-1], key.key) for key in keys)
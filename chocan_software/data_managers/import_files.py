@@ -0,0 +1,33 @@
+# This module reads the CSV and JSONL files of the bulk imports.
+"""
+Service record imports and roster syncs both take either a CSV file with a
+header row or a JSONL file with one object per line, and report rejected
+rows by the line they came from.
+"""
+import csv
+import json
+import os
+
+JSONL_EXTENSIONS = ('.jsonl', '.json', '.ndjson')
+
+
+def read_import_file(file_path):
+    """
+    Yields (line_number, row_dict) for each row of a CSV or JSONL file,
+    chosen by the file extension.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    with open(file_path, newline='') as file:
+        if extension in JSONL_EXTENSIONS:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else {}
+        else:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
@@ -0,0 +1,185 @@
+# This module upgrades existing databases to the current schema.
+"""
+Base.metadata.create_all only creates missing tables, so changes to tables
+that already exist in a chocan.db file are applied here. The schema version
+of a database is kept in SQLite's PRAGMA user_version, and each migration
+runs once, in order, for databases older than its version. Migrations must
+also be safe to run on a database that create_all has just built.
+
+Opening a database that is already at SCHEMA_VERSION only reads its
+user_version; create_all and the migrations run only when it is behind.
+"""
+from sqlalchemy import MetaData
+from chocan_software.models import Base
+from chocan_software.models import Member
+from chocan_software.models import MemberWeeklyRollup
+from chocan_software.models import Provider
+from chocan_software.models import ProviderWeeklyRollup
+from chocan_software.models import Service
+from chocan_software.models import ServiceRecord
+from chocan_software.data_managers.person_search import create_search_indexes
+from chocan_software.data_managers.person_search import rebuild_search_index
+from chocan_software.data_managers.rollup_manager import add_rollups_since
+from chocan_software.constants import SERVICE_NAME_MAX_LEN
+
+
+def add_service_record_indexes(connection):
+    """
+    Version 1: indexes on (provider_id, service_date), (member_id,
+    service_date) and service_date for the report queries.
+    """
+    for index in ServiceRecord.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def add_weekly_rollups(connection):
+    """
+    Version 2: provider and member weekly rollup tables. They are populated
+    by version 4, once service records carry their fees in cents.
+    """
+    for model in (ProviderWeeklyRollup, MemberWeeklyRollup):
+        model.__table__.create(connection, checkfirst=True)
+
+
+def add_service_record_fee_snapshot(connection):
+    """
+    Version 3: service_name and service_fee columns on service_records,
+    backfilled from the current services. Records whose service no longer
+    exists are left without a name and fee and are skipped by the reports,
+    as before. Version 4 converts the fees to cents.
+    """
+    if "service_name" in table_columns(connection, "service_records"):
+        return
+    connection.exec_driver_sql(
+        f"ALTER TABLE service_records ADD COLUMN service_name VARCHAR({SERVICE_NAME_MAX_LEN})"
+    )
+    connection.exec_driver_sql("ALTER TABLE service_records ADD COLUMN service_fee FLOAT")
+    connection.exec_driver_sql(
+        "UPDATE service_records SET "
+        "service_name = (SELECT name FROM services WHERE services.id = service_records.service_id), "
+        "service_fee = (SELECT fee FROM services WHERE services.id = service_records.service_id)"
+    )
+
+
+def store_fees_in_cents(connection):
+    """
+    Version 4: fees and fee totals as integer cents. services.fee becomes
+    fee_cents, which needs the table rebuilt as the fee is part of its
+    constraints, service_records.service_fee becomes service_fee_cents, and
+    the weekly rollups are recreated and rebuilt from the records.
+    """
+    if "fee" in table_columns(connection, "services"):
+        services = Service.__table__.to_metadata(MetaData(), name="services_new")
+        services.create(connection)
+        connection.exec_driver_sql(
+            "INSERT INTO services_new (id, name, fee_cents) "
+            "SELECT id, name, CAST(round(fee * 100) AS INTEGER) FROM services"
+        )
+        connection.exec_driver_sql("DROP TABLE services")
+        connection.exec_driver_sql("ALTER TABLE services_new RENAME TO services")
+
+    if "service_fee" in table_columns(connection, "service_records"):
+        connection.exec_driver_sql(
+            "ALTER TABLE service_records ADD COLUMN service_fee_cents INTEGER"
+        )
+        connection.exec_driver_sql(
+            "UPDATE service_records "
+            "SET service_fee_cents = CAST(round(service_fee * 100) AS INTEGER) "
+            "WHERE service_fee IS NOT NULL"
+        )
+        connection.exec_driver_sql("ALTER TABLE service_records DROP COLUMN service_fee")
+
+    for model in (ProviderWeeklyRollup, MemberWeeklyRollup):
+        model.__table__.drop(connection, checkfirst=True)
+        model.__table__.create(connection)
+    add_rollups_since(connection)
+
+
+def add_person_search_indexes(connection):
+    """
+    Version 5: trigram search indexes over the member and provider rosters,
+    built from the existing rows.
+    """
+    create_search_indexes(connection)
+    for model in (Member, Provider):
+        rebuild_search_index(connection, model)
+
+
+def authorize_billed_services(connection):
+    """
+    Version 6: service authorizations are now enforced, so each provider is
+    authorized for every service they have already billed. Other
+    authorizations are added with add_provider_service as before.
+    """
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO provider_services (provider_id, service_id) "
+        "SELECT DISTINCT provider_id, service_id FROM service_records "
+        "WHERE provider_id IN (SELECT id FROM providers) "
+        "AND service_id IN (SELECT id FROM services)"
+    )
+
+
+def add_person_tombstones(connection):
+    """
+    Version 7: deleted_at columns on members and providers, set when an
+    account is deactivated with a tombstone. Existing accounts are live.
+    """
+    for table in ("members", "providers"):
+        if "deleted_at" not in table_columns(connection, table):
+            connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN deleted_at DATETIME")
+
+
+MIGRATIONS = [
+    (1, add_service_record_indexes),
+    (2, add_weekly_rollups),
+    (3, add_service_record_fee_snapshot),
+    (4, store_fees_in_cents),
+    (5, add_person_search_indexes),
+    (6, authorize_billed_services),
+    (7, add_person_tombstones),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def table_columns(connection, table):
+    return {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def get_schema_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def has_tables(connection):
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' LIMIT 1"
+    ).first() is not None
+
+
+def upgrade_schema(engine):
+    """
+    Brings the database up to SCHEMA_VERSION. A current database costs one
+    PRAGMA read. An empty one is built with create_all (plus the search
+    indexes, which are not in the metadata) and stamped with SCHEMA_VERSION
+    directly, since it already has the latest schema; an
+    older one gets create_all for any missing tables and then every
+    migration newer than its version.
+    """
+    with engine.connect() as connection:
+        if get_schema_version(connection) >= SCHEMA_VERSION:
+            return
+    with engine.begin() as connection:
+        # Checked again in case another process upgraded it in the meantime
+        version = get_schema_version(connection)
+        if version >= SCHEMA_VERSION:
+            return
+        if not has_tables(connection):
+            Base.metadata.create_all(connection)
+            create_search_indexes(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            return
+        Base.metadata.create_all(connection)
+        for target_version, migration in MIGRATIONS:
+            if version < target_version:
+                migration(connection)
+                connection.exec_driver_sql(f"PRAGMA user_version = {target_version}")
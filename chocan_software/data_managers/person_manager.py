@@ -1,14 +1,35 @@
 from abc import ABC
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy import update
 from chocan_software.models import Member
 from chocan_software.models import Provider
 from chocan_software.models import ProviderService
-from chocan_software.models import Service
 from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.person_search import rebuild_search_index
+from chocan_software.data_managers.person_search import search_page
+from chocan_software.data_managers.rollup_manager import apply_rollups_where
+from chocan_software.data_managers.roster_sync import RosterSync
+from chocan_software.data_managers.service_authorizations import ServiceAuthorizations
+from chocan_software.data_managers.service_catalog import ServiceCatalog
+from chocan_software.data_managers.rows import ROW_TYPES
+from chocan_software.data_managers.rows import select_rows
+from chocan_software.data_managers.rows import to_row
+from chocan_software.data_managers.validation_cache import ValidationCache
 from chocan_software.constants import (
+    DELETE_BATCH_SIZE,
     MEMBER_STATUS_ACTIVE,
-    MEMBER_STATUS_SUSPENDED
+    MEMBER_STATUS_SUSPENDED,
+    SEARCH_PAGE_SIZE
 )
 
+# The service_records column referring to each kind of person, and the other
+# tables whose rows go with the person when they are deleted
+PERSON_REFERENCES = {
+    Member: ("member_id", ["member_weekly_rollups"]),
+    Provider: ("provider_id", ["provider_weekly_rollups", "provider_services"]),
+}
+
 
 class PersonManager(ABC):
     """
@@ -36,7 +57,7 @@ class PersonManager(ABC):
         person_id = int(person_number)  # converting to int strips leading zeroes
         with self.db_manager.get_session(commit=True) as session:
             person = session.query(person_class).filter_by(
-                id=person_id
+                id=person_id, deleted_at=None
             ).first()
             if not person:
                 print(f"\n{person_class.__name__.lower()} with id {person_id:09} not found.")
@@ -47,44 +68,180 @@ class PersonManager(ABC):
                     setattr(person, key, value)
                     
             print(f"\nUpdated {person_class.__name__.lower()}.")
+        # Invalidate after the commit so a suspension takes effect immediately
+        self.get_validation_cache(person_class).invalidate(person_id)
 
-    def delete_person(self, person_class, person_number):
+    def delete_person(self, person_class, person_number, tombstone=False, batch_size=None):
+        """
+        Deletes a member or provider. With tombstone set the account is only
+        marked deleted, with one UPDATE: lookups, searches, imports and
+        reports skip it from then on and its service records are kept.
+        Otherwise the person is deleted along with their service records,
+        weekly rollup rows and (for providers) service authorizations; the
+        records are deleted batch_size (defaults to DELETE_BATCH_SIZE) at a
+        time and taken out of the rollups as they go, one transaction per
+        batch. Tombstoned persons can still be deleted this way.
+        Returns True if the person was found.
+        """
         person_id = int(person_number)  # converting to int strips leading zeroes
-        with self.db_manager.get_session(commit=True) as session:
-            person = session.query(person_class).filter_by(
-                id=person_id
-            ).first()
-            if not person:
-                print(f"\n{person_class.__name__.lower()} with id {person_id:09} not found.")
-                return
-
-            session.delete(person)
+        if tombstone:
+            with self.db_manager.get_session(commit=True) as session:
+                found = session.execute(
+                    update(person_class).where(
+                        person_class.id == person_id, person_class.deleted_at.is_(None)
+                    ).values(deleted_at=datetime.now())
+                ).rowcount > 0
+        else:
+            found = self.delete_person_rows(person_class, person_id, batch_size)
+        self.get_validation_cache(person_class).invalidate(person_id)
+        if not found:
+            print(f"\n{person_class.__name__.lower()} with id {person_id:09} not found.")
+        elif tombstone:
+            print(f"\nDeactivated {person_class.__name__.lower()}.")
+        else:
             print(f"\nDeleted {person_class.__name__.lower()}.")
+        return found
+
+    def delete_person_rows(self, person_class, person_id, batch_size=None):
+        """
+        Deletes a person and every row referring to them with set-based
+        statements, never loading the service records. Full batches of
+        records are deleted first, each in its own transaction so the write
+        lock is released between them; the last transaction deletes the
+        person before the remaining records, so no record can be added for
+        them once it has begun. Returns False if there is no such person.
+        """
+        batch_size = batch_size if batch_size is not None else DELETE_BATCH_SIZE
+        table = person_class.__tablename__
+        key, dependents = PERSON_REFERENCES[person_class]
+        with self.db_manager.get_session() as session:
+            if session.execute(select(person_class.id).where(person_class.id == person_id)).first() is None:
+                return False
+
+        while True:
+            with self.db_manager.get_session(commit=True) as session:
+                connection = session.connection()
+                record_ids = tuple(connection.exec_driver_sql(
+                    f"SELECT id FROM service_records WHERE {key} = ? LIMIT ?",
+                    (person_id, batch_size)
+                ).scalars())
+                if len(record_ids) < batch_size:
+                    break
+                where = f"service_records.id IN ({', '.join('?' for _ in record_ids)})"
+                apply_rollups_where(connection, where, record_ids, remove=True)
+                connection.exec_driver_sql(f"DELETE FROM service_records WHERE {where}", record_ids)
+
+        with self.db_manager.get_session(commit=True) as session:
+            connection = session.connection()
+            found = connection.exec_driver_sql(
+                f"DELETE FROM {table} WHERE id = ?", (person_id,)
+            ).rowcount > 0
+            where = f"service_records.{key} = ?"
+            apply_rollups_where(connection, where, (person_id,), remove=True)
+            connection.exec_driver_sql(f"DELETE FROM service_records WHERE {where}", (person_id,))
+            for dependent in dependents:
+                connection.exec_driver_sql(f"DELETE FROM {dependent} WHERE {key} = ?", (person_id,))
+        return found
 
     def get_person(self, person_class, person_number):
+        """
+        Looks up a person by number as a MemberRow or ProviderRow, serving
+        repeat lookups from the validation cache. Tombstoned persons are not
+        found. Only existing persons are cached.
+        """
         person_id = int(person_number)  # int conversion to strip leading zeroes
-        with self.db_manager.get_session() as session:
-            person = session.query(person_class).filter_by(
-                id=person_id
-            ).first()
+        cache = self.get_validation_cache(person_class)
+        person = cache.get(person_id)
+        if person is not None:
             return person
+        with self.db_manager.get_session() as session:
+            person = to_row(person_class, session.execute(
+                select_rows(person_class).where(
+                    person_class.id == person_id, person_class.deleted_at.is_(None)
+                )
+            ).first())
+        if person is not None:
+            cache.put(person_id, person)
+        return person
 
     def is_valid(self, person_class, person_number):
-        person_id = int(person_number)  # int conversion to strip leading zeroes
-        with self.db_manager.get_session() as session:
-            person = session.query(person_class).filter_by(
-                id=person_id
-            ).first()
-            return person
+        return self.get_person(person_class, person_number)
+
+    def get_validation_cache(self, person_class):
+        return self.db_manager.get_cache(
+            f"{person_class.__tablename__}_validation", ValidationCache
+        )
         
+    def iter_persons(self, person_class, batch_size=None):
+        """
+        Yields every member or provider that is not tombstoned as a MemberRow
+        or ProviderRow in id order, batch_size rows per query.
+        """
+        row_type = ROW_TYPES[person_class]
+        return map(row_type._make, self.db_manager.iter_keyset(
+            select_rows(person_class).where(person_class.deleted_at.is_(None)),
+            [person_class.id], batch_size
+        ))
+
     def view_persons(self, person_class):
+        found = False
+        for person in self.iter_persons(person_class):
+            found = True
+            print(f"  {person.id:09}: {person.name}")
+        if not found:
+            print(f"\nNo {person_class.__name__.lower()}s found.")
+
+    def search_persons(self, person_class, query, page=1, page_size=None, fuzzy=False):
+        """
+        Searches members or providers by any part of their name, street
+        address or city (see person_search) and returns one page of
+        MemberRow or ProviderRow matches, best match first. Pages count from
+        1 and hold page_size matches (defaults to SEARCH_PAGE_SIZE).
+        """
+        page_size = page_size if page_size is not None else SEARCH_PAGE_SIZE
         with self.db_manager.get_session() as session:
-            persons = session.query(person_class).all()
-            if not persons:
-                print(f"\nNo {person_class.__name__.lower()}s found.")
-            else:
-                for person in persons:
-                    print(f"  {person.id:09}: {person.name}")
+            rows = search_page(
+                session, person_class, query, (page - 1) * page_size, page_size, fuzzy
+            )
+        return [to_row(person_class, row) for row in rows]
+
+    def view_search_results(self, person_class, query, page=1, fuzzy=False):
+        """
+        Prints one page of search matches. If a first page has no exact
+        matches, the closest fuzzy matches are shown instead.
+        """
+        persons = self.search_persons(person_class, query, page, fuzzy=fuzzy)
+        if not persons and page == 1 and not fuzzy:
+            persons = self.search_persons(person_class, query, page, fuzzy=True)
+            if persons:
+                print("No exact matches. Closest matches:")
+        for person in persons:
+            print(f"  {person.id:09}: {person.name}, {person.street_address}, {person.city}")
+        if not persons:
+            print(f"\nNo matching {person_class.__name__.lower()}s found.")
+        return persons
+
+    def rebuild_search(self, person_class):
+        """
+        Rebuilds the search index of the member or provider roster from the
+        table, e.g. after rows were changed with the triggers missing.
+        """
+        with self.db_manager.get_session(commit=True) as session:
+            rebuild_search_index(session.connection(), person_class)
+        print(f"\nRebuilt {person_class.__name__.lower()} search index.")
+
+    def sync_roster(self, person_class, file_path, rejects_path=None,
+                    suspend_missing=False, batch_size=None):
+        """
+        Brings the member or provider table in line with a full roster file
+        in one transaction (see RosterSync). Returns the Counter of changes.
+        """
+        changes = RosterSync(self.db_manager, batch_size).sync(
+            person_class, file_path, rejects_path, suspend_missing
+        )
+        # Suspensions and address changes take effect at the terminals at once
+        self.get_validation_cache(person_class).clear()
+        return changes
 
 
 # Handles the management of ChocAn members
@@ -98,8 +255,8 @@ class MemberManager(PersonManager):
     def update_member(self, member_number, **kwargs):
         super().update_person(Member, member_number, **kwargs)
 
-    def delete_member(self, member_number):
-        super().delete_person(Member, member_number)
+    def delete_member(self, member_number, tombstone=False, batch_size=None):
+        return super().delete_person(Member, member_number, tombstone, batch_size)
 
     def get_member(self, member_number):
         return super().get_person(Member, member_number)
@@ -117,14 +274,34 @@ class MemberManager(PersonManager):
         else:
             return None
         
+    def iter_members(self, batch_size=None):
+        return super().iter_persons(Member, batch_size)
+
     def view_members(self):
         super().view_persons(Member)
 
+    def search_members(self, query, page=1, page_size=None, fuzzy=False):
+        return super().search_persons(Member, query, page, page_size, fuzzy)
+
+    def view_member_search(self, query, page=1, fuzzy=False):
+        return super().view_search_results(Member, query, page, fuzzy)
+
+    def rebuild_member_search(self):
+        super().rebuild_search(Member)
+
+    def sync_member_roster(self, file_path, rejects_path=None, suspend_missing=False, batch_size=None):
+        return super().sync_roster(Member, file_path, rejects_path, suspend_missing, batch_size)
+
+    def validation_cache_stats(self) -> dict:
+        return self.get_validation_cache(Member).stats()
+
 
 # Handles the management of ChocAn providers
 class ProviderManager(PersonManager):
     def __init__(self, db_manager):
         super().__init__(db_manager)
+        self.authorizations = ServiceAuthorizations.for_database(self.db_manager)
+        self.catalog = ServiceCatalog.for_database(self.db_manager)
 
     def add_provider(self, name, street_address, city, state, zip_code):
         super().add_person(Provider, name, street_address, city, state, zip_code)
@@ -132,8 +309,11 @@ class ProviderManager(PersonManager):
     def update_provider(self, provider_number, **kwargs):
         super().update_person(Provider, provider_number, **kwargs)
 
-    def delete_provider(self, provider_number):
-        super().delete_person(Provider, provider_number)
+    def delete_provider(self, provider_number, tombstone=False, batch_size=None):
+        found = super().delete_person(Provider, provider_number, tombstone, batch_size)
+        if found and not tombstone:
+            self.authorizations.bump_version()
+        return found
 
     def get_provider(self, provider_number):
         return super().get_person(Provider, provider_number)
@@ -141,17 +321,42 @@ class ProviderManager(PersonManager):
     def is_valid_provider(self, provider_number) -> bool:
         return super().is_valid(Provider, provider_number) is not None
 
+    def iter_providers(self, batch_size=None):
+        return super().iter_persons(Provider, batch_size)
+
     def view_providers(self):
         super().view_persons(Provider)
+
+    def search_providers(self, query, page=1, page_size=None, fuzzy=False):
+        return super().search_persons(Provider, query, page, page_size, fuzzy)
+
+    def view_provider_search(self, query, page=1, fuzzy=False):
+        return super().view_search_results(Provider, query, page, fuzzy)
+
+    def rebuild_provider_search(self):
+        super().rebuild_search(Provider)
+
+    def sync_provider_roster(self, file_path, rejects_path=None, batch_size=None):
+        return super().sync_roster(Provider, file_path, rejects_path, batch_size=batch_size)
+
+    def validation_cache_stats(self) -> dict:
+        return self.get_validation_cache(Provider).stats()
     
     def get_provider_services(self, provider_number):
-        provider_id = int(provider_number)
-        with self.db_manager.get_session() as session:
-            services = session.query(Service).join(ProviderService).filter(
-                ProviderService.provider_id == provider_id
-            ).all()
-            return services
-    
+        """
+        The ServiceRows of the services the provider may bill, in service
+        code order, from the authorization and catalog snapshots.
+        """
+        services = self.catalog.snapshot()
+        return [
+            services[service_id]
+            for service_id in self.authorizations.service_ids(int(provider_number))
+            if service_id in services
+        ]
+
+    def is_authorized_service(self, provider_number, service_code) -> bool:
+        return self.authorizations.is_authorized(int(provider_number), int(service_code))
+
     def add_provider_service(self, provider_number, service_code):
         provider_id = int(provider_number)
         service_id = int(service_code)
@@ -159,3 +364,4 @@ class ProviderManager(PersonManager):
             new_provider_service = ProviderService(provider_id, service_id)
             session.add(new_provider_service)
             print("\nAdded provider service.")
+        self.authorizations.bump_version()
@@ -0,0 +1,213 @@
+# This module defines the name and address search indexes for the rosters.
+"""
+Each roster table has an FTS5 index over name, street address and city using
+the trigram tokenizer, so any part of a word of three or more characters
+matches, case-insensitively ("ohn" finds "John", "Johnson" and "Bjohnsen").
+The indexes are external-content tables: they store only the trigrams and
+read the text itself from the roster table by rowid, which is the person's
+id. Triggers on the roster tables keep them in step with every insert,
+update and delete, whether it comes from PersonManager or a bulk load.
+
+The indexes are not part of Base.metadata, so they are created by
+create_search_indexes for new databases and by migration 5 for existing
+ones, and can be rebuilt from the roster tables with rebuild_search_index.
+"""
+from sqlalchemy import text
+from chocan_software.models import Member
+from chocan_software.models import Provider
+from chocan_software.data_managers.rows import ROW_TYPES
+
+SEARCH_COLUMNS = ['name', 'street_address', 'city']
+
+# In fuzzy searches a match in the name counts for more than one in the
+# address or city
+SEARCH_WEIGHTS = [10.0, 1.0, 1.0]
+
+# Trigram tokenizer: a term needs at least this many characters to use the index
+TRIGRAM_LEN = 3
+
+SEARCH_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+    "{columns}, content='{table}', content_rowid='id', tokenize='trigram')"
+)
+
+SEARCH_TRIGGER_SQL = [
+    "CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {index} (rowid, {columns}) VALUES (new.id, {new_values}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {index} ({index}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+    "INSERT INTO {index} ({index}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+    "INSERT INTO {index} (rowid, {columns}) VALUES (new.id, {new_values}); "
+    "END",
+]
+
+# Ranked search: rows of one tier in id order, which is the order FTS5
+# returns them in, so a page only reads as far into the index as it needs
+TIER_SQL = (
+    "SELECT {fields} FROM {index} JOIN {table} ON {table}.id = {index}.rowid "
+    "WHERE {where} ORDER BY {index}.rowid LIMIT :limit OFFSET :offset"
+)
+TIER_COUNT_SQL = (
+    "SELECT count(*) FROM {index} JOIN {table} ON {table}.id = {index}.rowid WHERE {where}"
+)
+
+# Fuzzy search: every row sharing a trigram with the query, scored by bm25
+FUZZY_SQL = (
+    "SELECT {fields} FROM {index} JOIN {table} ON {table}.id = {index}.rowid "
+    "WHERE {where} ORDER BY bm25({index}, {weights}), {table}.id "
+    "LIMIT :limit OFFSET :offset"
+)
+
+# Queries with only short terms cannot use the index
+SCAN_SQL = (
+    "SELECT {fields} FROM {table} WHERE {where} ORDER BY {table}.id "
+    "LIMIT :limit OFFSET :offset"
+)
+SCAN_COUNT_SQL = "SELECT count(*) FROM {table} WHERE {where}"
+
+
+def search_index(model):
+    """
+    The name of the search index of a roster model's table.
+    """
+    return f"{model.__tablename__}_search"
+
+
+def sql_parameters(model):
+    index = search_index(model)
+    return {
+        'index': index,
+        'table': model.__tablename__,
+        'columns': ", ".join(SEARCH_COLUMNS),
+        'new_values': ", ".join(f"new.{column}" for column in SEARCH_COLUMNS),
+        'old_values': ", ".join(f"old.{column}" for column in SEARCH_COLUMNS),
+    }
+
+
+def create_search_indexes(connection):
+    """
+    Creates the search index and its triggers for each roster table that does
+    not have them yet. The index starts out empty; populate it with
+    rebuild_search_index if the table already has rows.
+    """
+    for model in (Member, Provider):
+        parameters = sql_parameters(model)
+        connection.exec_driver_sql(SEARCH_TABLE_SQL.format(**parameters))
+        for trigger in SEARCH_TRIGGER_SQL:
+            connection.exec_driver_sql(trigger.format(**parameters))
+
+
+def rebuild_search_index(connection, model):
+    """
+    Rebuilds a roster table's search index from the table's current rows.
+    """
+    index = search_index(model)
+    connection.exec_driver_sql(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+def search_tiers(model, query, fuzzy=False):
+    """
+    Builds the statements that search a roster for query, as a list of
+    (select, count) pairs whose results, one tier after the other, are the
+    matches in rank order. Each select takes the page as its limit and
+    offset parameters and selects the columns of the model's row type.
+
+    Every whitespace-separated term must appear somewhere in the name,
+    street address or city, and tombstoned persons are never matched.
+    People with all the terms in their name rank first, then the rest, each
+    tier in id order; ranking this way keeps a page to a short read of the
+    index however common the terms are, where scoring every match would
+    not. Terms shorter than a trigram cannot use the index and are matched
+    with LIKE on the rows the other terms found.
+
+    With fuzzy set, the terms are instead split into their trigrams and any
+    of them may match, so misspellings still find the closest names. Those
+    matches are ranked by bm25, which has to score every row sharing a
+    trigram with the query, so fuzzy searches are slower.
+    Returns an empty list if the query has no terms.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    indexed = [term for term in terms if len(term) >= TRIGRAM_LEN]
+    short = [term for term in terms if len(term) < TRIGRAM_LEN]
+    parameters = sql_parameters(model)
+    table = parameters['table']
+
+    conditions = [f"{table}.deleted_at IS NULL"]
+    values = {}
+    for number, term in enumerate(short):
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("(" + " OR ".join(
+            f"{table}.{column} LIKE :term_{number} ESCAPE '\\'" for column in SEARCH_COLUMNS
+        ) + ")")
+        values[f'term_{number}'] = f"%{escaped}%"
+
+    fields = ", ".join(f"{table}.{field}" for field in ROW_TYPES[model]._fields)
+    columns = [getattr(model, field) for field in ROW_TYPES[model]._fields]
+
+    def tier(sql, count_sql, match=None):
+        where = list(conditions)
+        tier_values = dict(values)
+        if match is not None:
+            where.insert(0, f"{parameters['index']} MATCH :match")
+            tier_values['match'] = match
+        statement_parameters = {
+            **parameters,
+            'fields': fields,
+            'where': " AND ".join(where),
+            'weights': ", ".join(str(weight) for weight in SEARCH_WEIGHTS),
+        }
+        select = text(sql.format(**statement_parameters)).columns(*columns)
+        count = text(count_sql.format(**statement_parameters))
+        return select.bindparams(**tier_values), count.bindparams(**tier_values)
+
+    if not indexed:
+        return [tier(SCAN_SQL, SCAN_COUNT_SQL)]
+    if fuzzy:
+        trigrams = sorted({
+            term[start:start + TRIGRAM_LEN].lower()
+            for term in indexed
+            for start in range(len(term) - TRIGRAM_LEN + 1)
+        })
+        return [tier(FUZZY_SQL, TIER_COUNT_SQL, " OR ".join(quote_term(trigram) for trigram in trigrams))]
+    match = " ".join(quote_term(term) for term in indexed)
+    name = f"{SEARCH_COLUMNS[0]} : ({match})"
+    return [
+        tier(TIER_SQL, TIER_COUNT_SQL, name),
+        tier(TIER_SQL, TIER_COUNT_SQL, f"({match}) NOT {name}"),
+    ]
+
+
+def search_page(session, model, query, offset, limit, fuzzy=False):
+    """
+    Returns `limit` matches for query starting at `offset` in rank order,
+    reading the tiers from search_tiers in turn. A tier is only counted when
+    the page starts beyond its end.
+    """
+    matches = []
+    tiers = search_tiers(model, query, fuzzy)
+    for number, (select, count) in enumerate(tiers):
+        rows = session.execute(
+            select, {'limit': limit - len(matches), 'offset': offset}
+        ).all()
+        matches.extend(rows)
+        if len(matches) == limit or number == len(tiers) - 1:
+            break
+        # The tier ran out: skip past however much of it came before the page
+        if rows:
+            offset = 0
+        elif offset:
+            offset -= session.execute(count, {}).scalar()
+    return matches
+
+
+def quote_term(term):
+    """
+    Quotes a term as an FTS5 string so punctuation in it is matched
+    literally instead of being read as query syntax.
+    """
+    return '"' + term.replace('"', '""') + '"'
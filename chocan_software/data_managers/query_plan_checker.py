@@ -0,0 +1,141 @@
+import contextlib
+import io
+import re
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+from sqlalchemy import event
+from chocan_software.models import Member
+from chocan_software.models import Provider
+from chocan_software.models import Service
+from chocan_software.models import ServiceRecord
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.report_manager import ReportManager
+from chocan_software.data_managers.rollup_manager import iso_week
+from chocan_software.data_managers.service_record_manager import ServiceRecordManager
+
+# A plan step that reads service_records from start to finish, with or without
+# an index, instead of searching it.
+FULL_SCAN = re.compile(r"^SCAN service_records\b")
+
+
+class QueryPlanChecker:
+    """
+    Guards the report and lookup queries against falling back to full scans
+    of service_records. Each report and lookup is run against a small scratch
+    database, the SELECT statements it issues are captured, and EXPLAIN QUERY
+    PLAN is run on each one with its real parameters.
+    """
+    def __init__(self, db_url="sqlite://"):
+        self.db_manager = DatabaseManager(db_url)
+        self.statements = []
+        self.current_query = None
+
+    def seed(self):
+        """
+        Adds one provider, member, service and service record so that every
+        report gets past its early returns and issues all of its queries.
+        """
+        with self.db_manager.get_session(commit=True) as session:
+            if session.query(ServiceRecord).first() is not None:
+                return
+            provider = Provider("Plan Provider", "1 Main St", "Portland", "OR", "97201")
+            member = Member("Plan Member", "2 Main St", "Portland", "OR", "97201")
+            service = Service("Plan Service", 1000)
+            session.add_all([provider, member, service])
+            session.flush()
+            session.add(ServiceRecord(
+                provider.id, member.id, service.id,
+                datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            ))
+
+    def queries(self, reports_dir):
+        """
+        The report and lookup paths to check, as (name, callable) pairs.
+        """
+        report_manager = ReportManager(self.db_manager, reports_dir)
+        record_manager = ServiceRecordManager(self.db_manager)
+        now = datetime.now()
+        return [
+            ("ReportManager.generate_provider_report",
+             lambda: report_manager.generate_provider_report(1)),
+            ("ReportManager.generate_member_report",
+             lambda: report_manager.generate_member_report(1)),
+            ("ReportManager.generate_summary_report",
+             report_manager.generate_summary_report),
+            ("ReportManager.generate_eft_data",
+             report_manager.generate_eft_data),
+            ("ReportManager.generate_summary_report (weekly rollup)",
+             lambda: report_manager.generate_summary_report(iso_week(now))),
+            ("ReportManager.generate_eft_data (weekly rollup)",
+             lambda: report_manager.generate_eft_data(iso_week(now))),
+            ("ReportManager.main_accounting_procedure",
+             lambda: report_manager.main_accounting_procedure(workers=1)),
+            ("ServiceRecordManager.get_service_record",
+             lambda: record_manager.get_service_record(1)),
+            ("ServiceRecordManager.get_service_records_by_provider",
+             lambda: record_manager.get_service_records_by_provider(1)),
+            ("ServiceRecordManager.get_service_records_by_member",
+             lambda: record_manager.get_service_records_by_member(1)),
+            ("ServiceRecordManager.query_service_records_by_date_range",
+             lambda: record_manager.query_service_records_by_date_range(
+                 now - timedelta(days=7), now
+             )),
+            # A page size of one makes the iterators issue their follow-up
+            # page query as well
+            ("ServiceRecordManager.iter_service_records_by_provider",
+             lambda: list(record_manager.iter_service_records_by_provider(1, batch_size=1))),
+            ("ServiceRecordManager.iter_service_records_by_member",
+             lambda: list(record_manager.iter_service_records_by_member(1, batch_size=1))),
+            ("ServiceRecordManager.iter_service_records_by_date_range",
+             lambda: list(record_manager.iter_service_records_by_date_range(
+                 now - timedelta(days=7), now, batch_size=1
+             ))),
+        ]
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((self.current_query, statement, parameters))
+
+    def check(self):
+        """
+        Returns a list of (query name, SQL, plan step) for every captured
+        statement whose plan contains a full scan of service_records.
+        """
+        self.seed()
+        self.statements = []
+        with tempfile.TemporaryDirectory() as reports_dir:
+            event.listen(self.db_manager.engine, "before_cursor_execute", self.capture)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for name, run_query in self.queries(reports_dir):
+                        self.current_query = name
+                        run_query()
+            finally:
+                event.remove(self.db_manager.engine, "before_cursor_execute", self.capture)
+
+        violations = []
+        with self.db_manager.engine.connect() as connection:
+            for name, statement, parameters in self.statements:
+                plan = connection.exec_driver_sql(
+                    f"EXPLAIN QUERY PLAN {statement}", parameters
+                ).fetchall()
+                for step in plan:
+                    detail = step[-1]
+                    if FULL_SCAN.match(detail):
+                        violations.append((name, statement, detail))
+        return violations
+
+    def report(self):
+        """
+        Prints the result of check() and returns True if no query plan
+        contains a full scan of service_records.
+        """
+        violations = self.check()
+        if not violations:
+            print(f"All {len(self.statements)} report and lookup queries use an index.")
+            return True
+        for name, statement, detail in violations:
+            print(f"\n{name}: {detail}\n  {' '.join(statement.split())}")
+        print(f"\n{len(violations)} query plan(s) fall back to a full scan of service_records.")
+        return False
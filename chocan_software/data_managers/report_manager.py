@@ -1,11 +1,23 @@
 import os
+import heapq
 from datetime import datetime
 from datetime import timedelta
+from sqlalchemy import and_
+from sqlalchemy import func
 from chocan_software.models import Member
 from chocan_software.models import Provider
-from chocan_software.models import Service
 from chocan_software.models import ServiceRecord
 from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.accounting_engine import AccountingEngine
+from chocan_software.data_managers.accounting_engine import EFTWriter
+from chocan_software.data_managers.accounting_engine import MemberReportWriter
+from chocan_software.data_managers.accounting_engine import ProviderReportWriter
+from chocan_software.data_managers.accounting_engine import SummaryAccumulator
+from chocan_software.data_managers.rollup_manager import RollupManager
+from chocan_software.data_managers.rollup_manager import week_bounds
+from chocan_software.data_managers.service_catalog import ServiceCatalog
+from chocan_software.data_managers.service_record_archive import ServiceRecordArchive
+from chocan_software.string_utils import format_cents
 
 
 class ReportManager:
@@ -13,258 +25,299 @@ class ReportManager:
     ReportManager contains methods for managing the generation of reports, EFT
     Data, and the Provider Directory.
     """
-    def __init__(self, db_manager=None):
+    def __init__(self, db_manager=None, reports_dir=None, archive_dir=None):
         self.db_manager = db_manager if db_manager is not None else DatabaseManager()
-        self.reports_dir = os.path.join(os.path.dirname(__file__), "../../reports")
+        self.reports_dir = (
+            reports_dir if reports_dir is not None
+            else os.path.join(os.path.dirname(__file__), "../../reports")
+        )
+        self.catalog = ServiceCatalog.for_database(self.db_manager)
+        self.rollups = RollupManager(self.db_manager)
+        self.archive = ServiceRecordArchive(self.db_manager, archive_dir)
         os.makedirs(self.reports_dir, exist_ok=True)
 
-    def generate_member_report(self, member_number):
+    @staticmethod
+    def report_period(start_date=None, end_date=None):
+        """
+        Returns the (start_date, end_date) a report covers. end_date defaults
+        to now and start_date to one week before end_date.
+        """
+        end_date = end_date if end_date is not None else datetime.now()
+        start_date = start_date if start_date is not None else end_date - timedelta(days=7)
+        return start_date, end_date
+
+    def check_unarchived(self, start_date) -> bool:
+        """
+        Summary, EFT and accounting reports read only the service_records
+        table and the weekly rollups, which archived records have left.
+        Returns False, after saying why, if start_date is on or before the
+        latest archived date of service, so such a report would be missing
+        records.
+        """
+        archived_through = self.archive.archived_through()
+        if archived_through is not None and start_date <= archived_through:
+            print(
+                f"\nService records through {archived_through:%m-%d-%Y} have been "
+                "archived; summary, EFT and accounting reports can only cover later dates."
+            )
+            return False
+        return True
+
+    def query_archived_records(self, session, model, id_field, start_date, end_date, *criteria):
+        """
+        Returns the archived ServiceRecordRows from start_date through
+        end_date that match the criteria, in (service_date, id) order, each
+        paired with the name of the model (Member or Provider) row its
+        id_field refers to. As with the join on service_records, records
+        whose member or provider no longer exists are left out.
+        """
+        records = self.archive.query_records(start_date, end_date, *criteria)
+        if not records:
+            return []
+        names = dict(session.query(model.id, model.name).filter(
+            model.id.in_({getattr(record, id_field) for record in records})
+        ).all())
+        return [
+            (record, names[getattr(record, id_field)])
+            for record in records if getattr(record, id_field) in names
+        ]
+
+    def generate_member_report(self, member_number, start_date=None, end_date=None):
         """
         Generates weekly member report containing all the services they have
-        received in the past week.
+        received in the past week, or from start_date through end_date,
+        including any archived services in that range.
         """
         member_id = int(member_number)
-        one_week_ago = datetime.now() - timedelta(days=7)
-        
+        one_week_ago, now = self.report_period(start_date, end_date)
+
         with self.db_manager.get_session() as session:
-            member = session.query(Member).filter_by(id=member_id).first()
+            member = session.query(Member).filter_by(id=member_id, deleted_at=None).first()
             if not member:
                 print("\nInvalid member number.")
                 return   
-            records = session.query(ServiceRecord).filter(
+            archived = [
+                (record.service_date, record.id, provider_name, record.service_name)
+                for record, provider_name in self.query_archived_records(
+                    session, Provider, 'provider_id', one_week_ago, now,
+                    ServiceRecord.member_id == member.id,
+                    ServiceRecord.service_name.isnot(None)
+                )
+            ]
+            records = session.query(
+                ServiceRecord.service_date,
+                ServiceRecord.id,
+                Provider.name,
+                ServiceRecord.service_name
+            ).join(
+                Provider, Provider.id == ServiceRecord.provider_id
+            ).filter(
                 ServiceRecord.member_id == member.id,
-                ServiceRecord.service_date >= one_week_ago
-            ).order_by(ServiceRecord.service_date).all()
+                ServiceRecord.service_date >= one_week_ago,
+                ServiceRecord.service_date <= now,
+                ServiceRecord.service_name.isnot(None)
+            ).order_by(ServiceRecord.service_date, ServiceRecord.id).all()
+            records = list(heapq.merge(archived, records, key=lambda record: record[:2]))
             if not records:
                 return
 
-            report_filename = os.path.join(
-                self.reports_dir,
-                f"{member.name.replace(' ', '_')}_"
-                f"{datetime.now().strftime('%Y%m%d')}_"
-                "MemberReport.txt"
-            )
-            with open(report_filename, 'w') as file:
-                file.write(
-                    "╔═════════════════════════════════════════════════════╗\n"
-                    "║                Chocoholics Anonymous                ║\n"
-                    "╚═════════════════════════════════════════════════════╝\n"
-                    "Member Weekly Report\n\n"
-                    "Member Information:\n"
-                    f"  Name:     {member.name}\n"
-                    f"  Number:   {member.id:09}\n"
-                    f"  Street:   {member.street_address}\n"
-                    f"  City:     {member.city}\n"
-                    f"  State:    {member.state}\n"
-                    f"  ZIP Code: {member.zip_code}\n\n"
-                )
-                file.write("Services:\n")
-                for record in records:
-                    provider = session.query(Provider).get(record.provider_id)
-                    service = session.query(Service).filter_by(
-                        id=record.service_id
-                    ).first()
-                    file.write(
-                        f"Date of service: {record.service_date.strftime('%m-%d-%Y')}\n"
-                        f"Provider name: {provider.name}\n"
-                        f"Service name: {service.name}\n\n"
-                    )
-            print(f"Member report generated: {report_filename}")
+            writer = MemberReportWriter(self.reports_dir, now)
+            writer.begin(member.id, member.name, member.street_address,
+                         member.city, member.state, member.zip_code)
+            for service_date, _, provider_name, service_name in records:
+                writer.write(service_date, provider_name, service_name)
+            print(f"Member report generated: {writer.end()}")
 
-    def generate_provider_report(self, provider_number):
+    def generate_provider_report(self, provider_number, start_date=None, end_date=None):
         """
         Generates weekly report for Providers containing all the services they
-        have provided to members in the past week.
+        have provided to members in the past week, or from start_date through
+        end_date, including any archived services in that range.
         """
         provider_id = int(provider_number)
-        one_week_ago = datetime.now() - timedelta(days=7)
+        one_week_ago, now = self.report_period(start_date, end_date)
         with self.db_manager.get_session() as session:
-            provider = session.query(Provider).filter_by(id=provider_id).first()
+            provider = session.query(Provider).filter_by(id=provider_id, deleted_at=None).first()
             if not provider:
                 print("\nInvalid provider number.")
                 return
-            records = session.query(ServiceRecord).filter(
+            archived = [
+                (record.service_date, record.id, record.timestamp, member_name,
+                 record.member_id, record.service_id, record.service_fee_cents)
+                for record, member_name in self.query_archived_records(
+                    session, Member, 'member_id', one_week_ago, now,
+                    ServiceRecord.provider_id == provider.id,
+                    ServiceRecord.service_fee_cents.isnot(None)
+                )
+            ]
+            records = session.query(
+                ServiceRecord.service_date,
+                ServiceRecord.id,
+                ServiceRecord.timestamp,
+                Member.name,
+                Member.id,
+                ServiceRecord.service_id,
+                ServiceRecord.service_fee_cents
+            ).join(
+                Member, Member.id == ServiceRecord.member_id
+            ).filter(
                 ServiceRecord.provider_id == provider.id,
-                ServiceRecord.service_date >= one_week_ago
-            ).order_by(ServiceRecord.service_date).all()
+                ServiceRecord.service_date >= one_week_ago,
+                ServiceRecord.service_date <= now,
+                ServiceRecord.service_fee_cents.isnot(None)
+            ).order_by(ServiceRecord.service_date, ServiceRecord.id).all()
+            records = list(heapq.merge(archived, records, key=lambda record: record[:2]))
             if not records:
                 return
 
-            report_filename = os.path.join(
-                self.reports_dir,
-                f"{provider.name.replace(' ', '_')}_"
-                f"{datetime.now().strftime('%Y%m%d')}_"
-                "ProviderReport.txt"
+            writer = ProviderReportWriter(self.reports_dir, one_week_ago, now)
+            writer.begin(provider.id, provider.name, provider.street_address,
+                         provider.city, provider.state, provider.zip_code)
+            for service_date, _, timestamp, member_name, member_id, service_id, service_fee_cents in records:
+                writer.write(service_date, timestamp, member_name, member_id,
+                             service_id, service_fee_cents)
+            print(f"Provider report generated: {writer.end()}")
+
+    def query_provider_totals(self, session, start_date, end_date, include_inactive=False):
+        """
+        Returns (provider_id, provider_name, consultation_count,
+        fee_total_cents) rows for every provider with service records from
+        start_date through end_date, ordered by provider id. The counts and
+        totals are computed by a single grouped query over service_records,
+        summing the fee in cents stored on each record, joined to providers.
+        If include_inactive is True, providers without any service records in
+        the period are included with a count and total of zero. Tombstoned
+        providers are left out.
+        """
+        record_filter = and_(
+            ServiceRecord.provider_id == Provider.id,
+            ServiceRecord.service_date >= start_date,
+            ServiceRecord.service_date <= end_date,
+            ServiceRecord.service_fee_cents.isnot(None)
+        )
+        consultation_count = func.count(ServiceRecord.id)
+        fee_total_cents = func.coalesce(func.sum(ServiceRecord.service_fee_cents), 0)
+        query = session.query(
+            Provider.id,
+            Provider.name,
+            consultation_count,
+            fee_total_cents
+        )
+        if include_inactive:
+            query = query.select_from(Provider).outerjoin(
+                ServiceRecord, record_filter
             )
-            with open(report_filename, 'w') as file:
-                file.write(
-                    "╔═════════════════════════════════════════════════════╗\n"
-                    "║                Chocoholics Anonymous                ║\n"
-                    "╚═════════════════════════════════════════════════════╝\n"
-                    "Provider Weekly Report\n\n"
-                    "Provider Information:\n"
-                    f"  Name:     {provider.name}\n"
-                    f"  Number:   {provider.id:09}\n"
-                    f"  Street:   {provider.street_address}\n"
-                    f"  City:     {provider.city}\n"
-                    f"  State:    {provider.state}\n"
-                    f"  ZIP Code: {provider.zip_code}\n\n"
-                )
-                file.write(f"Services provided from "
-                           f"{one_week_ago.strftime('%m-%d-%Y')} to "
-                           f"{datetime.now().strftime('%m-%d-%Y')}:\n"
-                )
-                total_weekly_fee = 0
-                for record in records:
-                    member = session.query(Member).get(record.member_id)
-                    service = session.query(Service).filter_by(
-                        id=record.service_id
-                    ).first()
-                    total_weekly_fee += service.fee
-                    file.write(
-                        f"  Date of Service: {record.service_date.strftime('%m-%d-%Y')}\n" 
-                        f"  Database Timestamp: {record.timestamp.strftime('%m-%d-%Y %H:%M:%S')}\n"
-                        f"  Member Name: {member.name}\n"
-                        f"  Member Number: {member.id:09}\n"
-                        f"  Service Code: {service.id:06}\n" 
-                        f"  Service Fee: $ {service.fee:.2f}\n\n"
-                    )
-                file.write(f"Total Consultations: {len(records)}\n")
-                file.write(f"Total Fee: $ {total_weekly_fee:.2f}\n")
-            print(f"Provider report generated: {report_filename}")
+        else:
+            query = query.select_from(ServiceRecord).join(
+                Provider, record_filter
+            )
+        return query.filter(Provider.deleted_at.is_(None)).group_by(
+            Provider.id
+        ).order_by(Provider.id).all()
 
-    def generate_summary_report(self):
+    def generate_summary_report(self, week=None, start_date=None, end_date=None) -> bool:
         """
         A summary report is given to the manager for accounts payable.
         The report lists every provider to be paid that week.
+        week (str): ISO week (YYYY-Www) to report, read from the weekly
+                    rollup. Defaults to the past seven days (or start_date
+                    through end_date), aggregated from the service records.
+        Returns False without a report if the period reaches into the
+        archive.
         """
-        one_week_ago = datetime.now() - timedelta(days=7)
+        if week is not None:
+            start_date, end_date = week_bounds(week)
+        else:
+            start_date, end_date = self.report_period(start_date, end_date)
+        if not self.check_unarchived(start_date):
+            return False
         with self.db_manager.get_session() as session:
-            providers = session.query(Provider).all()
-            provider_total = 0
-            consultation_total = 0
-            fee_grand_total = 0
-        
-            report_filename = os.path.join(
-                self.reports_dir,
-                "Manager_Summary_"
-                f"{datetime.now().strftime('%Y%m%d')}.txt"
-            )
-            with open(report_filename, 'w') as file:
-                file.write(
-                    "╔═════════════════════════════════════════════════════╗\n"
-                    "║                Chocoholics Anonymous                ║\n"
-                    "╚═════════════════════════════════════════════════════╝\n"
-                    "Accounts Payable Weekly Summary Report\n"
-                    f"Week of {one_week_ago.strftime('%m-%d-%Y')}\n\n"
-                    "────────────┬───────────────────────────┬───────┬────────────\n"
-                    " PROVIDER # │ PROVIDER NAME             │ CONS¹ │ FEE TOTAL\n"
-                    "────────────┼───────────────────────────┼───────┼────────────\n"
-                )
-                for provider in providers:
-                    records = session.query(ServiceRecord).filter(
-                        ServiceRecord.provider_id == provider.id,
-                        ServiceRecord.service_date >= one_week_ago
-                    ).order_by(ServiceRecord.service_date).all()
-                    record_count = len(records)
-                    if record_count == 0:
-                        continue
-                    provider_fee_total = sum(
-                        session.query(Service).filter_by(
-                            id=record.service_id
-                        ).first().fee for record in records
-                    )
-                    file.write(
-                        f" {provider.id:09}  "
-                        f"│ {provider.name:<25} "
-                        f"│  {record_count:>3}  "
-                        f"│ ${provider_fee_total:>8.2f}\n"
-                    )
-                    provider_total += 1
-                    consultation_total += len(records)
-                    fee_grand_total += provider_fee_total
-                file.write(
-                    "────────────┴───────────────────────────┴───────┴────────────\n"
-                    " ¹: Consultationss\n\n"
-                    f"Total Providers...................... {provider_total}\n"
-                    f"Total Consultations.................. {consultation_total}\n"
-                    f"Total Fees........................... $ {fee_grand_total:.2f}\n"
-                )
-        print(f"Summary report generated: {report_filename}")
+            if week is not None:
+                provider_totals = self.rollups.provider_week_totals(session, week)
+            else:
+                provider_totals = self.query_provider_totals(session, start_date, end_date)
+            summary = SummaryAccumulator(self.reports_dir, start_date, end_date)
+            for provider_id, provider_name, record_count, fee_total_cents in provider_totals:
+                summary.add(provider_id, provider_name, record_count, fee_total_cents)
+        print(f"Summary report generated: {summary.close()}")
+        return True
 
-    def generate_eft_data(self):
+    def generate_eft_data(self, week=None, start_date=None, end_date=None) -> bool:
         """
         Generates a file containing EFT data meant for the payment processor.
         The file contains the provider name, provider number, and the amount to
         be transferred.
+        week (str): ISO week (YYYY-Www) to pay, read from the weekly rollup.
+                    Defaults to the past seven days (or start_date through
+                    end_date), aggregated from the service records.
+        Returns False without EFT data if the period reaches into the
+        archive.
         """
-        one_week_ago = datetime.now() - timedelta(days=7)
-
+        if week is not None:
+            start_date, end_date = week_bounds(week)
+        else:
+            start_date, end_date = self.report_period(start_date, end_date)
+        if not self.check_unarchived(start_date):
+            return False
         with self.db_manager.get_session() as session:
-            providers = session.query(Provider).all()
-            
-            eft_filename = os.path.join(
-                self.reports_dir,
-                f"EFT_Data_{datetime.now().strftime('%Y%m%d')}.txt"
-            )
-            with open(eft_filename, 'w') as file:
-                file.write("provider_name,provider_number,amount\n")
-                for provider in providers:
-                    records = session.query(ServiceRecord).filter(
-                        ServiceRecord.provider_id == provider.id,
-                        ServiceRecord.service_date >= one_week_ago
-                    ).order_by(ServiceRecord.service_date).all()
-                    total_fee = sum(
-                        session.query(Service).filter_by(
-                            id=record.service_id
-                        ).first().fee for record in records
-                    )
-                    file.write(f"{provider.name},"
-                               f"{provider.id:09},"
-                               f"{total_fee:.2f}\n"
-                    )
-        print(f"EFT data generated: {eft_filename}")
+            if week is not None:
+                provider_totals = self.rollups.provider_week_totals(
+                    session, week, include_inactive=True
+                )
+            else:
+                provider_totals = self.query_provider_totals(
+                    session, start_date, end_date, include_inactive=True
+                )
+            eft_writer = EFTWriter(self.reports_dir, end_date)
+            for provider_id, provider_name, _, fee_total_cents in provider_totals:
+                eft_writer.add(provider_id, provider_name, fee_total_cents)
+        print(f"EFT data generated: {eft_writer.close()}")
+        return True
 
-    def main_accounting_procedure(self):
+    def main_accounting_procedure(self, workers=None, start_date=None, end_date=None) -> bool:
         """
         Main accounting procedure runs reports for all providers and members with
-        service records from the past week, generates the EFT data, and generates
-        the summary report.
+        service records from the past week (or from start_date through
+        end_date), generates the EFT data, and generates the summary report.
+        The week's records are streamed once in provider order and once in
+        member order by the AccountingEngine.
+        workers (int): Worker processes used to render the reports. Defaults
+                       to ACCOUNTING_WORKERS.
+        Returns False without any reports if the period reaches into the
+        archive.
         """
-        with self.db_manager.get_session() as session:
-            providers = session.query(Provider).all()
-            for provider in providers:
-                self.generate_provider_report(provider.id)
-            members = session.query(Member).all()
-            for member in members:
-                self.generate_member_report(member.id)
-        self.generate_eft_data()
-        self.generate_summary_report()
+        one_week_ago, now = self.report_period(start_date, end_date)
+        if not self.check_unarchived(one_week_ago):
+            return False
+        AccountingEngine(self.db_manager, self.reports_dir).run(
+            one_week_ago, now, workers=workers
+        )
         print("Main accounting procedure complete.")
+        return True
   
     def generate_provider_directory(self):
         """
         Generates Provider Directory which contains a list of all the services,
         their codes, and their fees.
         """
-        with self.db_manager.get_session() as session:
-            services = session.query(Service).all()
-            
-            directory_filename = os.path.join(
-                self.reports_dir,
-                "ProviderDirectory_"
-                 f"{datetime.now().strftime('%Y%m%d')}.txt"
-            )
-            with open(directory_filename, 'w') as file:
-                file.write("       Provider Directory of Services\n")
-                file.write("┌────────┬──────────────────────┬──────────┐\n")
-                file.write("│ CODE   │ NAME                 │ FEE      │\n")
-                file.write("├────────┼──────────────────────┼──────────┤\n")
-                for service in services:
-                    file.write(
-                        f"│ {service.id:06} "
-                        f"│ {service.name:<20} "
-                        f"│ $ {service.fee:>6.2f} │\n" 
-                    )
-                file.write("└────────┴──────────────────────┴──────────┘\n")
+        services = self.catalog.snapshot()
+        
+        directory_filename = os.path.join(
+            self.reports_dir,
+            "ProviderDirectory_"
+             f"{datetime.now().strftime('%Y%m%d')}.txt"
+        )
+        with open(directory_filename, 'w') as file:
+            file.write("       Provider Directory of Services\n")
+            file.write("┌────────┬──────────────────────┬──────────┐\n")
+            file.write("│ CODE   │ NAME                 │ FEE      │\n")
+            file.write("├────────┼──────────────────────┼──────────┤\n")
+            for service_id in sorted(services):
+                service = services[service_id]
+                file.write(
+                    f"│ {service.id:06} "
+                    f"│ {service.name:<20} "
+                    f"│ $ {format_cents(service.fee_cents):>6} │\n" 
+                )
+            file.write("└────────┴──────────────────────┴──────────┘\n")
         print(f"Provider directory generated: {directory_filename}")
@@ -0,0 +1,257 @@
+from collections import defaultdict
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from functools import lru_cache
+from sqlalchemy import and_
+from sqlalchemy import func
+from chocan_software.models import Member
+from chocan_software.models import MemberWeeklyRollup
+from chocan_software.models import Provider
+from chocan_software.models import ProviderWeeklyRollup
+from chocan_software.string_utils import format_cents
+
+# (rollup model, table, key column) for the provider and member rollups
+ROLLUPS = [
+    (ProviderWeeklyRollup, "provider_weekly_rollups", "provider_id"),
+    (MemberWeeklyRollup, "member_weekly_rollups", "member_id"),
+]
+
+# The ISO week (YYYY-Www) of service_records.service_date. An ISO week
+# belongs to the year its Thursday falls in, and "-3 days, weekday 4" moves
+# any day to the Thursday of its week.
+ISO_WEEK_SQL = (
+    "printf('%s-W%02d', "
+    "strftime('%Y', date(service_records.service_date, '-3 days', 'weekday 4')), "
+    "(strftime('%j', date(service_records.service_date, '-3 days', 'weekday 4')) - 1) / 7 + 1)"
+)
+
+# Consultation count and fee total per key and week for the service records
+# matching {where}. Records without a fee are left out, as they are in the
+# reports.
+AGGREGATE_SQL = (
+    "SELECT service_records.{key}, " + ISO_WEEK_SQL + ", "
+    "{sign}count(*), {sign}sum(service_records.service_fee_cents) "
+    "FROM service_records "
+    "WHERE ({where}) AND service_records.service_fee_cents IS NOT NULL "
+    "GROUP BY 1, 2"
+)
+
+UPSERT_SQL = (
+    "INSERT INTO {table} ({key}, week, consultation_count, fee_total_cents) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT ({key}, week) DO UPDATE SET "
+    "consultation_count = consultation_count + excluded.consultation_count, "
+    "fee_total_cents = fee_total_cents + excluded.fee_total_cents"
+)
+
+ADD_AGGREGATE_SQL = (
+    "INSERT INTO {table} ({key}, week, consultation_count, fee_total_cents) "
+    + AGGREGATE_SQL +
+    " ON CONFLICT ({key}, week) DO UPDATE SET "
+    "consultation_count = consultation_count + excluded.consultation_count, "
+    "fee_total_cents = fee_total_cents + excluded.fee_total_cents"
+)
+
+
+def iso_week(service_date) -> str:
+    """
+    Returns the ISO week of a date as YYYY-Www, the key of the rollup tables.
+    """
+    year, week, _ = service_date.isocalendar()
+    return f"{year}-W{week:02}"
+
+
+@lru_cache(maxsize=4096)
+def stored_date_week(stored_date):
+    """
+    iso_week for a service date in the form SQLite stores it in
+    (YYYY-MM-DD HH:MM:SS.ffffff), as used by bulk inserts.
+    """
+    return iso_week(date.fromisoformat(stored_date[:10]))
+
+
+def week_bounds(week):
+    """
+    Returns the first (Monday 00:00) and last (Sunday 23:59:59) moments of
+    an ISO week given as YYYY-Www.
+    """
+    start = datetime.strptime(f"{week}-1", "%G-W%V-%u")
+    return start, start + timedelta(days=7, microseconds=-1)
+
+
+def add_rollups_since(connection, last_id=0):
+    """
+    Adds the service records with an id above last_id to both rollups in
+    one set-based pass, in the caller's transaction. Used to populate empty
+    rollups and by RollupManager.rebuild.
+    """
+    apply_rollups_where(connection, "service_records.id > ?", (last_id,))
+
+
+def apply_rollups_where(connection, where, parameters=(), remove=False):
+    """
+    Adds the service records matching the SQL condition `where` to both
+    rollups, or takes them out again if remove is set (call it before the
+    records are deleted).
+    """
+    sign = "-" if remove else ""
+    for _, table, key in ROLLUPS:
+        connection.exec_driver_sql(
+            ADD_AGGREGATE_SQL.format(table=table, key=key, where=where, sign=sign),
+            parameters
+        )
+
+
+class RollupManager:
+    """
+    Maintains the weekly rollups: consultation count and fee total in cents
+    per (provider, ISO week) and per (member, ISO week).
+
+    ServiceRecordManager updates the rollups in the same transaction as every
+    service record it adds, changes or deletes, so reports for a whole week
+    can read one row per provider instead of aggregating the week's service
+    records. Fees are the ones stored on each record, so changing a
+    service's fee does not change past weeks. rebuild()
+    recomputes them from the service records and reports any drift.
+    """
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def add(self, session, provider_id, member_id, service_date, fee_cents, count=1):
+        """
+        Adds count services of the given fee (in cents) on service_date to the
+        provider's and member's week. A negative count removes them.
+        """
+        week = iso_week(service_date)
+        self.add_totals(session.connection(), [
+            {(provider_id, week): [count, fee_cents * count]},
+            {(member_id, week): [count, fee_cents * count]},
+        ])
+
+    def add_records(self, connection, records):
+        """
+        Adds bulk inserted records, given as (provider_id, member_id,
+        service_id, stored service_date, service_name, service_fee_cents, ...)
+        tuples, to the rollups. The records are summed per week here so that
+        each affected rollup row is written once.
+        """
+        provider_totals = defaultdict(lambda: [0, 0])
+        member_totals = defaultdict(lambda: [0, 0])
+        for provider_id, member_id, _, stored_date, _, service_fee_cents, *_ in records:
+            week = stored_date_week(stored_date)
+            totals = provider_totals[(provider_id, week)]
+            totals[0] += 1
+            totals[1] += service_fee_cents
+            totals = member_totals[(member_id, week)]
+            totals[0] += 1
+            totals[1] += service_fee_cents
+        self.add_totals(connection, [provider_totals, member_totals])
+
+    @staticmethod
+    def add_totals(connection, totals):
+        """
+        Adds {(key id, week): [count, fee total in cents]} maps to the provider and
+        member rollups, in that order, with one executemany each.
+        """
+        for (_, table, key), rows in zip(ROLLUPS, totals):
+            if rows:
+                connection.exec_driver_sql(
+                    UPSERT_SQL.format(table=table, key=key),
+                    [(key_id, week, count, fee_total_cents)
+                     for (key_id, week), (count, fee_total_cents) in rows.items()]
+                )
+
+    def provider_week_totals(self, session, week, include_inactive=False):
+        """
+        Returns (provider_id, provider_name, consultation_count,
+        fee_total_cents) for every provider with services in the ISO week,
+        ordered by provider id, read from the rollup. If include_inactive is
+        True, providers without services that week are included with zero
+        totals. Tombstoned providers are left out.
+        """
+        rollup_filter = and_(
+            ProviderWeeklyRollup.provider_id == Provider.id,
+            ProviderWeeklyRollup.week == week
+        )
+        query = session.query(
+            Provider.id,
+            Provider.name,
+            func.coalesce(ProviderWeeklyRollup.consultation_count, 0),
+            func.coalesce(ProviderWeeklyRollup.fee_total_cents, 0)
+        )
+        if include_inactive:
+            query = query.select_from(Provider).outerjoin(ProviderWeeklyRollup, rollup_filter)
+        else:
+            query = query.select_from(ProviderWeeklyRollup).join(
+                Provider, rollup_filter
+            ).filter(ProviderWeeklyRollup.consultation_count > 0)
+        return query.filter(Provider.deleted_at.is_(None)).order_by(Provider.id).all()
+
+    def member_week_totals(self, session, week):
+        """
+        Returns (member_id, member_name, consultation_count, fee_total_cents)
+        for every member who received services in the ISO week and is not
+        tombstoned, ordered by member id, read from the rollup.
+        """
+        return session.query(
+            Member.id,
+            Member.name,
+            MemberWeeklyRollup.consultation_count,
+            MemberWeeklyRollup.fee_total_cents
+        ).select_from(MemberWeeklyRollup).join(
+            Member, Member.id == MemberWeeklyRollup.member_id
+        ).filter(
+            MemberWeeklyRollup.week == week,
+            MemberWeeklyRollup.consultation_count > 0,
+            Member.deleted_at.is_(None)
+        ).order_by(Member.id).all()
+
+    def rebuild(self):
+        """
+        Recomputes both rollups from the service records and replaces them.
+        Returns a list of (table, key id, week, stored (count, fee cents),
+        rebuilt (count, fee cents)) for every row that had drifted from the
+        records.
+        """
+        drift = []
+        with self.db_manager.get_session(commit=True) as session:
+            connection = session.connection()
+            for _, table, key in ROLLUPS:
+                stored = {
+                    (key_id, week): (count, fee_total_cents)
+                    for key_id, week, count, fee_total_cents in connection.exec_driver_sql(
+                        f"SELECT {key}, week, consultation_count, fee_total_cents FROM {table} "
+                        "WHERE consultation_count != 0 OR fee_total_cents != 0"
+                    )
+                }
+                rebuilt = {
+                    (key_id, week): (count, fee_total_cents)
+                    for key_id, week, count, fee_total_cents in connection.exec_driver_sql(
+                        AGGREGATE_SQL.format(key=key, where="1", sign="")
+                    )
+                }
+                for row_key in sorted(stored.keys() | rebuilt.keys()):
+                    before = stored.get(row_key, (0, 0))
+                    after = rebuilt.get(row_key, (0, 0))
+                    if before != after:
+                        drift.append((table, *row_key, before, after))
+                connection.exec_driver_sql(f"DELETE FROM {table}")
+            add_rollups_since(connection)
+        return drift
+
+    def rebuild_and_report(self):
+        """
+        Rebuilds the rollups and prints the rows that had drifted.
+        """
+        drift = self.rebuild()
+        if not drift:
+            print("\nWeekly rollups rebuilt. No drift found.")
+            return drift
+        for table, key_id, week, before, after in drift:
+            print(
+                f"  {table} {key_id:09} {week}: "
+                f"stored {before[0]} / ${format_cents(before[1])}, "
+                f"records {after[0]} / ${format_cents(after[1])}"
+            )
+        print(f"\nWeekly rollups rebuilt. {len(drift)} row(s) had drifted.")
+        return drift
@@ -0,0 +1,365 @@
+import csv
+import re
+from collections import Counter
+from chocan_software.data_managers.rows import ROW_TYPES
+from chocan_software.data_managers.import_files import read_import_file
+from chocan_software.constants import (
+    ACCOUNT_NUM_LEN,
+    NAME_MIN_LEN,
+    NAME_MAX_LEN,
+    STREET_ADDRESS_MIN_LEN,
+    STREET_ADDRESS_MAX_LEN,
+    CITY_MIN_LEN,
+    CITY_MAX_LEN,
+    STATE_LEN,
+    ZIP_CODE_LEN,
+    MEMBER_STATUS_ACTIVE,
+    MEMBER_STATUS_SUSPENDED,
+    ROSTER_SYNC_BATCH_SIZE
+)
+
+ROSTER_FIELDS = ['name', 'street_address', 'city', 'state', 'zip_code']
+
+# Accepted spellings of the roster's status column
+ROSTER_STATUSES = {
+    'active': MEMBER_STATUS_ACTIVE,
+    'suspended': MEMBER_STATUS_SUSPENDED,
+    'true': MEMBER_STATUS_ACTIVE,
+    'false': MEMBER_STATUS_SUSPENDED,
+    '1': MEMBER_STATUS_ACTIVE,
+    '0': MEMBER_STATUS_SUSPENDED,
+}
+
+ROSTER_FIELD_LIMITS = {
+    'name': (NAME_MIN_LEN, NAME_MAX_LEN),
+    'street_address': (STREET_ADDRESS_MIN_LEN, STREET_ADDRESS_MAX_LEN),
+    'city': (CITY_MIN_LEN, CITY_MAX_LEN),
+}
+STATE_PATTERN = re.compile(rf'^[A-Z]{{{STATE_LEN}}}$')
+ZIP_CODE_PATTERN = re.compile(rf'^\d{{{ZIP_CODE_LEN}}}$')
+
+# The ids of the people holding a list of names and addresses
+KEY_HOLDERS_SQL = (
+    "WITH roster_keys ({columns}) AS (VALUES {rows}) "
+    "SELECT {table}.id, roster_keys.* FROM roster_keys JOIN {table} ON {join}"
+)
+
+# Roster numbers seen so far in this sync, kept in the connection's temp
+# database so finding the people missing from the roster is one statement
+ROSTER_IDS_TABLE = "roster_sync_ids"
+
+
+def placeholders(values):
+    return ", ".join("?" for _ in values)
+
+
+def roster_value(row, field):
+    """
+    A roster row's field as a stripped string, converting the numbers and
+    booleans a JSONL roster may hold. Missing, null and non-scalar values
+    are returned as ''.
+    """
+    value = row.get(field)
+    if not isinstance(value, (str, int, float)):
+        return ''
+    return str(value).strip()
+
+
+def roster_key(person):
+    """
+    The name and address of a roster person ([id, name, street_address,
+    city, state, zip_code, ...]), which are unique together.
+    """
+    return tuple(person[1:len(ROSTER_FIELDS) + 1])
+
+
+class RosterSync:
+    """
+    Synchronizes the members or providers table with a full roster file
+    (CSV with a header row, or JSONL) such as the payment processor's
+    nightly member roster.
+
+    Each roster row has the person's number (member_number or
+    provider_number), name, street_address, city, state and zip_code, and
+    for members a status (active or suspended). The roster is streamed
+    batch_size rows at a time: each batch reads the existing rows for its
+    numbers with one query, diffs them against the roster, and applies the
+    new people, the field changes and the status-only changes with one
+    executemany each. The whole sync runs in one transaction, so readers
+    see the roster either entirely applied or not at all, and the work done
+    is proportional to the size of the roster.
+
+    A row with a number that is not in the table adds the person under that
+    number. A row without a number is matched to the person with the same
+    name and address, or else adds a new person. A blank status keeps
+    the member's current status (new members are active). Rows that are
+    invalid, repeat a number, belong to a tombstoned (deleted) account, or
+    would duplicate another person's name and address are written to the
+    rejects file with the reason instead. Tombstoned accounts never count as
+    missing from the roster.
+    """
+    def __init__(self, db_manager, batch_size=None):
+        self.db_manager = db_manager
+        self.batch_size = batch_size if batch_size is not None else ROSTER_SYNC_BATCH_SIZE
+
+    def sync(self, person_class, file_path, rejects_path=None, suspend_missing=False):
+        """
+        Applies the roster in file_path to person_class's table. With
+        suspend_missing, active members that are not in the roster are
+        suspended. Rejected rows are written to rejects_path (defaults to
+        <file_path>.rejects.csv). Prints a summary of the changes and returns
+        them as a Counter of added, updated, suspended, reinstated,
+        unchanged, rejected and missing people.
+        """
+        if rejects_path is None:
+            rejects_path = f"{file_path}.rejects.csv"
+        table_name = person_class.__tablename__
+        number_field = f"{person_class.__name__.lower()}_number"
+        fields = self.roster_fields(person_class)
+        changes = Counter({change: 0 for change in (
+            'added', 'updated', 'suspended', 'reinstated', 'unchanged', 'rejected', 'missing'
+        )})
+
+        with open(rejects_path, 'w', newline='') as rejects_file, \
+                self.db_manager.get_session(commit=True) as session:
+            rejects = csv.writer(rejects_file)
+            rejects.writerow(['line', number_field] + fields + ['reason'])
+
+            def reject(line_number, row, reason):
+                rejects.writerow(
+                    [line_number, row.get(number_field)]
+                    + [row.get(field) for field in fields] + [reason]
+                )
+                changes['rejected'] += 1
+
+            connection = session.connection()
+            connection.exec_driver_sql(
+                f"CREATE TEMP TABLE IF NOT EXISTS {ROSTER_IDS_TABLE} (id INTEGER PRIMARY KEY)"
+            )
+            connection.exec_driver_sql(f"DELETE FROM temp.{ROSTER_IDS_TABLE}")
+            # People added without a number get ids after this one
+            last_id = connection.exec_driver_sql(
+                f"SELECT coalesce(max(id), 0) FROM {table_name}"
+            ).scalar()
+            try:
+                batch = []
+                for line_number, row in read_import_file(file_path):
+                    person, reason = self.validate_roster_row(person_class, row, number_field)
+                    if person is None:
+                        reject(line_number, row, reason)
+                        continue
+                    batch.append((line_number, row, person))
+                    if len(batch) >= self.batch_size:
+                        self.apply_batch(connection, person_class, batch, changes, reject)
+                        batch = []
+                if batch:
+                    self.apply_batch(connection, person_class, batch, changes, reject)
+
+                missing = (
+                    f"id <= ? AND deleted_at IS NULL "
+                    f"AND id NOT IN (SELECT id FROM temp.{ROSTER_IDS_TABLE})"
+                )
+                if suspend_missing and 'status' in fields:
+                    changes['missing'] = connection.exec_driver_sql(
+                        f"UPDATE {table_name} SET status = ? WHERE status = ? AND {missing}",
+                        (MEMBER_STATUS_SUSPENDED, MEMBER_STATUS_ACTIVE, last_id)
+                    ).rowcount
+                    changes['suspended'] += changes['missing']
+                else:
+                    changes['missing'] = connection.exec_driver_sql(
+                        f"SELECT count(*) FROM {table_name} WHERE {missing}", (last_id,)
+                    ).scalar()
+            finally:
+                connection.exec_driver_sql(f"DROP TABLE temp.{ROSTER_IDS_TABLE}")
+
+        self.print_summary(person_class, changes, suspend_missing and 'status' in fields)
+        if changes['rejected']:
+            print(f"Rejected rows written to: {rejects_path}")
+        return changes
+
+    def apply_batch(self, connection, person_class, batch, changes, reject):
+        """
+        Diffs a batch of (line_number, row, person) entries against the
+        table and applies the differences. person is a list of the id (None
+        for a new person) followed by the roster fields.
+        """
+        table_name = person_class.__tablename__
+        fields = self.roster_fields(person_class)
+        has_status = 'status' in fields
+
+        # A row without a number is the person already at that name and
+        # address, if there is one
+        unnumbered = [person for _, _, person in batch if person[0] is None]
+        if unnumbered:
+            holders = self.key_holders(
+                connection, person_class, [roster_key(person) for person in unnumbered]
+            )
+            for person in unnumbered:
+                person[0] = holders.get(roster_key(person))
+
+        # Numbers repeated within the roster keep their first row
+        numbered = [person[0] for _, _, person in batch if person[0] is not None]
+        seen_ids = set(connection.exec_driver_sql(
+            f"SELECT id FROM temp.{ROSTER_IDS_TABLE} WHERE id IN ({placeholders(numbered)})",
+            tuple(numbered)
+        ).scalars()) if numbered else set()
+        batch_ids = set()
+        entries = []
+        for line_number, row, person in batch:
+            person_id = person[0]
+            if person_id is not None:
+                if person_id in seen_ids or person_id in batch_ids:
+                    reject(line_number, row, "repeats an earlier roster row")
+                    continue
+                batch_ids.add(person_id)
+            entries.append((line_number, row, person))
+        if batch_ids:
+            connection.exec_driver_sql(
+                f"INSERT INTO temp.{ROSTER_IDS_TABLE} (id) VALUES (?)",
+                [(person_id,) for person_id in batch_ids]
+            )
+
+        existing = {}
+        deleted_ids = set()
+        if batch_ids:
+            for row in connection.exec_driver_sql(
+                f"SELECT id, {', '.join(fields)}, deleted_at IS NOT NULL FROM {table_name} "
+                f"WHERE id IN ({placeholders(batch_ids)})",
+                tuple(batch_ids)
+            ):
+                existing[row[0]] = row[:-1]
+                if row[-1]:
+                    deleted_ids.add(row[0])
+
+        # The name and address together are unique, so find who already
+        # holds the ones being added or changed to
+        moving = [
+            roster_key(person) for _, _, person in entries
+            if person[0] not in existing or roster_key(person) != roster_key(existing[person[0]])
+        ]
+        holders = self.key_holders(connection, person_class, moving) if moving else {}
+
+        inserts = []
+        updates = []
+        status_updates = []
+        for line_number, row, person in entries:
+            current = existing.get(person[0])
+            if person[0] in deleted_ids:
+                reject(line_number, row, "account was deleted")
+                continue
+            if has_status and person[-1] is None:
+                person[-1] = bool(current[-1]) if current is not None else MEMBER_STATUS_ACTIVE
+            key = roster_key(person)
+            moved = current is None or key != roster_key(current)
+            if moved:
+                holder = holders.get(key)
+                if holder is not None and holder != person[0]:
+                    reject(line_number, row, "name and address belong to another person")
+                    continue
+                # People added without a number claim theirs as id 0
+                holders[key] = person[0] if person[0] is not None else 0
+            if current is None:
+                inserts.append(tuple(person))
+                changes['added'] += 1
+                continue
+            status_changed = has_status and person[-1] != current[-1]
+            if moved:
+                updates.append((*person[1:], person[0]))
+                changes['updated'] += 1
+            elif status_changed:
+                status_updates.append((person[-1], person[0]))
+            else:
+                changes['unchanged'] += 1
+            if status_changed:
+                changes['reinstated' if person[-1] else 'suspended'] += 1
+
+        if updates:
+            assignments = ", ".join(f"{field} = ?" for field in fields)
+            connection.exec_driver_sql(f"UPDATE {table_name} SET {assignments} WHERE id = ?", updates)
+        if status_updates:
+            connection.exec_driver_sql(f"UPDATE {table_name} SET status = ? WHERE id = ?", status_updates)
+        if inserts:
+            connection.exec_driver_sql(
+                f"INSERT INTO {table_name} (id, {', '.join(fields)}) "
+                f"VALUES ({placeholders(range(len(fields) + 1))})",
+                inserts
+            )
+
+    @staticmethod
+    def key_holders(connection, person_class, keys):
+        """
+        Maps each of the (name, street_address, city, state, zip_code) keys
+        that belongs to someone in person_class's table to their id.
+        Tombstoned persons are included: they keep their name and address
+        under the unique constraint, so a roster row cannot take them over.
+        """
+        # Joined from a VALUES list so each key is one search of the unique
+        # index; a row-value IN list would scan the table instead
+        table_name = person_class.__tablename__
+        sql = KEY_HOLDERS_SQL.format(
+            table=table_name,
+            columns=", ".join(ROSTER_FIELDS),
+            rows=", ".join(f"({placeholders(ROSTER_FIELDS)})" for _ in keys),
+            join=" AND ".join(
+                f"{table_name}.{field} = roster_keys.{field}" for field in ROSTER_FIELDS
+            ),
+        )
+        parameters = tuple(value for key in keys for value in key)
+        return {
+            tuple(row[1:]): row[0] for row in connection.exec_driver_sql(sql, parameters)
+        }
+
+    @staticmethod
+    def roster_fields(person_class):
+        """
+        The roster fields stored for person_class: the name and address,
+        plus status for members.
+        """
+        if 'status' in ROW_TYPES[person_class]._fields:
+            return ROSTER_FIELDS + ['status']
+        return list(ROSTER_FIELDS)
+
+    @staticmethod
+    def validate_roster_row(person_class, row, number_field):
+        """
+        Validates one roster row. Returns (person, None) where person is a
+        list of the id (None if the row has no number) followed by the
+        roster fields, or (None, reason) if the row is rejected.
+        """
+        number = roster_value(row, number_field)
+        if number and (not number.isdigit() or len(number) > ACCOUNT_NUM_LEN or int(number) == 0):
+            return None, f"malformed {number_field.replace('_', ' ')}"
+        person = [int(number) if number else None]
+        for field in ROSTER_FIELDS:
+            value = roster_value(row, field)
+            if not value:
+                return None, f"missing {field.replace('_', ' ')}"
+            person.append(value)
+        for position, (field, (min_len, max_len)) in enumerate(ROSTER_FIELD_LIMITS.items(), 1):
+            if not min_len <= len(person[position]) <= max_len:
+                return None, f"{field.replace('_', ' ')} must be {min_len}-{max_len} characters"
+        if not STATE_PATTERN.match(person[4]):
+            return None, f"state must be {STATE_LEN} uppercase letters"
+        if not ZIP_CODE_PATTERN.match(person[5]):
+            return None, f"ZIP code must be {ZIP_CODE_LEN} digits"
+        if 'status' in ROW_TYPES[person_class]._fields:
+            status = roster_value(row, 'status').lower()
+            if status and status not in ROSTER_STATUSES:
+                return None, "invalid status"
+            person.append(ROSTER_STATUSES[status] if status else None)
+        return person, None
+
+    @staticmethod
+    def print_summary(person_class, changes, suspended_missing):
+        kind = person_class.__name__.lower()
+        summary = (
+            f"\nSynced {kind} roster: {changes['added']} added, "
+            f"{changes['updated']} updated, "
+        )
+        if 'status' in ROW_TYPES[person_class]._fields:
+            summary += f"{changes['suspended']} suspended, {changes['reinstated']} reinstated, "
+        summary += f"{changes['unchanged']} unchanged, {changes['rejected']} rejected."
+        print(summary)
+        if changes['missing']:
+            action = " (suspended)" if suspended_missing else ""
+            print(f"{changes['missing']} {kind}s not in the roster{action}.")
@@ -0,0 +1,49 @@
+# This module defines the read-only rows returned by the managers' lookups.
+"""
+The get_* and iter_* lookups return these instead of ORM instances that
+outlive their session. Each row is a namedtuple of the model's columns: it
+has no per-instance __dict__ or ORM state, is immutable, so it can be shared
+between threads and cached, and pickles cheaply to worker processes. Fields
+are named after the model columns, so row.name, row.status, etc. read the
+same as on the model.
+"""
+from collections import namedtuple
+from sqlalchemy import select
+from chocan_software.models import Member
+from chocan_software.models import Provider
+from chocan_software.models import Service
+from chocan_software.models import ServiceRecord
+
+MemberRow = namedtuple('MemberRow', [
+    'id', 'name', 'street_address', 'city', 'state', 'zip_code', 'status'
+])
+ProviderRow = namedtuple('ProviderRow', [
+    'id', 'name', 'street_address', 'city', 'state', 'zip_code'
+])
+ServiceRow = namedtuple('ServiceRow', ['id', 'name', 'fee_cents'])
+ServiceRecordRow = namedtuple('ServiceRecordRow', [
+    'id', 'provider_id', 'member_id', 'service_id', 'service_date', 'timestamp',
+    'comments', 'service_name', 'service_fee_cents'
+])
+
+ROW_TYPES = {
+    Member: MemberRow,
+    Provider: ProviderRow,
+    Service: ServiceRow,
+    ServiceRecord: ServiceRecordRow,
+}
+
+
+def select_rows(model):
+    """
+    A select of the model's columns in the field order of its row type.
+    """
+    return select(*(getattr(model, field) for field in ROW_TYPES[model]._fields))
+
+
+def to_row(model, row):
+    """
+    Converts a result row of select_rows(model) to the model's row type,
+    passing None through.
+    """
+    return ROW_TYPES[model]._make(row) if row is not None else None
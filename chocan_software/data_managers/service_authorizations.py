@@ -0,0 +1,90 @@
+import time
+from threading import Lock
+from chocan_software.models import ProviderService
+from chocan_software.constants import SERVICE_AUTHORIZATIONS_TTL
+
+
+class ServiceAuthorizations:
+    """
+    Read-mostly snapshot of which services each provider may bill, as a map
+    of provider id to a frozenset of service ids.
+
+    The map is built from provider_services with one query on first use and
+    rebuilt after ProviderManager.add_provider_service or delete_provider, or
+    ServiceManager.delete_service, bumps its version, or once it is `ttl`
+    seconds old, so authorizations added by another process (the manager
+    terminal or the CLI) reach long-running terminals. A check is then one
+    dict lookup and a set membership test, with no database round-trip. As
+    with the ServiceCatalog, a rebuild swaps in a new map so readers never
+    see a partially loaded one.
+    """
+    def __init__(self, db_manager, ttl=None, clock=time.monotonic):
+        self.db_manager = db_manager
+        self.ttl = ttl if ttl is not None else SERVICE_AUTHORIZATIONS_TTL
+        self.clock = clock
+        self.version = 0
+        self.loaded_version = -1
+        self.expires_at = 0.0
+        self.entries = {}
+        self.lock = Lock()
+
+    @classmethod
+    def for_database(cls, db_manager):
+        """
+        The authorizations shared by every manager using db_manager.
+        """
+        return db_manager.get_cache("service_authorizations", lambda: cls(db_manager))
+
+    def bump_version(self):
+        """
+        Marks the snapshot stale after provider_services has changed.
+        """
+        with self.lock:
+            self.version += 1
+
+    def is_stale(self) -> bool:
+        return self.loaded_version != self.version or self.expires_at <= self.clock()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current provider id -> frozenset of service ids map,
+        rebuilding it first if provider_services has changed since it was
+        loaded or the snapshot has expired.
+        """
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    version = self.version
+                    entries = {}
+                    with self.db_manager.get_session() as session:
+                        pairs = session.query(
+                            ProviderService.provider_id, ProviderService.service_id
+                        ).all()
+                    for provider_id, service_id in pairs:
+                        entries.setdefault(provider_id, set()).add(service_id)
+                    self.entries = {
+                        provider_id: frozenset(service_ids)
+                        for provider_id, service_ids in entries.items()
+                    }
+                    self.loaded_version = version
+                    self.expires_at = self.clock() + self.ttl
+        return self.entries
+
+    def is_authorized(self, provider_id, service_id) -> bool:
+        """
+        Whether the provider may bill the service.
+        """
+        return is_authorized(self.snapshot(), provider_id, service_id)
+
+    def service_ids(self, provider_id) -> list:
+        """
+        The ids of the services the provider may bill, in order.
+        """
+        return sorted(self.snapshot().get(provider_id, ()))
+
+
+def is_authorized(authorizations, provider_id, service_id) -> bool:
+    """
+    Whether a snapshot() map authorizes the provider to bill the service.
+    """
+    return service_id in authorizations.get(provider_id, ())
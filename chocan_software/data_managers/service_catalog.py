@@ -0,0 +1,70 @@
+import time
+from threading import Lock
+from chocan_software.models import Service
+from chocan_software.data_managers.rows import ServiceRow
+from chocan_software.data_managers.rows import select_rows
+from chocan_software.constants import SERVICE_CATALOG_TTL
+
+
+class ServiceCatalog:
+    """
+    Read-mostly snapshot of the service catalog as a map of service id to
+    ServiceRow(id, name, fee_cents).
+
+    The catalog is loaded on first use and reloaded after
+    ServiceManager.add_service, update_service or delete_service bumps its
+    version, so changes made in this process take effect immediately, or
+    once it is `ttl` seconds old, so changes made by another process (the
+    manager terminal or the CLI) are picked up by long-running terminals. A
+    reload builds a new map and swaps it in, so readers never see a
+    partially loaded catalog and never wait on one another.
+    """
+    def __init__(self, db_manager, ttl=None, clock=time.monotonic):
+        self.db_manager = db_manager
+        self.ttl = ttl if ttl is not None else SERVICE_CATALOG_TTL
+        self.clock = clock
+        self.version = 0
+        self.loaded_version = -1
+        self.expires_at = 0.0
+        self.entries = {}
+        self.lock = Lock()
+
+    @classmethod
+    def for_database(cls, db_manager):
+        """
+        The catalog shared by every manager using db_manager.
+        """
+        return db_manager.get_cache("service_catalog", lambda: cls(db_manager))
+
+    def bump_version(self):
+        """
+        Marks the snapshot stale after the services table has changed.
+        """
+        with self.lock:
+            self.version += 1
+
+    def is_stale(self) -> bool:
+        return self.loaded_version != self.version or self.expires_at <= self.clock()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current id -> ServiceRow map, reloading it first if the
+        catalog has changed since it was loaded or the snapshot has expired.
+        """
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    version = self.version
+                    with self.db_manager.get_session() as session:
+                        rows = session.execute(select_rows(Service)).all()
+                    self.entries = {row.id: ServiceRow._make(row) for row in rows}
+                    self.loaded_version = version
+                    self.expires_at = self.clock() + self.ttl
+        return self.entries
+
+    def get(self, service_id):
+        """
+        Returns the ServiceRow for service_id, or None if there is no such
+        service.
+        """
+        return self.snapshot().get(service_id)
@@ -1,5 +1,9 @@
+from chocan_software.models import ProviderService
 from chocan_software.models import Service
 from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.service_authorizations import ServiceAuthorizations
+from chocan_software.data_managers.service_catalog import ServiceCatalog
+from chocan_software.string_utils import format_cents
 
 
 class ServiceManager:
@@ -8,12 +12,15 @@ class ServiceManager:
     """
     def __init__(self, db_manager=None):
         self.db_manager = db_manager if db_manager is not None else DatabaseManager()
+        self.catalog = ServiceCatalog.for_database(self.db_manager)
+        self.authorizations = ServiceAuthorizations.for_database(self.db_manager)
 
-    def add_service(self, name, fee):
+    def add_service(self, name, fee_cents):
         with self.db_manager.get_session(commit=True) as session:
-            new_service = Service(name=name, fee=fee)
+            new_service = Service(name=name, fee_cents=fee_cents)
             session.add(new_service)
             print(f"\nAdded service.")
+        self.catalog.bump_version()
 
     def update_service(self, service_code, **kwargs):
         service_id = int(service_code)
@@ -29,6 +36,7 @@ class ServiceManager:
                     setattr(service, key, value)
                     
             print(f"\nUpdated service.")
+        self.catalog.bump_version()
 
     def delete_service(self, service_code):
         service_id = int(service_code)
@@ -37,20 +45,25 @@ class ServiceManager:
             if not service:
                 print(f"\nService with code {service_code} not found.")
                 return
+            # No provider stays authorized for a deleted service
+            session.query(ProviderService).filter_by(service_id=service_id).delete()
             session.delete(service)
             print(f"\nDeleted service.")
+        self.catalog.bump_version()
+        self.authorizations.bump_version()
 
     def get_service(self, service_code):
-        service_id = int(service_code)
-        with self.db_manager.get_session() as session:
-            service = session.query(Service).filter_by(id=service_id).first()
-            return service
+        """
+        Returns the ServiceRow (id, name, fee_cents) for a service code from the
+        service catalog snapshot, or None if there is no such service.
+        """
+        return self.catalog.get(int(service_code))
         
     def view_services(self):
-        with self.db_manager.get_session() as session:
-            services = session.query(Service).all()
-            if not services:
-                print("\nNo services found.")
-            else:
-                for service in services:
-                    print(f"  {service.id:06}: {service.name:<20} ${service.fee:>6.2f}")
+        services = self.catalog.snapshot()
+        if not services:
+            print("\nNo services found.")
+        else:
+            for service_id in sorted(services):
+                service = services[service_id]
+                print(f"  {service.id:06}: {service.name:<20} ${format_cents(service.fee_cents):>6}")
@@ -0,0 +1,266 @@
+# This module moves historical service records into per-year archive files.
+"""
+Service records whose date of service is older than the archive horizon are
+moved out of the service_records table into one SQLite file per year of
+service, e.g. service_record_archive/service_records_2023.db next to the
+database file, so the table, its indexes and the report queries only hold
+recent history.
+
+An archive file holds a service_records table with the same columns, unique
+constraint and report indexes as the main one. Records keep their ids, and
+a record already in the archive is not added again, so moving a batch again
+after an interrupted run is harmless.
+"""
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from datetime import timedelta
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from chocan_software.models import ServiceRecord
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.rollup_manager import ROLLUPS
+from chocan_software.data_managers.rollup_manager import apply_rollups_where
+from chocan_software.data_managers.rollup_manager import iso_week
+from chocan_software.data_managers.rows import ServiceRecordRow
+from chocan_software.data_managers.rows import select_rows
+from chocan_software.constants import (
+    SERVICE_NAME_MAX_LEN,
+    SERVICERECORD_COMMENT_MAX_LEN,
+    SERVICE_RECORD_ARCHIVE_DIR,
+    SERVICE_RECORD_ARCHIVE_HORIZON_DAYS,
+    SERVICE_RECORD_ARCHIVE_BATCH_SIZE
+)
+
+ARCHIVE_FILE_PATTERN = re.compile(r'^service_records_(\d{4})\.db$')
+
+# The archive keeps no foreign keys: archived records outlive deleted
+# members, providers and services, as the reports they appeared on do
+ARCHIVE_TABLE_SQL = [
+    "CREATE TABLE IF NOT EXISTS {schema}.service_records ("
+    "id INTEGER NOT NULL, "
+    "provider_id INTEGER NOT NULL, "
+    "member_id INTEGER NOT NULL, "
+    "service_id INTEGER NOT NULL, "
+    "service_date DATETIME NOT NULL, "
+    "timestamp DATETIME NOT NULL, "
+    f"comments VARCHAR({SERVICERECORD_COMMENT_MAX_LEN}), "
+    f"service_name VARCHAR({SERVICE_NAME_MAX_LEN}), "
+    "service_fee_cents INTEGER, "
+    "UNIQUE (provider_id, member_id, service_id, service_date))",
+    "CREATE INDEX IF NOT EXISTS {schema}.ix_service_records_provider_date "
+    "ON service_records (provider_id, service_date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.ix_service_records_member_date "
+    "ON service_records (member_id, service_date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.ix_service_records_service_date "
+    "ON service_records (service_date)",
+]
+
+ARCHIVE_COLUMNS = ", ".join(ServiceRecordRow._fields)
+
+
+def default_archive_dir(db_manager):
+    """
+    The SERVICE_RECORD_ARCHIVE_DIR directory next to db_manager's database
+    file, so every process opening the database finds the same archive
+    whatever its working directory. In-memory databases have no archive.
+    """
+    if db_manager.is_memory_database():
+        return None
+    database = os.path.abspath(make_url(db_manager.db_url).database)
+    return os.path.join(os.path.dirname(database), SERVICE_RECORD_ARCHIVE_DIR)
+
+
+def stored_date(value):
+    """
+    A datetime as the string the SQLite DateTime type stores it as, so it
+    can be compared with service_date in raw SQL.
+    """
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class ServiceRecordArchive:
+    """
+    Moves service records older than a horizon into per-year archive files
+    and reads them back for date-range queries.
+
+    A move attaches one year's file at a time to a connection of its own and
+    copies, takes out of the weekly rollups and deletes the year's records
+    batch_size at a time, one transaction per batch, so terminals can keep
+    writing between batches. Archived weeks drop out of the rollups and the
+    reports along with their records.
+
+    Reads open only the files of the years a date range covers, each as a
+    read-only database, so the other connections never see the archives.
+    Later imports are not checked against the archive; a re-imported
+    record is dropped as a duplicate when it is archived again.
+    """
+    def __init__(self, db_manager, archive_dir=None):
+        self.db_manager = db_manager
+        self.archive_dir = (
+            archive_dir if archive_dir is not None else default_archive_dir(db_manager)
+        )
+
+    def path(self, year):
+        return os.path.join(self.archive_dir, f"service_records_{year}.db")
+
+    def database(self, year):
+        """
+        A read-only DatabaseManager for the year's archive file.
+        """
+        return DatabaseManager(f"sqlite:///{os.path.abspath(self.path(year))}", read_only=True)
+
+    def years(self) -> list:
+        """
+        The years of service that have an archive file, in order.
+        """
+        if self.archive_dir is None or not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            int(match.group(1))
+            for match in map(ARCHIVE_FILE_PATTERN.match, os.listdir(self.archive_dir))
+            if match
+        )
+
+    def archive_databases(self, start_date, end_date) -> list:
+        """
+        Read-only DatabaseManagers for the archive files of the years from
+        start_date through end_date.
+        """
+        return [
+            self.database(year)
+            for year in self.years()
+            if start_date.year <= year <= end_date.year
+        ]
+
+    def archived_through(self):
+        """
+        The latest date of service in the archive, or None if nothing has
+        been archived.
+        """
+        for year in reversed(self.years()):
+            with self.database(year).get_session() as session:
+                latest = session.query(func.max(ServiceRecord.service_date)).scalar()
+            if latest is not None:
+                return latest
+        return None
+
+    def query_records(self, start_date, end_date, *criteria) -> list:
+        """
+        The archived ServiceRecordRows from start_date through end_date that
+        match the criteria, in (service_date, id) order.
+        """
+        records = []
+        for db_manager in self.archive_databases(start_date, end_date):
+            with db_manager.get_session() as session:
+                records.extend(map(ServiceRecordRow._make, session.execute(
+                    select_rows(ServiceRecord).where(
+                        ServiceRecord.service_date >= start_date,
+                        ServiceRecord.service_date <= end_date,
+                        *criteria
+                    ).order_by(ServiceRecord.service_date, ServiceRecord.id)
+                )))
+        return records
+
+    def iter_records(self, start_date, end_date, batch_size=None) -> list:
+        """
+        One iterator per archive file over its ServiceRecordRows from
+        start_date through end_date, each in (service_date, id) order and
+        read batch_size rows per query.
+        """
+        statement = select_rows(ServiceRecord).where(
+            ServiceRecord.service_date >= start_date,
+            ServiceRecord.service_date <= end_date
+        )
+        return [
+            map(ServiceRecordRow._make, db_manager.iter_keyset(
+                statement, [ServiceRecord.service_date, ServiceRecord.id], batch_size
+            ))
+            for db_manager in self.archive_databases(start_date, end_date)
+        ]
+
+    def archive(self, horizon_days=None, batch_size=None) -> Counter:
+        """
+        Moves the service records dated more than horizon_days (defaults to
+        SERVICE_RECORD_ARCHIVE_HORIZON_DAYS) days ago into the archive file
+        of their year. Returns a Counter of records moved per year.
+        """
+        horizon_days = horizon_days if horizon_days is not None else SERVICE_RECORD_ARCHIVE_HORIZON_DAYS
+        batch_size = batch_size if batch_size is not None else SERVICE_RECORD_ARCHIVE_BATCH_SIZE
+        cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff -= timedelta(days=horizon_days)
+        moved = Counter()
+        if self.archive_dir is None:
+            print("\nIn-memory databases cannot be archived.")
+            return moved
+
+        with self.db_manager.engine.connect() as connection:
+            oldest = connection.exec_driver_sql(
+                "SELECT min(service_date) FROM service_records"
+            ).scalar()
+            if oldest is None or oldest >= stored_date(cutoff):
+                print("\nNo service records to archive.")
+                return moved
+            os.makedirs(self.archive_dir, exist_ok=True)
+            for year in range(int(oldest[:4]), cutoff.year + 1):
+                start = stored_date(datetime(year, 1, 1))
+                end = stored_date(min(datetime(year + 1, 1, 1), cutoff))
+                if connection.exec_driver_sql(
+                    "SELECT 1 FROM service_records WHERE service_date >= ? AND service_date < ? LIMIT 1",
+                    (start, end)
+                ).first() is not None:
+                    moved[year] = self.archive_year(connection, year, start, end, batch_size)
+            # Archived weeks no longer have any records behind them
+            for _, table, _ in ROLLUPS:
+                connection.exec_driver_sql(
+                    f"DELETE FROM {table} WHERE week < ? "
+                    "AND consultation_count = 0 AND fee_total_cents = 0",
+                    (iso_week(cutoff),)
+                )
+            connection.commit()
+
+        print(
+            f"\nArchived {sum(moved.values())} service records dated before "
+            f"{cutoff:%m-%d-%Y} into {len(moved)} archive file(s)."
+        )
+        return moved
+
+    def archive_year(self, connection, year, start, end, batch_size):
+        """
+        Moves the records dated from start up to (not including) end into
+        the year's archive file, batch_size per transaction. Returns the
+        number of records moved.
+        """
+        schema = f"archive_{year}"
+        moved = 0
+        connection.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (self.path(year),))
+        try:
+            for statement in ARCHIVE_TABLE_SQL:
+                connection.exec_driver_sql(statement.format(schema=schema))
+            connection.commit()
+            while True:
+                record_ids = tuple(connection.exec_driver_sql(
+                    "SELECT id FROM main.service_records "
+                    "WHERE service_date >= ? AND service_date < ? "
+                    "ORDER BY service_date LIMIT ?",
+                    (start, end, batch_size)
+                ).scalars())
+                if not record_ids:
+                    break
+                where = f"service_records.id IN ({', '.join('?' for _ in record_ids)})"
+                connection.exec_driver_sql(
+                    f"INSERT OR IGNORE INTO {schema}.service_records ({ARCHIVE_COLUMNS}) "
+                    f"SELECT {ARCHIVE_COLUMNS} FROM main.service_records WHERE {where}",
+                    record_ids
+                )
+                apply_rollups_where(connection, where, record_ids, remove=True)
+                connection.exec_driver_sql(
+                    f"DELETE FROM main.service_records WHERE {where}", record_ids
+                )
+                connection.commit()
+                moved += len(record_ids)
+        finally:
+            connection.rollback()
+            connection.exec_driver_sql(f"DETACH DATABASE {schema}")
+        return moved
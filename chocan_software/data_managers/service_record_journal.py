@@ -0,0 +1,300 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from sqlalchemy.exc import SQLAlchemyError
+from chocan_software.data_managers.service_authorizations import ServiceAuthorizations
+from chocan_software.data_managers.service_catalog import ServiceCatalog
+from chocan_software.data_managers.service_record_manager import DUPLICATE_REASON
+from chocan_software.data_managers.service_record_manager import IMPORT_FIELDS
+from chocan_software.constants import (
+    SERVICE_RECORD_JOURNAL_PATH,
+    JOURNAL_SYNC_INTERVAL,
+    JOURNAL_SYNC_BATCH_SIZE
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class ServiceRecordJournal:
+    """
+    Local append-only journal of service entries confirmed at a provider
+    terminal, synced into service_records in the background.
+
+    append() writes the entry as one JSON line and fsyncs it before
+    returning, so a confirmed entry survives the database being locked or
+    unavailable and the terminal never waits on the write lock. A sync thread
+    reads the entries after the last synced offset, sync_batch_size at a
+    time, and adds each batch in one transaction with
+    insert_service_record_batch, then records the offset past that batch in
+    <path>.offset. If the database is busy the batch is retried on the next
+    pass.
+
+    Replays are idempotent: an entry that was committed before a crash but
+    whose offset was not yet recorded is ignored on replay by the
+    unique_service_record constraint. Entries that can never be added
+    (e.g. the member was removed in the meantime) are written to
+    <path>.rejects.jsonl with the reason. Once every entry has been synced
+    the journal is truncated.
+
+    Several terminal processes may share one journal path (by default every
+    terminal started in the same directory does): appends and the truncate
+    hold an exclusive flock on the journal, so an entry appended by another
+    process is never truncated away before it is synced, and sync passes
+    hold one on <path>.lock so only one process syncs the journal at a time.
+    Where flock is not available (Windows) only threads of one process are
+    kept apart, so give each terminal its own journal path there.
+    """
+    def __init__(self, service_record_manager, path=None, interval=None, sync_batch_size=None):
+        self.record_manager = service_record_manager
+        self.catalog = ServiceCatalog.for_database(service_record_manager.db_manager)
+        self.authorizations = ServiceAuthorizations.for_database(service_record_manager.db_manager)
+        self.path = path if path is not None else SERVICE_RECORD_JOURNAL_PATH
+        self.offset_path = f"{self.path}.offset"
+        self.sync_lock_path = f"{self.path}.lock"
+        self.rejects_path = f"{self.path}.rejects.jsonl"
+        self.interval = interval if interval is not None else JOURNAL_SYNC_INTERVAL
+        self.sync_batch_size = (
+            sync_batch_size if sync_batch_size is not None else JOURNAL_SYNC_BATCH_SIZE
+        )
+        self.last_error = None
+        # Held while appending to or truncating the journal
+        self.lock = threading.Lock()
+        # Held for a whole sync pass so the background and final syncs never overlap
+        self.sync_lock = threading.Lock()
+        self.pending = threading.Event()
+        self.stopping = threading.Event()
+        self.syncer = threading.Thread(
+            target=self.run, name="service-record-journal", daemon=True
+        )
+        self.syncer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, provider_number, member_number, service_code, date_of_service, comments=None):
+        """
+        Durably journals a service entry (with the same arguments as
+        ServiceRecordManager.add_service_record) and wakes the sync thread.
+        """
+        entry = {
+            'provider_number': provider_number,
+            'member_number': member_number,
+            'service_code': service_code,
+            'date_of_service': date_of_service,
+            'comments': comments,
+        }
+        line = (json.dumps(entry) + "\n").encode()
+        with self.lock:
+            with open(self.path, 'ab+') as journal, self.file_lock(journal):
+                # Start a new line after an append cut short by a crash, so the
+                # fragment is rejected on its own instead of corrupting this entry
+                if journal.seek(0, os.SEEK_END) > 0:
+                    journal.seek(-1, os.SEEK_END)
+                    if journal.read(1) != b"\n":
+                        line = b"\n" + line
+                journal.write(line)
+                journal.flush()
+                os.fsync(journal.fileno())
+        self.pending.set()
+
+    def close(self):
+        """
+        Stops the sync thread and makes a last attempt to sync the journal.
+        Entries that could not be synced stay in the journal for next time.
+        """
+        self.stopping.set()
+        self.pending.set()
+        self.syncer.join()
+        try:
+            self.sync()
+        except SQLAlchemyError as e:
+            self.last_error = e
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.pending.wait(self.interval)
+            self.pending.clear()
+            if self.stopping.is_set():
+                break
+            try:
+                self.sync()
+                self.last_error = None
+            except SQLAlchemyError as e:
+                # The database is locked or unavailable; retry on the next pass
+                self.last_error = e
+
+    def sync(self):
+        """
+        Syncs every complete journal entry after the recorded offset into
+        service_records. Returns a tuple of (synced, rejected) entry counts;
+        entries that were already stored count as synced.
+        """
+        with self.sync_lock, open(self.sync_lock_path, 'a') as lock_file, self.file_lock(lock_file):
+            synced = 0
+            rejected = 0
+            offset = self.read_offset()
+            while True:
+                entries, end = self.read_entries(offset)
+                if not entries:
+                    break
+                added, rejects = self.sync_entries(entries)
+                synced += added
+                rejected += len(rejects)
+                self.write_rejects(rejects)
+                offset = end
+                self.write_offset(offset)
+            self.truncate(offset)
+            return synced, rejected
+
+    def sync_entries(self, entries):
+        """
+        Validates the entries and adds the valid ones in one transaction.
+        Returns the number stored (including ones that were already stored)
+        and a list of (entry, reason) for the ones rejected.
+        """
+        provider_ids, member_ids = self.record_manager.existing_person_ids(entries)
+        services = {
+            service.id: (service.name, service.fee_cents)
+            for service in self.catalog.snapshot().values()
+        }
+        authorizations = self.authorizations.snapshot()
+        batch = []
+        rejects = []
+        for index, entry in enumerate(entries):
+            record, reason = self.record_manager.validate_import_row(
+                entry, provider_ids, member_ids, services, authorizations
+            )
+            if record is None:
+                rejects.append((entry, reason))
+            else:
+                batch.append((index, entry, record))
+        added = len(batch)
+        if batch:
+            _, skipped = self.record_manager.insert_service_record_batch(batch)
+            # Duplicates are entries stored before an earlier sync was interrupted
+            for _, entry, reason in skipped:
+                if reason != DUPLICATE_REASON:
+                    rejects.append((entry, reason))
+                    added -= 1
+        return added, rejects
+
+    def read_entries(self, offset):
+        """
+        Reads up to sync_batch_size complete entries starting at the byte
+        offset. Returns the entries and the offset just past the last one. A
+        line without its newline is an append still in progress (or cut short
+        by a crash) and is left for a later pass.
+        """
+        entries = []
+        try:
+            journal = open(self.path, 'rb')
+        except FileNotFoundError:
+            return entries, offset
+        with journal:
+            journal.seek(offset)
+            while len(entries) < self.sync_batch_size:
+                line = journal.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                entries.append(entry if isinstance(entry, dict) else {})
+        return entries, offset
+
+    def read_offset(self):
+        """
+        The byte offset of the first entry not yet synced. An offset past the
+        end of the journal (left by a crash while truncating) restarts from
+        the beginning, which is safe because replays are idempotent.
+        """
+        try:
+            with open(self.offset_path) as offset_file:
+                offset = int(offset_file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+        return offset if offset <= size else 0
+
+    def write_offset(self, offset):
+        temporary_path = f"{self.offset_path}.tmp"
+        with open(temporary_path, 'w') as offset_file:
+            offset_file.write(str(offset))
+            offset_file.flush()
+            os.fsync(offset_file.fileno())
+        os.replace(temporary_path, self.offset_path)
+
+    def write_rejects(self, rejects):
+        if not rejects:
+            return
+        with open(self.rejects_path, 'a') as rejects_file:
+            for entry, reason in rejects:
+                row = {field: entry.get(field) for field in IMPORT_FIELDS}
+                row['reason'] = reason
+                rejects_file.write(json.dumps(row) + "\n")
+
+    def truncate(self, offset):
+        """
+        Empties the journal once every entry up to its end has been synced.
+        The offset is reset before the journal is truncated, so a crash in
+        between only causes an idempotent replay.
+        """
+        if offset == 0:
+            return
+        with self.lock:
+            try:
+                journal = open(self.path, 'r+b')
+            except FileNotFoundError:
+                return
+            with journal, self.file_lock(journal):
+                # Another process may have appended since the sync read it
+                if os.fstat(journal.fileno()).st_size != offset:
+                    return
+                self.write_offset(0)
+                journal.truncate(0)
+
+    @staticmethod
+    @contextmanager
+    def file_lock(journal):
+        """
+        Holds an exclusive flock on an open file, shutting out other
+        processes locking the same file.
+        """
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(journal.fileno(), fcntl.LOCK_UN)
+
+    def pending_entries(self) -> int:
+        """
+        The number of complete journal entries not yet synced.
+        """
+        count = 0
+        offset = self.read_offset()
+        try:
+            with open(self.path, 'rb') as journal:
+                journal.seek(offset)
+                for line in journal:
+                    if line.endswith(b"\n") and line.strip():
+                        count += 1
+        except FileNotFoundError:
+            pass
+        return count
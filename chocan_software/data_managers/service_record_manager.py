@@ -1,23 +1,90 @@
+import csv
+import heapq
+from collections import Counter
 from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from chocan_software.models import Member
 from chocan_software.models import Provider
 from chocan_software.models import Service
 from chocan_software.models import ServiceRecord
 from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.import_files import read_import_file
+from chocan_software.data_managers.rollup_manager import RollupManager
+from chocan_software.data_managers.service_record_archive import ServiceRecordArchive
+from chocan_software.data_managers.service_authorizations import ServiceAuthorizations
+from chocan_software.data_managers.service_authorizations import is_authorized
+from chocan_software.data_managers.rows import ServiceRecordRow
+from chocan_software.data_managers.rows import select_rows
+from chocan_software.data_managers.rows import to_row
+from chocan_software.constants import (
+    BULK_IMPORT_BATCH_SIZE,
+    SERVICERECORD_COMMENT_MAX_LEN
+)
+
+IMPORT_FIELDS = ['provider_number', 'member_number', 'service_code', 'date_of_service', 'comments']
+
+# Reasons insert_service_record_batch gives for the rows the database skipped
+DUPLICATE_REASON = "duplicate service record"
+CONSTRAINT_REASON = "rejected by database constraint"
+
+
+# Bulk imports bypass per-row ORM/Core parameter processing. The timestamp is
+# filled in by SQLite exactly as the func.now() column default does.
+BULK_INSERT_SQL = (
+    "INSERT {conflict}INTO service_records "
+    "(provider_id, member_id, service_id, service_date, service_name, service_fee_cents, "
+    "timestamp, comments) "
+    "VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)"
+)
+
+# The unique keys among a list of (provider_id, member_id, service_id,
+# service_date) that are already stored, joined from a VALUES list so each
+# key is one search of the unique index
+RECORD_KEYS_SQL = (
+    "WITH batch_keys (provider_id, member_id, service_id, service_date) AS (VALUES {rows}) "
+    "SELECT service_records.provider_id, service_records.member_id, "
+    "service_records.service_id, service_records.service_date "
+    "FROM batch_keys JOIN service_records "
+    "ON service_records.provider_id = batch_keys.provider_id "
+    "AND service_records.member_id = batch_keys.member_id "
+    "AND service_records.service_id = batch_keys.service_id "
+    "AND service_records.service_date = batch_keys.service_date"
+)
+# Keys looked up per RECORD_KEYS_SQL statement, well under SQLite's limit on
+# bound parameters
+RECORD_KEYS_CHUNK = 1000
+
+
+@lru_cache(maxsize=4096)
+def parse_service_date(date_of_service):
+    """
+    Parses an MM-DD-YYYY date of service into a datetime and the string the
+    SQLite DateTime type stores it as. Imports repeat the same few dates many
+    times, so parsed dates are cached.
+    """
+    service_date = datetime.strptime(date_of_service, "%m-%d-%Y")
+    return service_date, service_date.strftime("%Y-%m-%d %H:%M:%S.%f")
 
 
 class ServiceRecordManager:
-    def __init__(self, db_manager=None):
+    def __init__(self, db_manager=None, archive_dir=None):
         self.db_manager = db_manager if db_manager is not None else DatabaseManager()
+        self.rollups = RollupManager(self.db_manager)
+        self.authorizations = ServiceAuthorizations.for_database(self.db_manager)
+        self.archive = ServiceRecordArchive(self.db_manager, archive_dir)
 
     def add_service_record(self, provider_number, member_number, service_code, date_of_service, comments=None):
         provider_id = int(provider_number)
         member_id = int(member_number)
         service_id = int(service_code)
+        if not self.authorizations.is_authorized(provider_id, service_id):
+            return
 
         with self.db_manager.get_session(commit=True) as session:
-            provider = session.query(Provider).filter_by(id=provider_id).first()
-            member = session.query(Member).filter_by(id=member_id).first()
+            provider = session.query(Provider).filter_by(id=provider_id, deleted_at=None).first()
+            member = session.query(Member).filter_by(id=member_id, deleted_at=None).first()
             service = session.query(Service).filter_by(id=service_id).first()
             if not provider or not member or not service:
                 return
@@ -27,10 +94,13 @@ class ServiceRecordManager:
                 member_id=member.id,
                 service_id=service.id,
                 service_date=datetime.strptime(date_of_service, "%m-%d-%Y"),
-                comments=comments
+                comments=comments,
+                service_name=service.name,
+                service_fee_cents=service.fee_cents
             )
             session.add(new_service_record)
-            session.commit()
+            self.rollups.add(session, provider.id, member.id,
+                             new_service_record.service_date, service.fee_cents)
     
     def update_service_record(self, record_id, **kwargs):
         record_id = int(record_id)
@@ -40,9 +110,16 @@ class ServiceRecordManager:
                 print(f"\nService record with ID {record_id} not found.")
                 return
 
+            self.add_to_rollups(session, record, -1)
+            old_service_id = record.service_id
             for key, value in kwargs.items():
                 if key not in ['id']:
                     setattr(record, key, value)
+            if record.service_id != old_service_id:
+                service = session.query(Service).filter_by(id=record.service_id).first()
+                record.service_name = service.name if service else None
+                record.service_fee_cents = service.fee_cents if service else None
+            self.add_to_rollups(session, record, 1)
             
             print(f"\nUpdated service record.")
         
@@ -55,39 +132,336 @@ class ServiceRecordManager:
                 return
 
             session.delete(record)
+            self.add_to_rollups(session, record, -1)
             print(f"\nDeleted service record.")
     
+    def add_to_rollups(self, session, record, count):
+        """
+        Adds (count=1) or removes (count=-1) a service record's contribution
+        to the weekly rollups. Records without a fee count for nothing, as
+        they do in the reports.
+        """
+        if record.service_fee_cents is not None:
+            self.rollups.add(session, record.provider_id, record.member_id,
+                             record.service_date, record.service_fee_cents, count)
+
     def view_service_records(self):
-        with self.db_manager.get_session() as session:
-            records = session.query(ServiceRecord).all()
-            if not records:
-                print("\nNo service records found.")
-            else:
-                for record in records:
-                    print(f"  {record.id:06}: {record.service_date} - {record.member.name:<25} - {record.service.name}")
+        statement = select(
+            ServiceRecord.id,
+            ServiceRecord.service_date,
+            Member.name.label("member_name"),
+            ServiceRecord.service_name
+        ).join(Member, Member.id == ServiceRecord.member_id)
+        found = False
+        for record in self.db_manager.iter_keyset(statement, [ServiceRecord.id]):
+            found = True
+            print(f"  {record.id:06}: {record.service_date} - {record.member_name:<25} - {record.service_name}")
+        if not found:
+            print("\nNo service records found.")
     
     def get_service_record(self, record_id):
         record_id = int(record_id)
         with self.db_manager.get_session() as session:
-            record = session.query(ServiceRecord).filter_by(id=record_id).first()
-            return record
+            record = session.execute(
+                select_rows(ServiceRecord).where(ServiceRecord.id == record_id)
+            ).first()
+            return to_row(ServiceRecord, record)
     
     def get_service_records_by_provider(self, provider_number):
         provider_id = int(provider_number)
         with self.db_manager.get_session() as session:
-            records = session.query(ServiceRecord).filter_by(provider_id=provider_id).all()
-            return records
+            records = session.execute(
+                select_rows(ServiceRecord).where(ServiceRecord.provider_id == provider_id)
+            )
+            return [ServiceRecordRow._make(record) for record in records]
     
     def get_service_records_by_member(self, member_number):
         member_id = int(member_number)
         with self.db_manager.get_session() as session:
-            records = session.query(ServiceRecord).filter_by(member_id=member_id).all()
-            return records
+            records = session.execute(
+                select_rows(ServiceRecord).where(ServiceRecord.member_id == member_id)
+            )
+            return [ServiceRecordRow._make(record) for record in records]
 
     def query_service_records_by_date_range(self, start_date: datetime, end_date: datetime):
+        """
+        The service records from start_date through end_date, including the
+        ones moved to the archive files of those years.
+        """
+        archived = self.archive.query_records(start_date, end_date)
         with self.db_manager.get_session() as session:
-            records = session.query(ServiceRecord).filter(
+            records = session.execute(
+                select_rows(ServiceRecord).where(
+                    ServiceRecord.service_date >= start_date,
+                    ServiceRecord.service_date <= end_date
+                )
+            )
+            return archived + [ServiceRecordRow._make(record) for record in records]
+
+    def iter_service_records(self, *criteria, batch_size=None):
+        """
+        Yields the service records matching the criteria as ServiceRecordRows
+        in (service_date, id) order, batch_size rows per query, so any number
+        of records can be walked in constant memory.
+        """
+        statement = select_rows(ServiceRecord).where(*criteria)
+        return map(ServiceRecordRow._make, self.db_manager.iter_keyset(
+            statement, [ServiceRecord.service_date, ServiceRecord.id], batch_size
+        ))
+
+    def iter_service_records_by_provider(self, provider_number, batch_size=None):
+        return self.iter_service_records(
+            ServiceRecord.provider_id == int(provider_number), batch_size=batch_size
+        )
+
+    def iter_service_records_by_member(self, member_number, batch_size=None):
+        return self.iter_service_records(
+            ServiceRecord.member_id == int(member_number), batch_size=batch_size
+        )
+
+    def iter_service_records_by_date_range(self, start_date: datetime, end_date: datetime,
+                                           batch_size=None):
+        """
+        Yields the service records from start_date through end_date in
+        (service_date, id) order, merging the ones moved to the archive
+        files of those years in with the rest as they are read.
+        """
+        return heapq.merge(
+            self.iter_service_records(
                 ServiceRecord.service_date >= start_date,
-                ServiceRecord.service_date <= end_date
-            ).all()
-            return records
+                ServiceRecord.service_date <= end_date,
+                batch_size=batch_size
+            ),
+            *self.archive.iter_records(start_date, end_date, batch_size),
+            key=lambda record: (record.service_date, record.id)
+        )
+
+    def archive_service_records(self, horizon_days=None, batch_size=None):
+        """
+        Moves the service records older than horizon_days into the per-year
+        archive files (see ServiceRecordArchive). Returns the Counter of
+        records moved per year.
+        """
+        return self.archive.archive(horizon_days, batch_size)
+
+    def import_service_records(self, file_path, rejects_path=None, batch_size=None):
+        """
+        Bulk imports service records from a CSV (with a header row) or JSONL
+        file whose fields match add_service_record: provider_number,
+        member_number, service_code, date_of_service (MM-DD-YYYY) and optional
+        comments.
+
+        Provider and member numbers are validated against id sets loaded once
+        up front, service codes against the services loaded with them (whose
+        name and fee are stored on each record) and the provider's service
+        authorizations, and valid rows are inserted batch_size at a time
+        with one executemany and one commit per batch. Rejected rows are
+        written to rejects_path (defaults to <file_path>.rejects.csv) along
+        with the reason they were rejected.
+        Returns a tuple of (imported, rejected) row counts.
+        """
+        batch_size = batch_size if batch_size is not None else BULK_IMPORT_BATCH_SIZE
+        if rejects_path is None:
+            rejects_path = f"{file_path}.rejects.csv"
+
+        with self.db_manager.get_session() as session:
+            provider_ids = set(session.scalars(
+                select(Provider.id).where(Provider.deleted_at.is_(None))
+            ))
+            member_ids = set(session.scalars(
+                select(Member.id).where(Member.deleted_at.is_(None))
+            ))
+            services = {
+                service_id: (name, fee_cents)
+                for service_id, name, fee_cents in session.execute(
+                    select(Service.id, Service.name, Service.fee_cents)
+                )
+            }
+        authorizations = self.authorizations.snapshot()
+
+        imported = 0
+        rejected = 0
+        with open(rejects_path, 'w', newline='') as rejects_file:
+            rejects = csv.writer(rejects_file)
+            rejects.writerow(['line'] + IMPORT_FIELDS + ['reason'])
+
+            def reject(line_number, row, reason):
+                rejects.writerow(
+                    [line_number] + [row.get(field) for field in IMPORT_FIELDS] + [reason]
+                )
+
+            def flush(batch):
+                inserted, skipped = self.insert_service_record_batch(batch)
+                for line_number, row, reason in skipped:
+                    reject(line_number, row, reason)
+                return inserted, len(skipped)
+
+            batch = []
+            for line_number, row in read_import_file(file_path):
+                record, reason = self.validate_import_row(
+                    row, provider_ids, member_ids, services, authorizations
+                )
+                if record is None:
+                    reject(line_number, row, reason)
+                    rejected += 1
+                    continue
+                batch.append((line_number, row, record))
+                if len(batch) >= batch_size:
+                    inserted, duplicates = flush(batch)
+                    imported += inserted
+                    rejected += duplicates
+                    batch = []
+            if batch:
+                inserted, duplicates = flush(batch)
+                imported += inserted
+                rejected += duplicates
+
+        print(f"\nImported {imported} service records ({rejected} rejected).")
+        if rejected:
+            print(f"Rejected rows written to: {rejects_path}")
+        return imported, rejected
+
+    def insert_service_record_batch(self, batch):
+        """
+        Inserts a batch of (line_number, row, record) tuples in one transaction
+        with a single driver-level executemany, and adds them to the weekly
+        rollups in the same transaction. If the batch violates a constraint
+        it is rolled back and re-inserted with INSERT OR IGNORE; the rows
+        that were ignored are then found by comparing the batch against the
+        keys of the rows it added, and those whose key is already stored are
+        told apart from those a CHECK constraint rejected.
+        Returns the inserted count and a list of (line_number, row, reason)
+        for the skipped entries, with DUPLICATE_REASON or CONSTRAINT_REASON
+        as the reason.
+        """
+        records = [record for _, _, record in batch]
+        try:
+            with self.db_manager.get_session(commit=True) as session:
+                connection = session.connection()
+                connection.exec_driver_sql(BULK_INSERT_SQL.format(conflict=""), records)
+                self.rollups.add_records(connection, records)
+            return len(batch), []
+        except IntegrityError:
+            pass
+
+        with self.db_manager.get_session(commit=True) as session:
+            connection = session.connection()
+            inserted = connection.exec_driver_sql(
+                BULK_INSERT_SQL.format(conflict="OR IGNORE "), records
+            ).rowcount
+            inserted_keys = Counter(connection.exec_driver_sql(
+                "SELECT provider_id, member_id, service_id, service_date "
+                "FROM service_records WHERE id > ?",
+                (self.last_id_before(connection, inserted),)
+            ).fetchall())
+
+            skipped = []
+            for entry in batch:
+                key = entry[2][:4]
+                if inserted_keys[key]:
+                    inserted_keys[key] -= 1
+                else:
+                    skipped.append(entry)
+            skipped_ids = {id(entry) for entry in skipped}
+            self.rollups.add_records(connection, [
+                entry[2] for entry in batch if id(entry) not in skipped_ids
+            ])
+            stored_keys = self.stored_record_keys(
+                connection, [entry[2][:4] for entry in skipped]
+            )
+        return len(batch) - len(skipped), [
+            (line_number, row, DUPLICATE_REASON if record[:4] in stored_keys else CONSTRAINT_REASON)
+            for line_number, row, record in skipped
+        ]
+
+    @staticmethod
+    def stored_record_keys(connection, keys):
+        """
+        The set of (provider_id, member_id, service_id, service_date) keys
+        among keys that a service record already holds, looked up
+        RECORD_KEYS_CHUNK keys per query.
+        """
+        keys = list(set(keys))
+        stored = set()
+        for start in range(0, len(keys), RECORD_KEYS_CHUNK):
+            chunk = keys[start:start + RECORD_KEYS_CHUNK]
+            stored.update(tuple(row) for row in connection.exec_driver_sql(
+                RECORD_KEYS_SQL.format(rows=", ".join("(?, ?, ?, ?)" for _ in chunk)),
+                tuple(value for key in chunk for value in key)
+            ))
+        return stored
+
+    def existing_person_ids(self, rows):
+        """
+        The provider and member ids referenced by a group of import rows that
+        exist and are not tombstoned, read with one query per table.
+        """
+        def numbers(field):
+            ids = set()
+            for row in rows:
+                try:
+                    ids.add(int(row[field]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            return ids
+
+        with self.db_manager.get_session() as session:
+            provider_ids = set(session.scalars(
+                select(Provider.id).where(
+                    Provider.id.in_(numbers('provider_number')), Provider.deleted_at.is_(None)
+                )
+            ))
+            member_ids = set(session.scalars(
+                select(Member.id).where(
+                    Member.id.in_(numbers('member_number')), Member.deleted_at.is_(None)
+                )
+            ))
+        return provider_ids, member_ids
+
+    @staticmethod
+    def last_id_before(connection, inserted):
+        """
+        The highest service record id before the `inserted` rows just added
+        in this transaction. The transaction holds the write lock, so those
+        rows took the ids directly after it.
+        """
+        last_id = connection.exec_driver_sql(
+            "SELECT coalesce(max(id), 0) FROM service_records"
+        ).scalar()
+        return last_id - inserted
+
+    @staticmethod
+    def validate_import_row(row, provider_ids, member_ids, services, authorizations):
+        """
+        Validates one import row against the provider and member id sets, the
+        services map of service id -> (name, fee_cents) and a
+        ServiceAuthorizations snapshot. Returns (record,
+        None) where record is a tuple of (provider_id, member_id, service_id,
+        service_date, service_name, service_fee_cents, comments) ready for
+        BULK_INSERT_SQL, or (None, reason) if the row is rejected.
+        """
+        try:
+            provider_id = int(row.get('provider_number'))
+            member_id = int(row.get('member_number'))
+            service_id = int(row.get('service_code'))
+        except (TypeError, ValueError):
+            return None, "malformed or missing number"
+        if provider_id not in provider_ids:
+            return None, "invalid provider number"
+        if member_id not in member_ids:
+            return None, "invalid member number"
+        service = services.get(service_id)
+        if service is None:
+            return None, "invalid service code"
+        if not is_authorized(authorizations, provider_id, service_id):
+            return None, "service not authorized for provider"
+        try:
+            service_date, stored_date = parse_service_date(str(row.get('date_of_service')))
+        except ValueError:
+            return None, "invalid date of service"
+        if service_date > datetime.now():
+            return None, "date of service is in the future"
+        comments = row.get('comments') or None
+        if comments is not None and len(comments) > SERVICERECORD_COMMENT_MAX_LEN:
+            return None, "comments too long"
+        return (provider_id, member_id, service_id, stored_date, *service, comments), None
@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from chocan_software.data_managers.service_authorizations import ServiceAuthorizations
+from chocan_software.data_managers.service_catalog import ServiceCatalog
+from chocan_software.constants import (
+    GROUP_COMMIT_INTERVAL,
+    GROUP_COMMIT_MAX_RECORDS
+)
+
+
+class ServiceRecordRejected(Exception):
+    """
+    Raised by a submission's future when its record was not added, with the
+    reason (invalid number, duplicate service record, ...) as the message.
+    """
+    pass
+
+
+class ServiceRecordWriteQueue:
+    """
+    Write-behind queue in front of ServiceRecordManager that group-commits
+    service records submitted by concurrent callers.
+
+    submit() queues a record and returns a Future at once. A single writer
+    thread collects submissions for up to `interval` seconds after the first
+    one arrives, or until `max_records` are waiting, validates them together
+    and adds them in one transaction with insert_service_record_batch, so a
+    burst of terminals pays for one commit instead of one each and the
+    terminals no longer contend with each other for the write lock. Each
+    future is resolved only after that transaction has committed: with True
+    once the record is stored, with ServiceRecordRejected if the record
+    itself was invalid or a duplicate, or with the database error if the
+    whole transaction failed.
+    """
+    STOP = object()
+
+    def __init__(self, service_record_manager, interval=None, max_records=None):
+        self.record_manager = service_record_manager
+        self.db_manager = service_record_manager.db_manager
+        self.catalog = ServiceCatalog.for_database(self.db_manager)
+        self.authorizations = ServiceAuthorizations.for_database(self.db_manager)
+        self.interval = interval if interval is not None else GROUP_COMMIT_INTERVAL
+        self.max_records = max_records if max_records is not None else GROUP_COMMIT_MAX_RECORDS
+        self.requests = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.writer = threading.Thread(
+            target=self.run, name="service-record-writer", daemon=True
+        )
+        self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, provider_number, member_number, service_code, date_of_service, comments=None):
+        """
+        Queues a service record (with the same arguments as
+        ServiceRecordManager.add_service_record) and returns a Future that
+        resolves once the record has been committed or rejected.
+        """
+        future = Future()
+        row = {
+            'provider_number': provider_number,
+            'member_number': member_number,
+            'service_code': service_code,
+            'date_of_service': date_of_service,
+            'comments': comments,
+        }
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The service record queue is closed.")
+            self.requests.put((row, future))
+        return future
+
+    def add_service_record(self, provider_number, member_number, service_code,
+                           date_of_service, comments=None):
+        """
+        Submits a service record and waits until it has been committed.
+        Raises ServiceRecordRejected if it was not added.
+        """
+        return self.submit(
+            provider_number, member_number, service_code, date_of_service, comments
+        ).result()
+
+    def close(self):
+        """
+        Stops accepting submissions, commits the ones already queued and
+        waits for the writer thread to finish.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(self.STOP)
+        self.writer.join()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            request = self.requests.get()
+            if request is self.STOP:
+                break
+            batch = [request]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_records:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is self.STOP:
+                    stopping = True
+                    break
+                batch.append(request)
+            self.commit(batch)
+
+    def commit(self, requests):
+        """
+        Validates a group of (row, future) requests and adds the valid ones in
+        one transaction, then resolves every future. Requests whose future
+        was cancelled while queued are dropped.
+        """
+        requests = [
+            (row, future) for row, future in requests
+            if future.set_running_or_notify_cancel()
+        ]
+        if not requests:
+            return
+        try:
+            provider_ids, member_ids = self.record_manager.existing_person_ids(
+                [row for row, _ in requests]
+            )
+            services = {
+                service.id: (service.name, service.fee_cents)
+                for service in self.catalog.snapshot().values()
+            }
+            authorizations = self.authorizations.snapshot()
+            batch = []
+            for index, (row, future) in enumerate(requests):
+                record, reason = self.record_manager.validate_import_row(
+                    row, provider_ids, member_ids, services, authorizations
+                )
+                if record is None:
+                    future.set_exception(ServiceRecordRejected(reason))
+                else:
+                    batch.append((index, row, record))
+            skipped = []
+            if batch:
+                _, skipped = self.record_manager.insert_service_record_batch(batch)
+        except Exception as e:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        skipped_reasons = {index: reason for index, _, reason in skipped}
+        for index, _, _ in batch:
+            future = requests[index][1]
+            if index in skipped_reasons:
+                future.set_exception(ServiceRecordRejected(skipped_reasons[index]))
+            else:
+                future.set_result(True)
@@ -0,0 +1,274 @@
+import atexit
+import itertools
+import json
+import os
+import re
+import sys
+import time
+import weakref
+from functools import lru_cache
+from threading import Lock
+from sqlalchemy import event
+from chocan_software.constants import (
+    SQL_INSTRUMENTATION_OUTPUT,
+    SQL_N_PLUS_ONE_THRESHOLD
+)
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames from these files are never reported as the caller of a statement
+SKIPPED_FILES = (
+    os.path.join(PACKAGE_DIR, "data_managers", "database_manager.py"),
+    os.path.abspath(__file__),
+)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement):
+    """
+    Reduces a statement to its shape: literals become ?, parameter lists of
+    any length become (?, ...) and whitespace is collapsed, so the same query
+    issued with different values normalizes to the same string.
+    """
+    statement = STRING_LITERAL.sub("?", statement)
+    statement = NUMBER_LITERAL.sub("?", statement)
+    statement = PARAMETER_LIST.sub("(?, ...)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+def calling_method():
+    """
+    Names the innermost ChocAn function on the stack outside the database
+    manager, as Class.method for methods and as the function name otherwise.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PACKAGE_DIR) and filename not in SKIPPED_FILES:
+            name = frame.f_code.co_name
+            owner = frame.f_locals.get("self", frame.f_locals.get("cls"))
+            if owner is None:
+                return name
+            owner_class = owner if isinstance(owner, type) else type(owner)
+            return f"{owner_class.__name__}.{name}"
+        frame = frame.f_back
+    return "<outside chocan_software>"
+
+
+class RowCountingCursor:
+    """
+    Wraps a DB-API cursor and adds the number of rows fetched through it to
+    a statement's statistics.
+    """
+    def __init__(self, cursor, statistics):
+        self.cursor = cursor
+        self.statistics = statistics
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.statistics["rows"] += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.statistics["rows"] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.statistics["rows"] += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.statistics["rows"] += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class SQLInstrumentation:
+    """
+    Opt-in statement instrumentation for DatabaseManager engines.
+
+    Once attached, every statement is recorded under its normalized SQL and
+    the manager method that issued it, with its count, total and maximum
+    duration and the rows it returned or changed. Statements with the same
+    shape issued from the same method at least `n_plus_one_threshold` times
+    within one session are reported as suspected N+1 queries.
+
+    Nothing is registered on an engine until attach() is called, so
+    databases that are not instrumented pay nothing for it.
+    """
+    shared_instance = None
+
+    def __init__(self, n_plus_one_threshold=None):
+        self.n_plus_one_threshold = (
+            n_plus_one_threshold if n_plus_one_threshold is not None
+            else SQL_N_PLUS_ONE_THRESHOLD
+        )
+        self.lock = Lock()
+        self.statements = {}       # (caller, sql) -> statistics
+        self.session_counts = {}   # scope -> {(caller, sql): count}
+        self.suspected_n_plus_one = {}  # (caller, sql) -> worst count in one session
+        self.connection_scopes = weakref.WeakKeyDictionary()  # Connection -> scope
+        self.scope_ids = itertools.count(1)
+        self.started = time.time()
+
+    @classmethod
+    def shared(cls):
+        """
+        The process-wide instance used when instrumentation is switched on
+        with CHOCAN_SQL_INSTRUMENTATION. Its summary is written when the
+        process exits, to CHOCAN_SQL_INSTRUMENTATION_OUTPUT if set. Accounting
+        worker processes exit without running exit handlers, so statements
+        run in them are not included.
+        """
+        if cls.shared_instance is None:
+            cls.shared_instance = cls()
+            atexit.register(cls.shared_instance.dump, SQL_INSTRUMENTATION_OUTPUT)
+        return cls.shared_instance
+
+    def attach(self, db_manager):
+        event.listen(db_manager.engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(db_manager.engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(db_manager.Session, "after_begin", self.after_begin)
+        event.listen(db_manager.Session, "after_transaction_end", self.after_transaction_end)
+
+    def detach(self, db_manager):
+        event.remove(db_manager.engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(db_manager.engine, "after_cursor_execute", self.after_cursor_execute)
+        event.remove(db_manager.Session, "after_begin", self.after_begin)
+        event.remove(db_manager.Session, "after_transaction_end", self.after_transaction_end)
+
+    def after_begin(self, session, transaction, connection):
+        # Statements are grouped into sessions through the connection the
+        # session is using.
+        if "sql_scope" not in session.info:
+            session.info["sql_scope"] = next(self.scope_ids)
+        with self.lock:
+            self.connection_scopes[connection] = session.info["sql_scope"]
+
+    def after_transaction_end(self, session, transaction):
+        if transaction.parent is None and "sql_scope" in session.info:
+            with self.lock:
+                self.session_counts.pop(session.info["sql_scope"], None)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("sql_started", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["sql_started"].pop()
+        caller = calling_method()
+        sql = normalize_sql(statement)
+        key = (caller, sql)
+        scope = self.connection_scopes.get(conn)
+
+        with self.lock:
+            statistics = self.statements.get(key)
+            if statistics is None:
+                statistics = self.statements[key] = {
+                    "caller": caller,
+                    "sql": sql,
+                    "count": 0,
+                    "total_seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                }
+            statistics["count"] += 1
+            statistics["total_seconds"] += duration
+            statistics["max_seconds"] = max(statistics["max_seconds"], duration)
+            if cursor.description is None and cursor.rowcount is not None and cursor.rowcount >= 0:
+                statistics["rows"] += cursor.rowcount
+
+            if scope is not None:
+                counts = self.session_counts.setdefault(scope, {})
+                count = counts[key] = counts.get(key, 0) + 1
+                if count >= self.n_plus_one_threshold:
+                    self.suspected_n_plus_one[key] = max(
+                        self.suspected_n_plus_one.get(key, 0), count
+                    )
+
+        if cursor.description is not None and context is not None:
+            # Rows of a SELECT are only known once they have been fetched
+            context.cursor = RowCountingCursor(context.cursor, statistics)
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.session_counts.clear()
+            self.suspected_n_plus_one.clear()
+            self.started = time.time()
+
+    def summary(self) -> dict:
+        """
+        The statements recorded so far, slowest total first, and the
+        suspected N+1 queries.
+        """
+        with self.lock:
+            statements = sorted(
+                (dict(statistics) for statistics in self.statements.values()),
+                key=lambda statistics: statistics["total_seconds"],
+                reverse=True
+            )
+            suspects = [
+                {"caller": caller, "sql": sql, "count_in_one_session": count}
+                for (caller, sql), count in sorted(
+                    self.suspected_n_plus_one.items(), key=lambda item: -item[1]
+                )
+            ]
+        return {
+            "elapsed_seconds": time.time() - self.started,
+            "statement_count": sum(statistics["count"] for statistics in statements),
+            "total_seconds": sum(statistics["total_seconds"] for statistics in statements),
+            "n_plus_one_threshold": self.n_plus_one_threshold,
+            "statements": statements,
+            "suspected_n_plus_one": suspects,
+        }
+
+    def format_table(self, limit=None):
+        summary = self.summary()
+        statements = summary["statements"][:limit] if limit else summary["statements"]
+        lines = [
+            f"{summary['statement_count']} statements, "
+            f"{summary['total_seconds'] * 1000:.2f} ms in SQL",
+            f"{'CALLER':<45} {'COUNT':>7} {'TOTAL ms':>10} {'MAX ms':>9} {'ROWS':>9}  SQL",
+        ]
+        for statistics in statements:
+            lines.append(
+                f"{statistics['caller']:<45} {statistics['count']:>7} "
+                f"{statistics['total_seconds'] * 1000:>10.2f} "
+                f"{statistics['max_seconds'] * 1000:>9.2f} "
+                f"{statistics['rows']:>9}  {statistics['sql'][:80]}"
+            )
+        if summary["suspected_n_plus_one"]:
+            lines.append(
+                f"\nSuspected N+1 queries (same query issued {self.n_plus_one_threshold}+ "
+                "times in one session):"
+            )
+            for suspect in summary["suspected_n_plus_one"]:
+                lines.append(
+                    f"  {suspect['caller']}: {suspect['count_in_one_session']}x "
+                    f"{suspect['sql'][:100]}"
+                )
+        return "\n".join(lines)
+
+    def dump(self, output=None):
+        """
+        Writes the summary to output: JSON if it ends in .json, a text table
+        otherwise, or printed to stderr if no output is given.
+        """
+        if output is None:
+            print(self.format_table(), file=sys.stderr)
+        elif output.endswith(".json"):
+            with open(output, 'w') as file:
+                json.dump(self.summary(), file, indent=2)
+        else:
+            with open(output, 'w') as file:
+                file.write(self.format_table() + "\n")
@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from chocan_software.constants import (
+    VALIDATION_CACHE_SIZE,
+    VALIDATION_CACHE_TTL
+)
+
+
+class ValidationCache:
+    """
+    In-process cache of account lookups keyed by account number, used to
+    validate provider logins and member swipes without a database round trip.
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted once the cache holds `max_size` entries. The managers that change
+    accounts invalidate their entries, so changes made in this process take
+    effect immediately; changes made by another process are picked up once
+    the entry expires. Hit, miss, eviction and expiration counters are kept
+    so the cache can be sized.
+    """
+    def __init__(self, max_size=None, ttl=None, clock=time.monotonic):
+        self.max_size = max_size if max_size is not None else VALIDATION_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else VALIDATION_CACHE_TTL
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
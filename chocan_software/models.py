@@ -1,10 +1,10 @@
 from sqlalchemy import Column
 from sqlalchemy import Integer
 from sqlalchemy import String
-from sqlalchemy import Float
 from sqlalchemy import Boolean
 from sqlalchemy import CheckConstraint
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index
 from sqlalchemy import ForeignKey
 from sqlalchemy import DateTime
 from sqlalchemy import func
@@ -18,7 +18,7 @@ from chocan_software.constants import (
     ZIP_CODE_LEN,
     MEMBER_STATUS_ACTIVE, 
     SERVICE_NAME_MAX_LEN, 
-    SERVICE_FEE_MAX, 
+    SERVICE_FEE_MAX_CENTS,
     SERVICERECORD_COMMENT_MAX_LEN
 )
 
@@ -37,6 +37,8 @@ class Member(Base):
     state = Column(String(STATE_LEN), nullable=False)
     zip_code = Column(String(ZIP_CODE_LEN), nullable=False)
     status = Column(Boolean, nullable=False)
+    # Set when the member is deactivated with a tombstone instead of deleted
+    deleted_at = Column(DateTime)
 
     service_records = relationship('ServiceRecord', backref='member')
 
@@ -97,6 +99,8 @@ class Provider(Base):
     city = Column(String(CITY_MAX_LEN), nullable=False)
     state = Column(String(STATE_LEN), nullable=False)
     zip_code = Column(String(ZIP_CODE_LEN), nullable=False)
+    # Set when the provider is deactivated with a tombstone instead of deleted
+    deleted_at = Column(DateTime)
 
     service_records = relationship('ServiceRecord', backref='provider')
     provider_services = relationship('ProviderService', backref='provider')
@@ -151,7 +155,7 @@ class Service(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(SERVICE_NAME_MAX_LEN), nullable=False)
-    fee = Column(Float, nullable=False)
+    fee_cents = Column(Integer, nullable=False)
 
     service_records = relationship('ServiceRecord', backref='service')
     provider_services = relationship('ProviderService', backref='service')
@@ -164,18 +168,18 @@ class Service(Base):
 
     __table_args__ = (
         CheckConstraint(f"length(name) <= {SERVICE_NAME_MAX_LEN}", name="check_service_name_length"),
-        CheckConstraint(f"fee < {SERVICE_FEE_MAX}", name="check_service_fee_limit"),
-        UniqueConstraint('name', 'fee', name='unique_service'),
+        CheckConstraint(f"fee_cents < {SERVICE_FEE_MAX_CENTS}", name="check_service_fee_limit"),
+        UniqueConstraint('name', 'fee_cents', name='unique_service'),
     )
     
-    def __init__(self, name, fee):
+    def __init__(self, name, fee_cents):
         """
         Initializes a Service instance.
         :param name: Name of the service.
-        :param fee: Fee for the service.
+        :param fee_cents: Fee for the service, in cents.
         """
         self.name = name
-        self.fee = fee
+        self.fee_cents = fee_cents
 
     def __repr__(self) -> str:
         """
@@ -185,7 +189,7 @@ class Service(Base):
         return (
             f"Service(id={self.id:06}, "
             f"name={self.name!r}, "
-            f"fee={self.fee:.2f})"
+            f"fee_cents={self.fee_cents})"
         )
 
 
@@ -231,6 +235,10 @@ class ServiceRecord(Base):
     service_date = Column(DateTime, nullable=False)  # Use DateTime for service_date
     timestamp = Column(DateTime, nullable=False, default=func.now())  # Automatically generate timestamp
     comments = Column(String(SERVICERECORD_COMMENT_MAX_LEN))
+    # The service's name and fee when the record was entered, so later fee
+    # changes do not reprice past services and reports need not read services
+    service_name = Column(String(SERVICE_NAME_MAX_LEN))
+    service_fee_cents = Column(Integer)
 
     # Delete if backref works as intended
     """
@@ -243,9 +251,14 @@ class ServiceRecord(Base):
         CheckConstraint(f"length(comments) <= {SERVICERECORD_COMMENT_MAX_LEN}", name="check_comments_length"),
         CheckConstraint("service_date <= CURRENT_TIMESTAMP", name="check_service_date_not_future"),
         UniqueConstraint('provider_id', 'member_id', 'service_id', 'service_date', name='unique_service_record'),
+        # Report access paths: per provider/member within a date range, and date range alone
+        Index('ix_service_records_provider_date', 'provider_id', 'service_date'),
+        Index('ix_service_records_member_date', 'member_id', 'service_date'),
+        Index('ix_service_records_service_date', 'service_date'),
     )
 
-    def __init__(self, provider_id, member_id, service_id, service_date, timestamp=None, comments=None):
+    def __init__(self, provider_id, member_id, service_id, service_date, timestamp=None, comments=None,
+                 service_name=None, service_fee_cents=None):
         """
         Initializes a ServiceRecord instance.
         :param provider_id: ID of the provider.
@@ -253,6 +266,8 @@ class ServiceRecord(Base):
         :param service_id: ID of the service.
         :param service_date: Date of the service.
         :param comments: Optional comments on the service record.
+        :param service_name: Name of the service when it was provided.
+        :param service_fee_cents: Fee of the service when it was provided, in cents.
         """
         self.provider_id = provider_id
         self.member_id = member_id
@@ -260,6 +275,8 @@ class ServiceRecord(Base):
         self.service_date = service_date
         self.timestamp = timestamp if timestamp is not None else func.now()
         self.comments = comments
+        self.service_name = service_name
+        self.service_fee_cents = service_fee_cents
 
     def __repr__(self) -> str:
         """
@@ -273,5 +290,84 @@ class ServiceRecord(Base):
             f"service_id={self.service_id:06}, "
             f"service_date={self.service_date}, "
             f"timestamp={self.timestamp}, "
-            f"comments={self.comments!r})"
-        )
\ No newline at end of file
+            f"comments={self.comments!r}, "
+            f"service_name={self.service_name!r}, "
+            f"service_fee_cents={self.service_fee_cents})"
+        )
+
+
+class ProviderWeeklyRollup(Base):
+    __tablename__ = 'provider_weekly_rollups'
+
+    provider_id = Column(Integer, ForeignKey('providers.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
+    week = Column(String(8), primary_key=True)  # ISO week, e.g. 2024-W07
+    consultation_count = Column(Integer, nullable=False, default=0)
+    fee_total_cents = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Summary and EFT data read one week for every provider
+        Index('ix_provider_weekly_rollups_week', 'week', 'provider_id'),
+    )
+
+    def __init__(self, provider_id, week, consultation_count=0, fee_total_cents=0):
+        """
+        Initializes a ProviderWeeklyRollup instance.
+        :param provider_id: ID of the provider.
+        :param week: ISO week of the services, as YYYY-Www.
+        :param consultation_count: Number of services provided that week.
+        :param fee_total_cents: Total fees of the services provided that week, in cents.
+        """
+        self.provider_id = provider_id
+        self.week = week
+        self.consultation_count = consultation_count
+        self.fee_total_cents = fee_total_cents
+
+    def __repr__(self) -> str:
+        """
+        Provides a string representation of the ProviderWeeklyRollup instance.
+        :return: A string with the provider, week and totals.
+        """
+        return (
+            f"ProviderWeeklyRollup(provider_id={self.provider_id:09}, "
+            f"week={self.week!r}, "
+            f"consultation_count={self.consultation_count}, "
+            f"fee_total_cents={self.fee_total_cents})"
+        )
+
+
+class MemberWeeklyRollup(Base):
+    __tablename__ = 'member_weekly_rollups'
+
+    member_id = Column(Integer, ForeignKey('members.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
+    week = Column(String(8), primary_key=True)  # ISO week, e.g. 2024-W07
+    consultation_count = Column(Integer, nullable=False, default=0)
+    fee_total_cents = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_member_weekly_rollups_week', 'week', 'member_id'),
+    )
+
+    def __init__(self, member_id, week, consultation_count=0, fee_total_cents=0):
+        """
+        Initializes a MemberWeeklyRollup instance.
+        :param member_id: ID of the member.
+        :param week: ISO week of the services, as YYYY-Www.
+        :param consultation_count: Number of services received that week.
+        :param fee_total_cents: Total fees of the services received that week, in cents.
+        """
+        self.member_id = member_id
+        self.week = week
+        self.consultation_count = consultation_count
+        self.fee_total_cents = fee_total_cents
+
+    def __repr__(self) -> str:
+        """
+        Provides a string representation of the MemberWeeklyRollup instance.
+        :return: A string with the member, week and totals.
+        """
+        return (
+            f"MemberWeeklyRollup(member_id={self.member_id:09}, "
+            f"week={self.week!r}, "
+            f"consultation_count={self.consultation_count}, "
+            f"fee_total_cents={self.fee_total_cents})"
+        )
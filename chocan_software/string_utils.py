@@ -1,3 +1,5 @@
+from decimal import Decimal
+from decimal import ROUND_HALF_UP
 from re import match
 
 
@@ -8,3 +10,16 @@ def prompt_until_valid(regex, prompt_message, error_message) -> str:
         if match(regex, value):
             return value
         print(error_message)
+
+
+# Convert a dollar amount (e.g. "12.5" or 12.5) to integer cents
+def parse_cents(amount) -> int:
+    cents = (Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    return int(cents)
+
+
+# Format integer cents as dollars with two decimal places (e.g. 1250 -> "12.50")
+def format_cents(cents) -> str:
+    sign = "-" if cents < 0 else ""
+    dollars, cents = divmod(abs(int(cents)), 100)
+    return f"{sign}{dollars}.{cents:02}"
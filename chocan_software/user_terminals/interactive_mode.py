@@ -3,6 +3,8 @@ from chocan_software.data_managers.database_manager import DatabaseManager
 from chocan_software.data_managers.person_manager import MemberManager
 from chocan_software.data_managers.person_manager import ProviderManager
 from chocan_software.data_managers.service_manager import ServiceManager
+from chocan_software.string_utils import format_cents
+from chocan_software.string_utils import parse_cents
 from chocan_software.string_utils import prompt_until_valid
 from chocan_software.constants import (
     NAME_MIN_LEN,
@@ -17,9 +19,10 @@ from chocan_software.constants import (
     SERVICE_CODE_LEN,
     SERVICE_NAME_MIN_LEN,
     SERVICE_NAME_MAX_LEN,
-    SERVICE_FEE_MAX,
+    SERVICE_FEE_MAX_CENTS,
     MEMBER_STATUS_ACTIVE,
-    MEMBER_STATUS_SUSPENDED
+    MEMBER_STATUS_SUSPENDED,
+    SEARCH_PAGE_SIZE
 )
 
 
@@ -59,6 +62,23 @@ class InteractiveMode:
         )
         return name, street_address, city, state, zip_code
 
+    # Prompt ChocAn manager/operator for how to delete a member or provider.
+    # Returns True to deactivate with a tombstone, False to delete for good
+    # and None to cancel
+    def prompt_delete_mode(self):
+        print("\nSelect how to delete:")
+        print("  1. Deactivate (keep service records)")
+        print("  2. Delete permanently, with all service records")
+        print("  3. Cancel Delete\n")
+        mode_choice = prompt_until_valid(
+            r'^[1-3]$',
+            ">> Enter your choice: ",
+            "Invalid choice. Please try again."
+        )
+        if mode_choice == "3":
+            return None
+        return mode_choice == "1"
+
     # Prompt ChocAn manager/operator for the details of a new service
     def prompt_service_details(self) -> tuple:
         name = prompt_until_valid(
@@ -69,9 +89,9 @@ class InteractiveMode:
         fee = prompt_until_valid(
             r'^\d{1,3}(\.\d{1,2})?$',  # 0-999.99 (2 decimal places)
             ">> Service Fee: ",
-            f"Service Fee cannot exceed ${SERVICE_FEE_MAX})."
+            f"Service Fee cannot exceed ${format_cents(SERVICE_FEE_MAX_CENTS)})."
         )
-        return name, float(fee)
+        return name, parse_cents(fee)
 
     def main_menu(self):
         while True:
@@ -111,10 +131,11 @@ class InteractiveMode:
             print("      2. Update Member")
             print("      3. Delete Member")
             print("      4. View Members")
-            print("      5. Go Back")
-            print("      6. Exit\n")
+            print("      5. Search Members")
+            print("      6. Go Back")
+            print("      7. Exit\n")
             choice = prompt_until_valid(
-                r'^[1-6]$',
+                r'^[1-7]$',
                 ">> Enter a choice: ",
                 "Invalid choice. Please try again."
             )
@@ -208,13 +229,24 @@ class InteractiveMode:
                     ">> Enter member number to delete: ",
                     "Member number must be 9 digits."
                 )
-                self.member_manager.delete_member(member_number)
+                tombstone = self.prompt_delete_mode()
+                if tombstone is None:
+                    continue
+                self.member_manager.delete_member(member_number, tombstone)
             elif choice == "4": # View Members
                 print("\nMembers:")
                 self.member_manager.view_members()
-            elif choice == "5": # Go Back to previous menu
+            elif choice == "5": # Search Members
+                query = input(">> Search name, street address or city: ").strip()
+                page = 1
+                print("\nMatching members:")
+                while len(self.member_manager.view_member_search(query, page)) == SEARCH_PAGE_SIZE:
+                    if input(">> Show more? (y/n): ").strip().lower() != 'y':
+                        break
+                    page += 1
+            elif choice == "6": # Go Back to previous menu
                 return
-            elif choice == "6": # Exit
+            elif choice == "7": # Exit
                 print("\nExiting... Goodbye!")
                 sys.exit(0)
             else: # Catch all
@@ -232,10 +264,11 @@ class InteractiveMode:
             print("      4. Add Provider Service")
             print("      5. View Provider Services")
             print("      6. View Providers")
-            print("      7. Go Back")
-            print("      8. Exit\n")
+            print("      7. Search Providers")
+            print("      8. Go Back")
+            print("      9. Exit\n")
             choice = prompt_until_valid(
-                r'^[1-8]$',
+                r'^[1-9]$',
                 ">> Enter your choice: ",
                 "Invalid choice. Please try again."
             )
@@ -305,7 +338,10 @@ class InteractiveMode:
                     ">> Enter provider number to delete: ",
                     "Provider number must be 9 digits."
                 )
-                self.provider_manager.delete_provider(provider_number)
+                tombstone = self.prompt_delete_mode()
+                if tombstone is None:
+                    continue
+                self.provider_manager.delete_provider(provider_number, tombstone)
             elif choice == "4": # Add provider service
                 provider_number = prompt_until_valid(
                     rf'^\d{{{ACCOUNT_NUM_LEN}}}$',
@@ -327,13 +363,21 @@ class InteractiveMode:
                 services = self.provider_manager.get_provider_services(provider_number)
                 print("\nProvider Services:")
                 for service in services:
-                    print(f"  {service.id:06}  {service.name:<20}  $ {service.fee:>6.2f}")
+                    print(f"  {service.id:06}  {service.name:<20}  $ {format_cents(service.fee_cents):>6}")
             elif choice == "6": # View Providers
                 print("\nProviders:")
                 self.provider_manager.view_providers()
-            elif choice == "7": # Go Back to previous menu
+            elif choice == "7": # Search Providers
+                query = input(">> Search name, street address or city: ").strip()
+                page = 1
+                print("\nMatching providers:")
+                while len(self.provider_manager.view_provider_search(query, page)) == SEARCH_PAGE_SIZE:
+                    if input(">> Show more? (y/n): ").strip().lower() != 'y':
+                        break
+                    page += 1
+            elif choice == "8": # Go Back to previous menu
                 return
-            elif choice == "8": # Exit
+            elif choice == "9": # Exit
                 print("\nExiting... Goodbye!")
                 sys.exit(0)
             else: # Catch all
@@ -385,9 +429,9 @@ class InteractiveMode:
                     new_fee = prompt_until_valid(
                         r'^\d{1,3}(\.\d{1,2})?$'  # 0-999.99 (2 decimal places)
                         ">> New Service Fee: ",
-                        f"Service Fee cannot exceed ${SERVICE_FEE_MAX})."
+                        f"Service Fee cannot exceed ${format_cents(SERVICE_FEE_MAX_CENTS)})."
                     )
-                    kwargs = {"fee": new_fee}
+                    kwargs = {"fee_cents": parse_cents(new_fee)}
                 elif field_choice == "3": # Cancel Update
                     continue
                 self.service_manager.update_service(service_code)
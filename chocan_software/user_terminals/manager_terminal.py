@@ -1,6 +1,8 @@
 import sys
+from functools import cached_property
 from chocan_software.data_managers.database_manager import DatabaseManager
 from chocan_software.data_managers.report_manager import ReportManager
+from chocan_software.data_managers.rollup_manager import RollupManager
 from chocan_software.user_terminals.interactive_mode import InteractiveMode
 from chocan_software.string_utils import prompt_until_valid
 from chocan_software.constants import (
@@ -13,8 +15,19 @@ class ManagerTerminal:
     def __init__(self, db_url=None):
         
         self.db_manager = DatabaseManager(db_url if db_url is not None else DATABASE_URL)
-        self.report_manager = ReportManager(self.db_manager)
-        self.interactive_mode = InteractiveMode(self.db_manager)
+
+    # The managers are built the first time a menu option needs them
+    @cached_property
+    def report_manager(self):
+        return ReportManager(self.db_manager)
+
+    @cached_property
+    def rollup_manager(self):
+        return RollupManager(self.db_manager)
+
+    @cached_property
+    def interactive_mode(self):
+        return InteractiveMode(self.db_manager)
 
     def main_menu(self):
         while True:
@@ -48,10 +61,11 @@ class ManagerTerminal:
             print("    3. Generate Member Report")
             print("    4. Generate Provider Report")
             print("    5. Generate EFT Data")
-            print("    6. Go Back")
-            print("    7. Exit\n")
+            print("    6. Rebuild Weekly Rollups")
+            print("    7. Go Back")
+            print("    8. Exit\n")
             choice = prompt_until_valid(
-                r'^[1-7]$',
+                r'^[1-8]$',
                 ">> Enter your choice: ",
                 "Invalid choice. Please try again."
             )
@@ -79,9 +93,12 @@ class ManagerTerminal:
                 self.report_manager.generate_provider_report(provider_number)
             elif choice == "5":  # Generate EFT Data
                 self.report_manager.generate_eft_data()
-            elif choice == "6": # Go Back
+            elif choice == "6":  # Rebuild Weekly Rollups
+                print("\nRebuilding weekly rollups...")
+                self.rollup_manager.rebuild_and_report()
+            elif choice == "7": # Go Back
                 return
-            elif choice == "7": # Exit
+            elif choice == "8": # Exit
                 print("Exiting... Goodbye!")
                 sys.exit(0)
             else:
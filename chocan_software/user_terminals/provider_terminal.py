@@ -1,18 +1,45 @@
+import os
 from datetime import datetime
+from functools import cached_property
 from chocan_software.data_managers.database_manager import DatabaseManager
 from chocan_software.data_managers.person_manager import MemberManager
 from chocan_software.data_managers.person_manager import ProviderManager
 from chocan_software.data_managers.service_manager import ServiceManager
+from chocan_software.data_managers.service_record_journal import ServiceRecordJournal
 from chocan_software.data_managers.service_record_manager import ServiceRecordManager
+from chocan_software.string_utils import format_cents
+from chocan_software.constants import SERVICE_RECORD_JOURNAL_PATH
 
 
 class ProviderTerminal:
-    def __init__(self, db_url=None):
+    def __init__(self, db_url=None, journal_path=None):
         self.db_manager = DatabaseManager(db_url)
-        self.provider_manager = ProviderManager(self.db_manager)
-        self.member_manager = MemberManager(self.db_manager)
-        self.service_manager = ServiceManager(self.db_manager)
-        self.service_record_manager = ServiceRecordManager(self.db_manager)
+        self.journal_path = (
+            journal_path if journal_path is not None else SERVICE_RECORD_JOURNAL_PATH
+        )
+
+    # The managers are built the first time the terminal needs them
+    @cached_property
+    def provider_manager(self):
+        return ProviderManager(self.db_manager)
+
+    @cached_property
+    def member_manager(self):
+        return MemberManager(self.db_manager)
+
+    @cached_property
+    def service_manager(self):
+        return ServiceManager(self.db_manager)
+
+    @cached_property
+    def service_record_manager(self):
+        return ServiceRecordManager(self.db_manager)
+
+    # Confirmed entries are journaled locally and synced in the background,
+    # so they are kept even while the database is locked or unavailable
+    @cached_property
+    def journal(self):
+        return ServiceRecordJournal(self.service_record_manager, self.journal_path)
     
     @staticmethod
     def is_valid_date(date_string):
@@ -26,13 +53,20 @@ class ProviderTerminal:
     def start(self):
         """Start the provider terminal."""
         print("")
-        while True:
-            provider_number = input("").strip()
-            if not self.provider_manager.is_valid_provider(provider_number):
-                print("Invalid Provider #")
-                continue
+        # Entries left unsynced by an earlier run are synced straight away
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path):
+            self.journal
+        try:
+            while True:
+                provider_number = input("").strip()
+                if not self.provider_manager.is_valid_provider(provider_number):
+                    print("Invalid Provider #")
+                    continue
 
-            self.handle_member_interaction(provider_number)
+                self.handle_member_interaction(provider_number)
+        finally:
+            if 'journal' in self.__dict__:
+                self.journal.close()
 
     def handle_member_interaction(self, provider_number):
         """Handle member-related operations."""
@@ -66,6 +100,9 @@ class ProviderTerminal:
             if not service:
                 print("Invalid Code")
                 continue
+            if not self.provider_manager.is_authorized_service(provider_number, service.id):
+                print("Not Authorized")
+                continue
             
             print(f"{service.name}")
             confirmation = input("Continue? (y/n): ").strip().lower()
@@ -76,12 +113,12 @@ class ProviderTerminal:
                 continue
 
             comments = input("").strip()
-            self.service_record_manager.add_service_record(
+            self.journal.append(
                 provider_number=provider_number,
                 member_number=member_number,
                 service_code=service_code,
                 date_of_service=date_of_service,
                 comments=comments
             )
-            print(f"{service.fee}")
+            print(format_cents(service.fee_cents))
             break
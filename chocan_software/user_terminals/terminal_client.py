@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import sys
+from chocan_software.constants import (
+    TERMINAL_SERVER_HOST,
+    TERMINAL_SERVER_PORT
+)
+
+
+class TerminalClient:
+    """
+    Client for ProviderTerminalServer. It can be used interactively, relaying
+    stdin to the server and printing its responses, or driven from code with
+    send() and receive() to exercise the server locally.
+    """
+    def __init__(self, host=None, port=None):
+        self.host = host if host is not None else TERMINAL_SERVER_HOST
+        self.port = port if port is not None else TERMINAL_SERVER_PORT
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def send(self, line):
+        self.writer.write(f"{line}\n".encode())
+        await self.writer.drain()
+
+    async def receive(self):
+        """
+        Returns the next line sent by the server, or None once it disconnects.
+        """
+        line = await self.reader.readline()
+        if not line:
+            return None
+        return line.decode().rstrip("\n")
+
+    async def exchange(self, line, responses=1):
+        """
+        Sends one line and returns the next `responses` lines from the server.
+        """
+        await self.send(line)
+        return [await self.receive() for _ in range(responses)]
+
+    async def interactive(self):
+        loop = asyncio.get_running_loop()
+
+        async def print_responses():
+            while (line := await self.receive()) is not None:
+                print(line)
+
+        printer = asyncio.create_task(print_responses())
+        try:
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line or printer.done():
+                    break
+                await self.send(line.rstrip("\n"))
+        finally:
+            printer.cancel()
+            await self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChocAn provider terminal client")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    async def run():
+        client = await TerminalClient(args.host, args.port).connect()
+        await client.interactive()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
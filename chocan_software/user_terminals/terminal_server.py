@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from sqlalchemy.exc import SQLAlchemyError
+from chocan_software.data_managers.database_manager import DatabaseManager
+from chocan_software.data_managers.person_manager import MemberManager
+from chocan_software.data_managers.person_manager import ProviderManager
+from chocan_software.data_managers.service_manager import ServiceManager
+from chocan_software.data_managers.service_record_manager import ServiceRecordManager
+from chocan_software.data_managers.service_record_queue import ServiceRecordRejected
+from chocan_software.data_managers.service_record_queue import ServiceRecordWriteQueue
+from chocan_software.user_terminals.provider_terminal import ProviderTerminal
+from chocan_software.string_utils import format_cents
+from chocan_software.constants import (
+    TERMINAL_SERVER_HOST,
+    TERMINAL_SERVER_PORT,
+    TERMINAL_SERVER_DB_WORKERS,
+    TERMINAL_SERVER_BACKLOG
+)
+
+
+class TerminalDisconnected(Exception):
+    pass
+
+
+class ProviderTerminalServer:
+    """
+    Serves many provider terminals from one process over TCP. Each connection
+    speaks the same line protocol as ProviderTerminal: provider number, member
+    number, date of service, service code, confirmation and comments, one per
+    line, with the same responses.
+
+    Sessions are asyncio tasks, so idle terminals cost no threads. Database
+    work runs on a thread pool of `db_workers` threads, which bounds the
+    number of SQLite connections in use no matter how many terminals are
+    connected. With group_commit, service records are submitted to a
+    ServiceRecordWriteQueue, so records entered at the same moment on many
+    terminals are committed together.
+    """
+    def __init__(self, db_url=None, host=None, port=None, db_workers=None, group_commit=False):
+        self.db_manager = DatabaseManager(db_url)
+        self.provider_manager = ProviderManager(self.db_manager)
+        self.member_manager = MemberManager(self.db_manager)
+        self.service_manager = ServiceManager(self.db_manager)
+        self.service_record_manager = ServiceRecordManager(self.db_manager)
+        self.host = host if host is not None else TERMINAL_SERVER_HOST
+        self.port = port if port is not None else TERMINAL_SERVER_PORT
+        self.db_workers = db_workers if db_workers is not None else TERMINAL_SERVER_DB_WORKERS
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.db_workers, thread_name_prefix="terminal-db"
+        )
+        self.write_queue = (
+            ServiceRecordWriteQueue(self.service_record_manager) if group_commit else None
+        )
+        self.server = None
+
+    async def run_db(self, func, *args, **kwargs):
+        """
+        Runs a blocking database call on the bounded executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle_terminal, self.host, self.port, backlog=TERMINAL_SERVER_BACKLOG
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        print(f"Provider terminal server listening on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self.executor.shutdown(wait=True)
+
+    async def handle_terminal(self, reader, writer):
+        try:
+            await self.send(writer, "")
+            await self.provider_login(reader, writer)
+        except (TerminalDisconnected, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def receive(reader):
+        line = await reader.readline()
+        if not line:
+            raise TerminalDisconnected()
+        return line.decode().strip()
+
+    @staticmethod
+    async def send(writer, message):
+        writer.write(f"{message}\n".encode())
+        await writer.drain()
+
+    async def is_valid(self, validate, number):
+        """
+        Account validation that treats non-numeric input as invalid instead
+        of failing the session.
+        """
+        if not number.isdigit():
+            return False
+        return await self.run_db(validate, number)
+
+    async def provider_login(self, reader, writer):
+        while True:
+            provider_number = await self.receive(reader)
+            if not await self.is_valid(self.provider_manager.is_valid_provider, provider_number):
+                await self.send(writer, "Invalid Provider #")
+                continue
+
+            await self.handle_member_interaction(reader, writer, provider_number)
+
+    async def handle_member_interaction(self, reader, writer, provider_number):
+        while True:
+            member_number = await self.receive(reader)
+            if not await self.is_valid(self.member_manager.is_valid_member, member_number):
+                await self.send(writer, "Invalid Number")
+                continue
+
+            member = await self.run_db(self.member_manager.get_member, member_number)
+            if not member.status:
+                await self.send(writer, "Member Suspended")
+                continue
+
+            await self.send(writer, "Validated")
+            await self.handle_service_date(reader, writer, provider_number, member_number)
+
+    async def handle_service_date(self, reader, writer, provider_number, member_number):
+        while True:
+            date_of_service = await self.receive(reader)
+            if not ProviderTerminal.is_valid_date(date_of_service):
+                await self.send(writer, "Invalid Date")
+                continue
+            await self.handle_service_code(
+                reader, writer, provider_number, member_number, date_of_service
+            )
+
+    async def handle_service_code(self, reader, writer, provider_number, member_number, date_of_service):
+        while True:
+            service_code = await self.receive(reader)
+            service = None
+            if service_code.isdigit():
+                service = await self.run_db(self.service_manager.get_service, service_code)
+            if not service:
+                await self.send(writer, "Invalid Code")
+                continue
+            if not await self.run_db(
+                self.provider_manager.is_authorized_service, provider_number, service.id
+            ):
+                await self.send(writer, "Not Authorized")
+                continue
+
+            await self.send(writer, f"{service.name}")
+            await self.send(writer, "Continue? (y/n): ")
+            confirmation = (await self.receive(reader)).lower()
+            if confirmation not in ['y', 'n']:
+                await self.send(writer, "Invalid Input")
+                continue
+            elif confirmation == 'n':
+                continue
+
+            comments = await self.receive(reader)
+            try:
+                if self.write_queue is not None:
+                    await asyncio.wrap_future(self.write_queue.submit(
+                        provider_number, member_number, service_code,
+                        date_of_service, comments
+                    ))
+                else:
+                    await self.run_db(
+                        self.service_record_manager.add_service_record,
+                        provider_number=provider_number,
+                        member_number=member_number,
+                        service_code=service_code,
+                        date_of_service=date_of_service,
+                        comments=comments
+                    )
+            except (SQLAlchemyError, ServiceRecordRejected):
+                # One failed entry (e.g. a duplicate record) must not end the session
+                await self.send(writer, "Unable to Record Service")
+                continue
+            await self.send(writer, format_cents(service.fee_cents))
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChocAn provider terminal server")
+    parser.add_argument("--db-url", default=None)
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--db-workers", type=int, default=None)
+    parser.add_argument("--group-commit", action="store_true",
+                        help="commit service records entered at the same time together")
+    args = parser.parse_args()
+    server = ProviderTerminalServer(
+        args.db_url, args.host, args.port, args.db_workers, args.group_commit
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nExiting... Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
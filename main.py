@@ -1,11 +1,11 @@
 import sys
-from chocan_software.user_terminals.manager_terminal import ManagerTerminal
-from chocan_software.user_terminals.provider_terminal import ProviderTerminal
 from chocan_software.string_utils import prompt_until_valid
 from chocan_software.constants import DATABASE_URL
 
 
-def acceptance_test_menu(provider_terminal: ProviderTerminal, manager_terminal: ManagerTerminal):
+# The terminals (and SQLAlchemy with them) are only imported and built once
+# one is chosen, so the menu draws without waiting on either of them.
+def acceptance_test_menu(db_url=DATABASE_URL):
     print("╔═══════════════════════════╗")
     print("║  Acceptance Testing Menu  ║")
     print("╚═══════════════════════════╝")
@@ -18,9 +18,11 @@ def acceptance_test_menu(provider_terminal: ProviderTerminal, manager_terminal:
         "Invalid choice. Please try again."
     )
     if choice == "1": # Provider Terminal
-        provider_terminal.start()
+        from chocan_software.user_terminals.provider_terminal import ProviderTerminal
+        ProviderTerminal(db_url).start()
     elif choice == "2": # Manager Terminal
-        manager_terminal.start()
+        from chocan_software.user_terminals.manager_terminal import ManagerTerminal
+        ManagerTerminal(db_url).start()
     elif choice == "3": # Exit
         print("\nExiting... Goodbye!")
         sys.exit(0)
@@ -29,6 +31,4 @@ def acceptance_test_menu(provider_terminal: ProviderTerminal, manager_terminal:
         sys.exit(1)
 
 if __name__ == "__main__":
-    provider_terminal = ProviderTerminal(DATABASE_URL)
-    manager_terminal = ManagerTerminal(DATABASE_URL)
-    acceptance_test_menu(provider_terminal, manager_terminal)
+    acceptance_test_menu(DATABASE_URL)